@@ -0,0 +1,234 @@
+import sys
+import sqlite3
+import logging
+import argparse
+from db_handler import DB_PATH, add_column_if_missing, create_queue_indexes
+
+RULE_ACTIONS = ("queue", "priority", "skip")
+
+# Height in pixels from a resolution such as "1920x1080" or "1080p"
+HEIGHT_SQL = """(CASE WHEN instr({res}, 'x') > 0
+    THEN CAST(substr({res}, instr({res}, 'x') + 1) AS INTEGER)
+    ELSE CAST({res} AS INTEGER) END)"""
+
+# Age in days from last_modified, stored either as a timestamp string or as epoch seconds
+AGE_DAYS_SQL = """(julianday('now') - CASE WHEN typeof({modified}) IN ('integer', 'real')
+    THEN julianday({modified}, 'unixepoch')
+    ELSE julianday({modified}) END)"""
+
+# Condition matching rule r against the ConversionQueue row NEW
+RULE_MATCH_SQL = f"""
+    r.enabled = 1
+    AND (r.video_codec IS NULL OR r.video_codec = NEW.video_codec)
+    AND (r.min_size IS NULL OR NEW.file_size >= r.min_size)
+    AND (r.max_size IS NULL OR NEW.file_size <= r.max_size)
+    AND (r.min_height IS NULL OR {HEIGHT_SQL.format(res='NEW.resolution')} >= r.min_height)
+    AND (r.max_height IS NULL OR {HEIGHT_SQL.format(res='NEW.resolution')} <= r.max_height)
+    AND (r.storage_location IS NULL OR r.storage_location = NEW.storage_location)
+    AND (r.min_age_days IS NULL OR {AGE_DAYS_SQL.format(modified='NEW.last_modified')} >= r.min_age_days)
+    AND (r.max_age_days IS NULL OR {AGE_DAYS_SQL.format(modified='NEW.last_modified')} <= r.max_age_days)
+"""
+
+# Trigger body applying the first matching rule (lowest rule_order) to the row NEW.
+# 'priority' places the job ahead of the current front of the queue without shifting
+# every queued row, so positions may drop to 0 or below until the queue is renumbered.
+RULE_TRIGGER_BODY = f"""
+BEGIN
+    UPDATE ConversionQueue
+    SET auto_rule_id = (
+        SELECT r.id FROM AutoQueueRules AS r
+        WHERE {RULE_MATCH_SQL}
+        ORDER BY r.rule_order, r.id
+        LIMIT 1
+    )
+    WHERE id = NEW.id;
+
+    UPDATE ConversionQueue
+    SET job_status = 'skipped'
+    WHERE id = NEW.id
+      AND (SELECT action FROM AutoQueueRules WHERE id = ConversionQueue.auto_rule_id) = 'skip';
+
+    UPDATE ConversionQueue
+    SET job_status = 'queued',
+        queue_position = (SELECT COALESCE(MAX(queue_position), 0) + 1 FROM ConversionQueue)
+    WHERE id = NEW.id
+      AND (SELECT action FROM AutoQueueRules WHERE id = ConversionQueue.auto_rule_id) = 'queue';
+
+    UPDATE ConversionQueue
+    SET job_status = 'queued',
+        queue_position = (SELECT COALESCE(MIN(queue_position), 1) - 1 FROM ConversionQueue)
+    WHERE id = NEW.id
+      AND (SELECT action FROM AutoQueueRules WHERE id = ConversionQueue.auto_rule_id) = 'priority';
+END
+"""
+
+
+def create_rules_table(cursor):
+    """Creates the AutoQueueRules table and the ConversionQueue triggers that evaluate it.
+
+    The triggers fire for each inserted row and for rows whose codec, size, resolution,
+    storage_location or last_modified change, so only new or changed records are checked.
+    Rows that are already queued, processing or finished are never touched.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS AutoQueueRules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            rule_order INTEGER NOT NULL DEFAULT 0,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            video_codec TEXT,
+            min_size INTEGER,
+            max_size INTEGER,
+            min_height INTEGER,
+            max_height INTEGER,
+            storage_location TEXT,
+            min_age_days REAL,
+            max_age_days REAL,
+            action TEXT NOT NULL CHECK (action IN ('queue', 'priority', 'skip')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    add_column_if_missing(cursor, "ConversionQueue", "auto_rule_id", "INTEGER")
+    create_queue_indexes(cursor)
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_auto_queue_insert
+        AFTER INSERT ON ConversionQueue
+        WHEN COALESCE(NEW.job_status, 'pending') = 'pending' AND NEW.queue_position IS NULL
+        {RULE_TRIGGER_BODY}
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_auto_queue_update
+        AFTER UPDATE OF video_codec, file_size, resolution, storage_location, last_modified ON ConversionQueue
+        WHEN COALESCE(NEW.job_status, 'pending') = 'pending' AND NEW.queue_position IS NULL
+        {RULE_TRIGGER_BODY}
+    """)
+
+
+def add_rule(action, name=None, rule_order=0, video_codec=None, min_size=None, max_size=None,
+             min_height=None, max_height=None, storage_location=None, min_age_days=None, max_age_days=None):
+    """Adds an auto-queue rule and returns its id. Conditions left as None match anything."""
+    if action not in RULE_ACTIONS:
+        raise ValueError(f"Unknown rule action '{action}'. Expected one of {RULE_ACTIONS}.")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_rules_table(cursor)
+    cursor.execute("""
+        INSERT INTO AutoQueueRules (
+            name, rule_order, video_codec, min_size, max_size, min_height, max_height,
+            storage_location, min_age_days, max_age_days, action
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (name, rule_order, video_codec, min_size, max_size, min_height, max_height,
+          storage_location, min_age_days, max_age_days, action))
+    rule_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    logging.info(f"Added auto-queue rule {rule_id} ({action}).")
+    return rule_id
+
+
+def set_rule_enabled(rule_id, enabled):
+    """Enables or disables a rule."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_rules_table(cursor)
+    cursor.execute("UPDATE AutoQueueRules SET enabled = ? WHERE id = ?", (int(bool(enabled)), rule_id))
+    conn.commit()
+    conn.close()
+
+
+def delete_rule(rule_id):
+    """Deletes a rule."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_rules_table(cursor)
+    cursor.execute("DELETE FROM AutoQueueRules WHERE id = ?", (rule_id,))
+    conn.commit()
+    conn.close()
+
+
+def get_rules():
+    """Returns all rules ordered by evaluation order."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_rules_table(cursor)
+    conn.commit()
+    cursor.execute("""
+        SELECT id, name, rule_order, enabled, video_codec, min_size, max_size, min_height, max_height,
+               storage_location, min_age_days, max_age_days, action
+        FROM AutoQueueRules
+        ORDER BY rule_order, id
+    """)
+    rules = cursor.fetchall()
+    conn.close()
+    return rules
+
+
+def apply_rules_to_pending():
+    """Evaluates the rules once against every pending, unqueued row.
+
+    New and changed rows are handled by the triggers; this is only needed to apply a newly
+    added rule to the existing backlog. Re-setting storage_location to itself fires the
+    update trigger for each pending row. Returns the number of rows checked.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_rules_table(cursor)
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET storage_location = storage_location
+        WHERE COALESCE(job_status, 'pending') = 'pending'
+          AND queue_position IS NULL
+    """)
+    checked = cursor.rowcount
+    conn.commit()
+    conn.close()
+    logging.info(f"Applied auto-queue rules to {checked} pending jobs.")
+    return checked
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage auto-queue rules for ConversionQueue.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="Add a rule")
+    add_parser.add_argument("action", choices=RULE_ACTIONS)
+    add_parser.add_argument("--name")
+    add_parser.add_argument("--order", type=int, default=0)
+    add_parser.add_argument("--codec")
+    add_parser.add_argument("--min-size-gb", type=float)
+    add_parser.add_argument("--max-size-gb", type=float)
+    add_parser.add_argument("--min-height", type=int)
+    add_parser.add_argument("--max-height", type=int)
+    add_parser.add_argument("--location")
+    add_parser.add_argument("--min-age-days", type=float)
+    add_parser.add_argument("--max-age-days", type=float)
+
+    subparsers.add_parser("list", help="List rules")
+    delete_parser = subparsers.add_parser("delete", help="Delete a rule")
+    delete_parser.add_argument("rule_id", type=int)
+    subparsers.add_parser("apply", help="Apply the rules to the existing pending backlog")
+
+    args = parser.parse_args(argv)
+    if args.command == "add":
+        to_bytes = lambda gb: int(gb * 1024**3) if gb is not None else None
+        rule_id = add_rule(
+            args.action, name=args.name, rule_order=args.order, video_codec=args.codec,
+            min_size=to_bytes(args.min_size_gb), max_size=to_bytes(args.max_size_gb),
+            min_height=args.min_height, max_height=args.max_height, storage_location=args.location,
+            min_age_days=args.min_age_days, max_age_days=args.max_age_days
+        )
+        print(f"Added rule {rule_id}.")
+    elif args.command == "list":
+        for rule in get_rules():
+            print(rule)
+    elif args.command == "delete":
+        delete_rule(args.rule_id)
+        print(f"Deleted rule {args.rule_id}.")
+    elif args.command == "apply":
+        print(f"Checked {apply_rules_to_pending()} pending jobs.")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
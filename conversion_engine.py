@@ -0,0 +1,351 @@
+import os
+import shutil
+import sqlite3
+import datetime
+import logging
+import subprocess
+import time
+from db_handler import DB_PATH, add_column_if_missing
+from output_verification import probe_media
+
+# Scratch storage for segment checkpoints and finished outputs. Point this at shared
+# storage so a different worker can resume a job another worker started.
+SCRATCH_DIR = os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "scratch")
+
+SEGMENT_SECONDS = 300  # Length of each checkpointed segment (seconds)
+
+# Default encoder settings for the video stream
+ENCODER_SETTINGS = {
+    "video_codec": "libx265",
+    "crf": 24,
+    "preset": "medium",
+}
+
+AUDIO_CODEC = "aac"
+AUDIO_BITRATE = "192k"
+
+# Early abort: once MIN_PROJECTION_SECONDS of video are encoded, the final size is projected
+# from the output bitrate so far; encodes projected to save less than MIN_SAVINGS_FRACTION stop.
+MIN_SAVINGS_FRACTION = 0.15
+MIN_PROJECTION_SECONDS = 120
+
+
+class EncodeStopped(Exception):
+    """Raised when an encode is interrupted by a stop request. Finished segments are kept."""
+
+
+class NotWorthwhile(Exception):
+    """Raised when the projected output would save less than the minimum fraction of the source."""
+
+    def __init__(self, source_size, projected_size, encoded_seconds, encoded_bytes):
+        self.source_size = source_size
+        self.projected_size = projected_size
+        self.encoded_seconds = encoded_seconds
+        self.encoded_bytes = encoded_bytes
+        savings = 1 - projected_size / source_size if source_size else 0
+        super().__init__(f"Projected output {projected_size / 1024 ** 2:.0f} MB saves {savings:.1%} of "
+                         f"{source_size / 1024 ** 2:.0f} MB after {encoded_seconds:.0f}s encoded")
+
+
+def create_checkpoint_table(cursor):
+    """Creates the JobCheckpoints table and the progress column on ConversionQueue if missing."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS JobCheckpoints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            segment_index INTEGER NOT NULL,
+            start_time REAL,
+            segment_length REAL,
+            segment_path TEXT,
+            segment_size INTEGER,
+            worker_id TEXT,
+            completed_at TIMESTAMP,
+            UNIQUE(job_id, segment_index)
+        )
+    """)
+    add_column_if_missing(cursor, "ConversionQueue", "progress", "REAL")
+
+
+def get_job_scratch_dir(job_id, scratch_dir=SCRATCH_DIR):
+    """Returns the scratch directory used for a job's segments and output."""
+    return os.path.join(scratch_dir, f"job_{job_id}")
+
+
+def plan_segments(duration, segment_seconds=SEGMENT_SECONDS):
+    """Splits a duration into (segment_index, start_time, segment_length) tuples."""
+    segments = []
+    start = 0.0
+    index = 0
+    while start < duration:
+        length = min(segment_seconds, duration - start)
+        segments.append((index, start, length))
+        start += segment_seconds
+        index += 1
+    return segments
+
+
+def get_completed_segments(job_id):
+    """Returns {segment_index: segment_path} for the checkpoints recorded for a job."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_checkpoint_table(cursor)
+    cursor.execute("""
+        SELECT segment_index, segment_path, segment_size
+        FROM JobCheckpoints
+        WHERE job_id = ?
+    """, (job_id,))
+    rows = cursor.fetchall()
+    conn.commit()
+    conn.close()
+
+    # Only trust checkpoints whose file is still present with the recorded size
+    completed = {}
+    for segment_index, segment_path, segment_size in rows:
+        if segment_path and os.path.exists(segment_path) and os.path.getsize(segment_path) == segment_size:
+            completed[segment_index] = segment_path
+    return completed
+
+
+def record_checkpoint(job_id, segment_index, start_time, segment_length, segment_path, worker_id, progress):
+    """Records a finished segment for a job and updates the job's progress."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_checkpoint_table(cursor)
+    current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        INSERT OR REPLACE INTO JobCheckpoints (
+            job_id, segment_index, start_time, segment_length, segment_path, segment_size, worker_id, completed_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (job_id, segment_index, start_time, segment_length, segment_path,
+          os.path.getsize(segment_path), worker_id, current_timestamp))
+    cursor.execute("UPDATE ConversionQueue SET progress = ? WHERE id = ?", (progress, job_id))
+    conn.commit()
+    conn.close()
+
+
+def clear_checkpoints(job_id, scratch_dir=SCRATCH_DIR):
+    """Deletes a job's checkpoint rows and its scratch directory once the job is finished."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_checkpoint_table(cursor)
+    cursor.execute("DELETE FROM JobCheckpoints WHERE job_id = ?", (job_id,))
+    conn.commit()
+    conn.close()
+    shutil.rmtree(get_job_scratch_dir(job_id, scratch_dir), ignore_errors=True)
+
+
+def run_ffmpeg(args, log_path, stop_event=None, progress_callback=None):
+    """Runs ffmpeg with machine-readable progress on stdout.
+
+    progress_callback(out_seconds, out_bytes) is called for every progress block. If
+    stop_event is set the process is terminated and EncodeStopped is raised; an exception
+    raised by progress_callback also terminates the process. ffmpeg's own log goes to log_path.
+    Returns the final progress values: {"frames", "out_seconds", "out_bytes"}.
+    """
+    command = ["ffmpeg", "-hide_banner", "-nostats", "-y", "-progress", "pipe:1"] + args
+    with open(log_path, "w") as log_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log_file, text=True)
+        out_seconds = 0.0
+        out_bytes = 0
+        frames = 0
+        try:
+            for line in process.stdout:
+                if stop_event is not None and stop_event.is_set():
+                    raise EncodeStopped()
+                key, _, value = line.strip().partition("=")
+                if key == "out_time_us" and value.isdigit():
+                    out_seconds = int(value) / 1_000_000
+                elif key == "total_size" and value.isdigit():
+                    out_bytes = int(value)
+                elif key == "frame" and value.isdigit():
+                    frames = int(value)
+                elif key == "progress" and progress_callback is not None:
+                    progress_callback(out_seconds, out_bytes)
+        except BaseException:
+            # Stop request or an exception from the progress callback (e.g. NotWorthwhile)
+            process.terminate()
+            process.wait()
+            raise
+        returncode = process.wait()
+
+    if returncode != 0:
+        with open(log_path) as log_file:
+            tail = log_file.read()[-2000:]
+        raise RuntimeError(f"ffmpeg exited with code {returncode}: {tail}")
+    return {"frames": frames, "out_seconds": out_seconds, "out_bytes": out_bytes}
+
+
+def get_video_args(settings):
+    """Returns the ffmpeg video encoder arguments for encoder settings.
+
+    An optional settings["threads"] limits x265's thread pool (and ffmpeg's encoder threads)
+    to that many threads; without it x265 uses every core.
+    """
+    x265_params = "log-level=error"
+    args = ["-c:v", settings["video_codec"], "-crf", str(settings["crf"]), "-preset", settings["preset"]]
+    if settings.get("threads"):
+        x265_params += f":pools={settings['threads']}"
+        args += ["-threads", str(settings["threads"])]
+    return args + ["-x265-params", x265_params]
+
+
+def encode_segment(source_path, segment_path, start_time, segment_length, settings, stop_event=None, progress_callback=None):
+    """Encodes one video-only segment of the source and returns the number of frames encoded.
+
+    The segment is written to a temporary file, flushed to disk and then renamed, so a
+    checkpoint only ever points at a complete segment.
+    """
+    temp_path = segment_path + ".partial"
+    args = [
+        "-ss", str(start_time), "-i", source_path, "-t", str(segment_length),
+        "-map", "0:v:0", "-an", "-sn",
+    ] + get_video_args(settings) + [
+        "-f", "matroska", temp_path,
+    ]
+    result = run_ffmpeg(args, segment_path + ".log", stop_event, progress_callback)
+
+    with open(temp_path, "rb") as segment_file:
+        os.fsync(segment_file.fileno())
+    os.replace(temp_path, segment_path)
+    return result["frames"]
+
+
+def get_stream_args(plan):
+    """Returns the ffmpeg codec arguments for the audio and subtitle streams of a job plan."""
+    plan = plan or {}
+    if plan.get("audio_action") == "copy":
+        audio_args = ["-c:a", "copy"]
+    else:
+        audio_args = ["-c:a", AUDIO_CODEC, "-b:a", AUDIO_BITRATE]
+    subtitle_args = ["-c:s", "srt" if plan.get("subtitle_action") == "convert" else "copy"]
+    return audio_args + subtitle_args
+
+
+def mux_output(source_path, segment_paths, output_path, stop_event=None, plan=None):
+    """Joins the encoded video segments and muxes them with the source's audio and subtitles."""
+    list_path = output_path + ".segments.txt"
+    with open(list_path, "w") as list_file:
+        for segment_path in segment_paths:
+            escaped = segment_path.replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+
+    temp_path = output_path + ".partial"
+    args = [
+        "-f", "concat", "-safe", "0", "-i", list_path, "-i", source_path,
+        "-map", "0:v", "-map", "1:a?", "-map", "1:s?",
+        "-c:v", "copy",
+    ] + get_stream_args(plan) + [
+        "-f", "matroska", temp_path,
+    ]
+    run_ffmpeg(args, output_path + ".log", stop_event)
+    os.replace(temp_path, output_path)
+
+
+def remux_output(source_path, output_path, stop_event=None, plan=None):
+    """Copies the video stream into Matroska without re-encoding (remux-only jobs)."""
+    temp_path = output_path + ".partial"
+    args = [
+        "-i", source_path,
+        "-map", "0:v", "-map", "0:a?", "-map", "0:s?",
+        "-c:v", "copy",
+    ] + get_stream_args(plan) + [
+        "-f", "matroska", temp_path,
+    ]
+    run_ffmpeg(args, output_path + ".log", stop_event)
+    os.replace(temp_path, output_path)
+
+
+def project_output_size(job, duration, encoded_seconds, encoded_bytes):
+    """Projects the final output size from the video bytes written for the encoded seconds so far.
+
+    Non-video streams are assumed to keep their size: the source's size minus its video
+    bitrate times duration (0 when the video bitrate is unknown).
+    """
+    source_size = job.get("file_size") or 0
+    try:
+        source_video_bytes = float(job.get("bit_rate") or 0) * duration / 8
+    except (TypeError, ValueError):
+        source_video_bytes = 0
+    other_bytes = max(0.0, source_size - source_video_bytes) if source_video_bytes else 0.0
+    return int(encoded_bytes / encoded_seconds * duration + other_bytes)
+
+
+def encode_job(job, worker_id, scratch_dir=SCRATCH_DIR, settings=None, stop_event=None, progress_callback=None, stats=None,
+               min_savings=MIN_SAVINGS_FRACTION):
+    """Encodes a job to HEVC in checkpointed segments and returns the output path.
+
+    Segments already recorded in JobCheckpoints (by this or any other worker) are reused,
+    so an encode interrupted by a stop, crash or reboot resumes from the last finished
+    segment. job must contain id, file_path and duration. If a stats dictionary is passed,
+    it receives the media_seconds and frames encoded by this call and the wall_seconds it took.
+
+    The job's plan (job_type, audio_action, subtitle_action from job_planner) decides per
+    stream what is done: remux-only jobs skip encoding entirely, efficient audio is copied.
+
+    With min_savings set (and job["file_size"] known), the output size is projected during
+    the encode once MIN_PROJECTION_SECONDS are encoded, and NotWorthwhile is raised as soon
+    as the projected savings fall below min_savings of the source size.
+    """
+    started = time.monotonic()
+    settings = settings or ENCODER_SETTINGS
+    job_dir = get_job_scratch_dir(job["id"], scratch_dir)
+    os.makedirs(job_dir, exist_ok=True)
+    base_name = os.path.splitext(os.path.basename(job["file_path"]))[0]
+    output_path = os.path.join(job_dir, f"{base_name}.mkv")
+
+    if job.get("job_type") == "remux":
+        remux_output(job["file_path"], output_path, stop_event, job)
+        if stats is not None:
+            # Remuxes run at disk speed and are kept out of the encode speed history
+            stats["media_seconds"] = 0.0
+            stats["frames"] = 0
+            stats["wall_seconds"] = 0.0
+        logging.info(f"Remuxed job {job['id']} to {output_path}", extra={"job_id": job["id"]})
+        return output_path
+
+    try:
+        duration = float(job.get("duration") or 0)
+    except (TypeError, ValueError):
+        duration = 0
+    if duration <= 0:
+        duration = probe_media(job["file_path"])["duration"]
+
+    segments = plan_segments(duration)
+    completed = get_completed_segments(job["id"])
+    if completed:
+        logging.info(f"Resuming job {job['id']} with {len(completed)}/{len(segments)} segments already encoded.",
+                     extra={"job_id": job["id"]})
+
+    done_seconds = sum(length for index, _, length in segments if index in completed)
+    done_bytes = sum(os.path.getsize(path) for path in completed.values())
+    resumed_seconds = done_seconds
+    frames = 0
+    source_size = job.get("file_size") or 0
+    segment_paths = []
+    for segment_index, start_time, segment_length in segments:
+        segment_path = os.path.join(job_dir, f"segment_{segment_index:05d}.mkv")
+        if segment_index not in completed:
+            def report(out_seconds, out_bytes, base=done_seconds, base_bytes=done_bytes):
+                if progress_callback is not None:
+                    progress_callback(min(1.0, (base + out_seconds) / duration))
+                encoded_seconds = base + out_seconds
+                if min_savings is not None and source_size and encoded_seconds >= MIN_PROJECTION_SECONDS:
+                    projected_size = project_output_size(job, duration, encoded_seconds, base_bytes + out_bytes)
+                    if projected_size > source_size * (1 - min_savings):
+                        raise NotWorthwhile(source_size, projected_size, encoded_seconds, base_bytes + out_bytes)
+
+            frames += encode_segment(job["file_path"], segment_path, start_time, segment_length, settings, stop_event, report)
+            done_seconds += segment_length
+            done_bytes += os.path.getsize(segment_path)
+            record_checkpoint(job["id"], segment_index, start_time, segment_length, segment_path,
+                              worker_id, done_seconds / duration)
+        segment_paths.append(completed.get(segment_index, segment_path))
+
+    mux_output(job["file_path"], segment_paths, output_path, stop_event, job)
+    if stats is not None:
+        stats["media_seconds"] = done_seconds - resumed_seconds
+        stats["frames"] = frames
+        stats["wall_seconds"] = time.monotonic() - started
+    logging.info(f"Encoded job {job['id']} to {output_path}", extra={"job_id": job["id"]})
+    return output_path
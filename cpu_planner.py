@@ -0,0 +1,148 @@
+import os
+import glob
+import logging
+import psutil
+
+SYS_CPU_DIR = "/sys/devices/system/cpu"
+SYS_NODE_DIR = "/sys/devices/system/node"
+TARGET_CORES_PER_SLOT = 8  # Physical cores per encode slot when the slot count is chosen automatically
+
+
+def parse_cpu_list(text):
+    """Parses a /sys CPU list such as '0-3,8-11' into a list of CPU numbers."""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def read_sys_value(path):
+    try:
+        with open(path) as sys_file:
+            return sys_file.read().strip()
+    except OSError:
+        return None
+
+
+def get_allowed_cpus():
+    """Returns the CPUs this process may run on (respecting cgroups/taskset)."""
+    try:
+        return sorted(psutil.Process().cpu_affinity())
+    except (AttributeError, psutil.Error):
+        return list(range(psutil.cpu_count() or 1))
+
+
+def read_topology():
+    """Returns the physical cores this process may use as a list of
+    {"node": numa_node, "cpus": [logical CPUs of the core (SMT siblings)]}, ordered by node and core.
+
+    Reads /sys (NUMA nodes, package and core ids); without /sys every allowed CPU is its own
+    core on node 0.
+    """
+    allowed = set(get_allowed_cpus())
+    node_of = {}
+    for node_path in glob.glob(os.path.join(SYS_NODE_DIR, "node[0-9]*")):
+        cpulist = read_sys_value(os.path.join(node_path, "cpulist"))
+        if cpulist:
+            for cpu in parse_cpu_list(cpulist):
+                node_of[cpu] = int(os.path.basename(node_path)[4:])
+
+    cores = {}
+    for cpu in sorted(allowed):
+        topology_dir = os.path.join(SYS_CPU_DIR, f"cpu{cpu}", "topology")
+        package = read_sys_value(os.path.join(topology_dir, "physical_package_id"))
+        core_id = read_sys_value(os.path.join(topology_dir, "core_id"))
+        key = (node_of.get(cpu, 0), package, core_id) if core_id is not None else (node_of.get(cpu, 0), None, cpu)
+        cores.setdefault(key, []).append(cpu)
+
+    return [{"node": key[0], "cpus": cpus} for key, cpus in sorted(cores.items(), key=lambda item: (item[0][0], min(item[1])))]
+
+
+def suggest_slot_count(topology=None):
+    """Suggests how many concurrent encodes a host should run: one per TARGET_CORES_PER_SLOT
+    physical cores, at least one per NUMA node when each node has enough cores."""
+    topology = topology if topology is not None else read_topology()
+    nodes = {core["node"] for core in topology}
+    slots = max(1, len(topology) // TARGET_CORES_PER_SLOT)
+    if len(topology) // max(1, len(nodes)) >= TARGET_CORES_PER_SLOT // 2:
+        slots = max(slots, len(nodes))
+    return slots
+
+
+def plan_slots(slots, topology=None):
+    """Partitions the host's physical cores into `slots` disjoint CPU sets.
+
+    Each slot gets a contiguous run of physical cores with all their SMT siblings, so two
+    encoders never share a core's caches. Nodes are split between slots in proportion to
+    their cores, which keeps a slot on one NUMA node whenever the slot count allows it.
+    With more slots than cores, cores are shared round-robin.
+    Returns a list of {"slot", "cpus", "nodes", "threads"}; threads is the number of logical
+    CPUs in the slot (the encoder's thread budget).
+    """
+    topology = topology if topology is not None else read_topology()
+    if not topology:
+        return [{"slot": index, "cpus": [], "nodes": [], "threads": None} for index in range(slots)]
+
+    if slots > len(topology):
+        groups = [[topology[index % len(topology)]] for index in range(slots)]
+    else:
+        # Contiguous blocks of (node-ordered) cores, sizes differing by at most one
+        base, extra = divmod(len(topology), slots)
+        groups = []
+        start = 0
+        for index in range(slots):
+            size = base + (1 if index < extra else 0)
+            groups.append(topology[start:start + size])
+            start += size
+
+    plan = []
+    for index, cores in enumerate(groups):
+        cpus = sorted(cpu for core in cores for cpu in core["cpus"])
+        plan.append({
+            "slot": index,
+            "cpus": cpus,
+            "nodes": sorted({core["node"] for core in cores}),
+            "threads": len(cpus),
+        })
+    return plan
+
+
+def apply_slot_affinity(slot_plan):
+    """Pins the calling thread to the slot's CPUs.
+
+    On Linux the affinity of a thread is inherited by processes it starts, so every ffmpeg
+    launched from the slot's thread runs on the slot's cores only.
+    """
+    if not slot_plan["cpus"] or not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        os.sched_setaffinity(0, slot_plan["cpus"])
+    except OSError as e:
+        logging.warning(f"Could not pin slot {slot_plan['slot']} to CPUs {slot_plan['cpus']}: {e}")
+        return False
+    return True
+
+
+def format_cpu_list(cpus):
+    """Formats CPU numbers as a compact list such as '0-3,8-11'."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{first}-{last}" if first != last else str(first) for first, last in ranges)
+
+
+if __name__ == "__main__":
+    topology = read_topology()
+    slots = suggest_slot_count(topology)
+    print(f"{len(topology)} physical cores on {len({core['node'] for core in topology})} NUMA node(s); suggested slots: {slots}")
+    for slot_plan in plan_slots(slots, topology):
+        print(f"slot {slot_plan['slot']}: CPUs {format_cpu_list(slot_plan['cpus'])} (node {slot_plan['nodes']}), {slot_plan['threads']} threads")
@@ -3,12 +3,14 @@ import logging
 
 DB_PATH = "plex_video_converter.db"
 
+_history_schema_ready = False  # get_total_space_saved sets up the history schema once per process
+
 def get_conversion_jobs():
-    """Fetch job records from ConversionQueue, ensuring FIFO order and displaying NULL values correctly."""
+    """Fetch job records (id first) from ConversionQueue, ensuring FIFO order and displaying NULL values correctly."""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("""
-        SELECT file_name, file_size, job_status, queue_position 
+        SELECT id, file_name, file_size, job_status, queue_position 
         FROM ConversionQueue 
         ORDER BY queue_position IS NULL, queue_position ASC, file_size DESC 
     """)  
@@ -32,42 +34,23 @@ def get_queue():
     return queued
 
 
-def update_job_status_to_queued(file_names):
-    """Update selected job status to 'queued' in the database and assign queue positions."""
-    if not file_names:
-        return  # No files selected
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Get the current highest queue position
-    cursor.execute("SELECT COALESCE(MAX(queue_position), 0) FROM ConversionQueue;")
-    highest_position = cursor.fetchone()[0]
-    
-    # Assign new queue positions sequentially
-    job_updates = []
-    for file_name in file_names:
-        highest_position += 1
-        job_updates.append((highest_position, file_name))
-
-    # Update job status and queue position in batch
-    cursor.executemany("""
-        UPDATE ConversionQueue 
-        SET job_status = 'queued', queue_position = ? 
-        WHERE file_name = ?;
-    """, job_updates)
-
-    conn.commit()
-    conn.close()
-
 def get_total_space_saved():
-    """Returns the total space saved from completed conversion jobs."""
+    """Returns the total space saved from completed conversion jobs.
+    Archived jobs are read from SavingsRollup, so only live completed rows are summed.
+    The indexes and history tables are set up on the first call only, as the UI calls this on every refresh."""
+    global _history_schema_ready
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
+    if not _history_schema_ready:
+        # Imported here because job_archive imports db_handler
+        from job_archive import create_history_tables
+        create_queue_indexes(cursor)
+        create_history_tables(cursor)
+        conn.commit()
+        _history_schema_ready = True
     cursor.execute("""
-        SELECT COALESCE(SUM(space_saved), 0) 
-        FROM ConversionQueue 
-        WHERE job_status = 'completed';
+        SELECT (SELECT COALESCE(SUM(space_saved), 0) FROM SavingsRollup WHERE job_status = 'completed')
+             + (SELECT COALESCE(SUM(space_saved), 0) FROM ConversionQueue WHERE job_status = 'completed');
     """)
     total_saved = cursor.fetchone()[0]
     conn.close()
@@ -95,71 +78,6 @@ def get_highest_queue_position():
     conn.close()
     return highest_position
 
-def update_jobs_queue_position_and_status(job_updates):
-    """Updates the queue position and job status for multiple jobs based on file names in ConversionQueue."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.executemany("UPDATE ConversionQueue SET queue_position = ?, job_status = ? WHERE file_name = ?;", job_updates)
-    conn.commit()
-    conn.close()
-
-def move_jobs_to_front(file_names):
-    """Moves selected jobs to the front of the queue and sets status to 'queued'."""
-    if not file_names:
-        return
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Get the lowest queue position
-    cursor.execute("SELECT COALESCE(MIN(queue_position), 1) FROM ConversionQueue WHERE queue_position IS NOT NULL;")
-    min_position = cursor.fetchone()[0]
-
-    # Shift all existing queued jobs down
-    num_jobs = len(file_names)
-    cursor.execute(f"UPDATE ConversionQueue SET queue_position = queue_position + {num_jobs} WHERE queue_position IS NOT NULL;")
-
-    # Assign new queue positions and update job status
-    new_positions = []
-    for i, file_name in enumerate(file_names):
-        new_positions.append((min_position + i, "queued", file_name))
-
-    cursor.executemany("UPDATE ConversionQueue SET queue_position = ?, job_status = ? WHERE file_name = ?;", new_positions)
-    conn.commit()
-    conn.close()
-
-def remove_jobs_from_queue(file_names):
-    """Removes selected jobs from the queue by setting queue_position to NULL and job_status to 'pending',
-    then reorders the remaining queued jobs to remove gaps."""
-    
-    if not file_names:
-        return
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Step 1: Remove selected jobs by setting queue_position to NULL and job_status to 'pending'
-    query = f"""
-        UPDATE ConversionQueue 
-        SET queue_position = NULL, job_status = 'pending' 
-        WHERE file_name IN ({','.join(['?'] * len(file_names))});
-    """
-    cursor.execute(query, file_names)
-
-    # Step 2: Retrieve all queued jobs sorted by queue_position
-    cursor.execute("SELECT id FROM ConversionQueue WHERE queue_position IS NOT NULL ORDER BY queue_position ASC;")
-    queued_jobs = cursor.fetchall()
-
-    # Step 3: If there are remaining jobs, renumber queue positions from 1 to N
-    if queued_jobs:
-        new_positions = [(index + 1, job_id[0]) for index, job_id in enumerate(queued_jobs)]
-
-        # Step 4: Execute batch update to renumber the queue
-        cursor.executemany("UPDATE ConversionQueue SET queue_position = ? WHERE id = ?;", new_positions)
-
-    conn.commit()
-    conn.close()
-
 def get_registered_workers():
     """Fetches all registered workers from WorkerInfo table."""
     conn = sqlite3.connect(DB_PATH)
@@ -174,24 +92,35 @@ def get_registered_workers():
     return workers
 
 def update_conversion_queue():
-    """Clears the queue and updates it with new/modified records from FileRecords."""
+    """Clears the queue and updates it with new/modified records from FileRecords.
+
+    Files already archived in ConversionHistory are not queued again unless they were replaced
+    since (a different last_modified), and the new rows get ids above the highest archived id,
+    so queue and history ids never collide.
+    """
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
+    # Imported here because job_planner and job_archive import db_handler
+    from job_planner import needs_job_sql
+    from job_archive import create_history_tables, NOT_ARCHIVED_SQL
+    create_history_tables(cursor)
+
     # Clear the existing conversion queue
     cursor.execute("DELETE FROM ConversionQueue;")
     logging.info("Cleared ConversionQueue.")
 
     # Insert updated records from FileRecords
-    cursor.execute("""
+    cursor.execute(f"""
         INSERT INTO ConversionQueue (
-            file_name, file_path, file_size, last_modified, scan_date, 
+            id, file_name, file_path, file_size, last_modified, scan_date, 
             storage_location, video_codec, resolution, duration, 
             bit_rate, audio_codec, audio_channels, sample_rate, 
             language, container_format, original_size, estimated_size, 
             space_saved, creation_date, modification_date
         )
         SELECT 
+            (SELECT COALESCE(MAX(id), 0) FROM ConversionHistory) + ROW_NUMBER() OVER (ORDER BY f.rowid) AS id,
             file_name, file_path, file_size, file_modified AS last_modified, 
             last_scanned AS scan_date, 
             COALESCE(top_folder, 'Unknown') AS storage_location,  
@@ -200,9 +129,9 @@ def update_conversion_queue():
             audio_languages AS language, file_format AS container_format, 
             file_size AS original_size, NULL AS estimated_size, NULL AS space_saved, 
             CURRENT_TIMESTAMP AS creation_date, NULL AS modification_date
-        FROM FileRecords
-        WHERE video_codec NOT IN ('hevc', 'av1', 'vp9')
-        AND video_codec IS NOT NULL;
+        FROM FileRecords AS f
+        WHERE {needs_job_sql('video_codec', 'file_format')}
+          AND {NOT_ARCHIVED_SQL};
     """)
 
     rows_inserted = cursor.rowcount
@@ -210,4 +139,248 @@ def update_conversion_queue():
     conn.close()
 
     logging.info(f"Inserted {rows_inserted} updated records into ConversionQueue.")
-    return rows_inserted
\ No newline at end of file
+    return rows_inserted
+def add_column_if_missing(cursor, table, column, definition):
+    """Adds a column to an existing table if it is not there yet (used for schema upgrades)."""
+    cursor.execute(f"PRAGMA table_info({table});")
+    existing = {row[1] for row in cursor.fetchall()}
+    if column not in existing:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+        logging.info(f"Added column {column} to {table}.")
+
+def create_queue_indexes(cursor):
+    """Creates the ConversionQueue indexes used by the queue operations below."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cq_queue_position ON ConversionQueue(queue_position);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cq_job_status ON ConversionQueue(job_status);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cq_file_path ON ConversionQueue(file_path);")
+
+def load_selected_ids(cursor, job_ids):
+    """Loads job ids into the temp table temp.selected_jobs, keeping the selection order in seq."""
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS selected_jobs (id INTEGER PRIMARY KEY, seq INTEGER);")
+    cursor.execute("DELETE FROM temp.selected_jobs;")
+    cursor.executemany(
+        "INSERT OR IGNORE INTO temp.selected_jobs (id, seq) VALUES (?, ?);",
+        ((job_id, seq) for seq, job_id in enumerate(job_ids))
+    )
+
+def renumber_queue(cursor):
+    """Renumbers queue positions from 1 to N without gaps, only touching rows whose position changes."""
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET queue_position = ranked.new_position
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (ORDER BY queue_position, id) AS new_position
+            FROM ConversionQueue
+            WHERE queue_position IS NOT NULL
+        ) AS ranked
+        WHERE ConversionQueue.id = ranked.id
+          AND ConversionQueue.queue_position != ranked.new_position;
+    """)
+
+def queue_jobs_by_ids(job_ids):
+    """Appends the given jobs to the end of the queue in selection order and sets status to 'queued'.
+    Jobs currently being processed are left alone. Returns the number of queued jobs."""
+    if not job_ids:
+        return 0
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_queue_indexes(cursor)
+    load_selected_ids(cursor, job_ids)
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET job_status = 'queued',
+            queue_position = (SELECT COALESCE(MAX(queue_position), 0) FROM ConversionQueue) + selected.rank
+        FROM (
+            SELECT s.id, ROW_NUMBER() OVER (ORDER BY s.seq) AS rank
+            FROM temp.selected_jobs AS s
+            JOIN ConversionQueue AS q ON q.id = s.id
+            WHERE COALESCE(q.job_status, '') != 'Processing'
+        ) AS selected
+        WHERE ConversionQueue.id = selected.id;
+    """)
+    queued = cursor.rowcount
+    conn.commit()
+    conn.close()
+    logging.info(f"Queued {queued} jobs by id.")
+    return queued
+
+def move_jobs_to_front_by_ids(job_ids):
+    """Moves the given jobs to the front of the queue in selection order and sets status to 'queued'.
+    Returns the number of moved jobs."""
+    if not job_ids:
+        return 0
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_queue_indexes(cursor)
+    load_selected_ids(cursor, job_ids)
+
+    # Shift all other queued jobs down to make room at the front
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET queue_position = queue_position + (SELECT COUNT(*) FROM temp.selected_jobs)
+        WHERE queue_position IS NOT NULL
+          AND id NOT IN (SELECT id FROM temp.selected_jobs);
+    """)
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET job_status = 'queued',
+            queue_position = selected.rank
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (ORDER BY seq) AS rank
+            FROM temp.selected_jobs
+        ) AS selected
+        WHERE ConversionQueue.id = selected.id
+          AND COALESCE(ConversionQueue.job_status, '') != 'Processing';
+    """)
+    moved = cursor.rowcount
+    renumber_queue(cursor)
+    conn.commit()
+    conn.close()
+    logging.info(f"Moved {moved} jobs to the front of the queue.")
+    return moved
+
+def remove_jobs_from_queue_by_ids(job_ids):
+    """Removes the given jobs from the queue (queue_position NULL, status 'pending') and closes the gaps.
+    Jobs currently being processed are left alone. Returns the number of removed jobs."""
+    if not job_ids:
+        return 0
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_queue_indexes(cursor)
+    load_selected_ids(cursor, job_ids)
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET queue_position = NULL, job_status = 'pending'
+        FROM temp.selected_jobs AS selected
+        WHERE ConversionQueue.id = selected.id
+          AND COALESCE(ConversionQueue.job_status, '') != 'Processing';
+    """)
+    removed = cursor.rowcount
+    renumber_queue(cursor)
+    conn.commit()
+    conn.close()
+    logging.info(f"Removed {removed} jobs from the queue.")
+    return removed
+
+def build_job_filter(video_codec=None, min_size=None, max_size=None, storage_location=None,
+                     container_format=None, job_status=None, search=None):
+    """Builds a WHERE clause and parameters for ConversionQueue from optional filter values.
+    Sizes are in bytes; search matches file_name or job_status like the job list search bar."""
+    conditions = []
+    params = []
+    if video_codec is not None:
+        conditions.append("video_codec = ?")
+        params.append(video_codec)
+    if min_size is not None:
+        conditions.append("file_size >= ?")
+        params.append(min_size)
+    if max_size is not None:
+        conditions.append("file_size <= ?")
+        params.append(max_size)
+    if storage_location is not None:
+        conditions.append("storage_location = ?")
+        params.append(storage_location)
+    if container_format is not None:
+        conditions.append("container_format = ?")
+        params.append(container_format)
+    if job_status is not None:
+        conditions.append("job_status = ?")
+        params.append(job_status)
+    if search:
+        conditions.append("(file_name LIKE ? OR job_status LIKE ?)")
+        params.extend([f"%{search}%", f"%{search}%"])
+    where_clause = " AND ".join(conditions) if conditions else "1 = 1"
+    return where_clause, params
+
+def queue_jobs_matching(**filters):
+    """Appends every unqueued job matching the filters (see build_job_filter) to the end of the queue
+    in a single statement, largest files first. Returns the number of queued jobs.
+
+    Example: queue_jobs_matching(video_codec="h264", min_size=4 * 1024**3, storage_location="Movies")
+    """
+    where_clause, params = build_job_filter(**filters)
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_queue_indexes(cursor)
+    cursor.execute(f"""
+        UPDATE ConversionQueue
+        SET job_status = 'queued',
+            queue_position = (SELECT COALESCE(MAX(queue_position), 0) FROM ConversionQueue) + matched.rank
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (ORDER BY file_size DESC, id) AS rank
+            FROM ConversionQueue
+            WHERE queue_position IS NULL
+              AND COALESCE(job_status, 'pending') = 'pending'
+              AND {where_clause}
+        ) AS matched
+        WHERE ConversionQueue.id = matched.id;
+    """, params)
+    queued = cursor.rowcount
+    conn.commit()
+    conn.close()
+    logging.info(f"Queued {queued} jobs matching {filters}.")
+    return queued
+
+def remove_jobs_matching(**filters):
+    """Removes every queued job matching the filters (see build_job_filter) from the queue in a single
+    statement and closes the gaps. Returns the number of removed jobs."""
+    where_clause, params = build_job_filter(**filters)
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_queue_indexes(cursor)
+    cursor.execute(f"""
+        UPDATE ConversionQueue
+        SET queue_position = NULL, job_status = 'pending'
+        WHERE queue_position IS NOT NULL
+          AND COALESCE(job_status, '') != 'Processing'
+          AND {where_clause};
+    """, params)
+    removed = cursor.rowcount
+    renumber_queue(cursor)
+    conn.commit()
+    conn.close()
+    logging.info(f"Removed {removed} jobs matching {filters} from the queue.")
+    return removed
+
+def get_latest_log_id():
+    """Returns the highest id in the Logs table (0 if empty or missing)."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM Logs;")
+        latest_id = cursor.fetchone()[0]
+    except sqlite3.OperationalError:
+        latest_id = 0
+    conn.close()
+    return latest_id
+
+def get_logs_since(last_id, worker_id=None, errors_only=False, limit=500):
+    """Fetches Logs rows with id greater than last_id (oldest first) for incremental tailing.
+    Returns a list of (id, timestamp, level, worker_id, job_id, message)."""
+    conditions = ["id > ?"]
+    params = [last_id]
+    if worker_id is not None:
+        conditions.append("worker_id = ?")
+        params.append(worker_id)
+    if errors_only:
+        conditions.append("level IN ('ERROR', 'CRITICAL')")
+    params.append(limit)
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT id, timestamp, level, worker_id, job_id, message
+            FROM Logs
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id ASC
+            LIMIT ?;
+        """, params)
+        logs = cursor.fetchall()
+    except sqlite3.OperationalError:
+        logs = []  # Logs table not created yet
+    conn.close()
+    return logs
@@ -0,0 +1,218 @@
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import datetime
+import logging
+import logging.handlers
+import threading
+from db_handler import DB_PATH, add_column_if_missing
+
+# Logging configuration
+LOG_FILE = "database_processing.log"
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotate the log file at 10 MB
+LOG_BACKUP_COUNT = 5
+LOG_BATCH_SIZE = 200              # Max records per Logs insert
+LOG_FLUSH_INTERVAL = 1.0          # Max seconds the oldest buffered record waits before it is written
+LOG_MAX_BUFFERED = 10000          # Records kept in memory while the database is unavailable
+
+# Process-wide context added to every record that does not carry its own
+_log_context = {"worker_id": None, "journal": None}
+_handler = None
+
+
+def create_logs_table(cursor):
+    """Creates the Logs table (see README) if missing and adds the level column."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TIMESTAMP,
+            worker_id TEXT,
+            job_id INTEGER,
+            message TEXT
+        )
+    """)
+    add_column_if_missing(cursor, "Logs", "level", "TEXT")
+
+
+def set_log_context(worker_id=None):
+    """Sets the worker_id attached to every log record written by this process."""
+    _log_context["worker_id"] = worker_id
+
+
+def get_log_worker_id():
+    """Returns the worker_id set with set_log_context() (None outside a worker)."""
+    return _log_context["worker_id"]
+
+
+def set_log_journal(journal=None):
+    """Routes Logs rows of this process into a worker_journal.WorkerJournal instead of the central database."""
+    _log_context["journal"] = journal
+
+
+class LogWriter(threading.Thread):
+    """Background thread that drains the log queue into the rotating log file and the Logs table.
+
+    Records are collected until the oldest has waited LOG_FLUSH_INTERVAL seconds (or
+    LOG_BATCH_SIZE records are buffered) and inserted in one transaction, so a steady
+    trickle of records is still written on time. If the database is locked the batch is
+    kept and retried one interval later. In a worker with a journal (set_log_journal) the batch goes
+    to the local journal instead and reaches the Logs table with the journal's next sync.
+    """
+
+    def __init__(self, record_queue, log_file, db_path):
+        super().__init__(name="LogWriter", daemon=True)
+        self.record_queue = record_queue
+        self.db_path = db_path
+        self.file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
+        )
+        self.file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self.pending_rows = []
+        self.flush_due = None  # Monotonic time by which the buffered rows must be written
+        self.stopping = False
+
+    def run(self):
+        while True:
+            timeout = LOG_FLUSH_INTERVAL if self.flush_due is None else max(0.0, self.flush_due - time.monotonic())
+            try:
+                record = self.record_queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+
+            if record is not None:
+                self.write(record)
+
+            if len(self.pending_rows) >= LOG_BATCH_SIZE or (self.flush_due is not None and time.monotonic() >= self.flush_due):
+                self.flush()
+                self.flush_due = time.monotonic() + LOG_FLUSH_INTERVAL if self.pending_rows else None
+            if record is None and self.stopping:
+                self.flush()
+                break
+        self.file_handler.close()
+
+    def write(self, record):
+        """Writes a record to the log file and buffers its Logs row."""
+        self.file_handler.handle(record)
+        self.pending_rows.append(self.to_row(record))
+        if self.flush_due is None:
+            self.flush_due = time.monotonic() + LOG_FLUSH_INTERVAL
+
+    def to_row(self, record):
+        timestamp = datetime.datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S")
+        return (
+            timestamp,
+            getattr(record, "worker_id", None),
+            getattr(record, "job_id", None),
+            record.levelname,
+            record.getMessage(),
+        )
+
+    def flush(self):
+        """Writes the buffered rows to the Logs table in one transaction."""
+        if not self.pending_rows:
+            return
+        journal = _log_context["journal"]
+        if journal is not None and journal.pid == os.getpid():
+            try:
+                journal.record_logs(self.pending_rows)
+                self.pending_rows = []
+                return
+            except sqlite3.Error:
+                pass  # Fall back to writing the central database directly
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            cursor = conn.cursor()
+            create_logs_table(cursor)
+            cursor.executemany(
+                "INSERT INTO Logs (timestamp, worker_id, job_id, level, message) VALUES (?, ?, ?, ?, ?)",
+                self.pending_rows
+            )
+            conn.commit()
+            conn.close()
+            self.pending_rows = []
+        except sqlite3.Error as e:
+            # Keep the batch for the next flush, dropping the oldest rows if the buffer grows too large
+            self.pending_rows = self.pending_rows[-LOG_MAX_BUFFERED:]
+            self.file_handler.handle(logging.makeLogRecord({
+                "levelname": "WARNING", "levelno": logging.WARNING,
+                "msg": f"Could not write {len(self.pending_rows)} log records to the database: {e}",
+            }))
+
+    def stop(self):
+        """Flushes everything still queued and stops the thread."""
+        self.stopping = True
+        self.join(timeout=LOG_FLUSH_INTERVAL * 5)
+
+
+class AsyncLogHandler(logging.handlers.QueueHandler):
+    """Non-blocking handler: emit() only puts the record on a queue drained by a LogWriter.
+
+    A child process (e.g. a VerificationPool worker) writes its records synchronously
+    instead: starting a thread in a forked child can deadlock on locks the parent's
+    threads held at fork time.
+    """
+
+    def __init__(self, log_file=LOG_FILE, db_path=DB_PATH):
+        super().__init__(queue.SimpleQueue())
+        self.log_file = log_file
+        self.db_path = db_path
+        self.pid = os.getpid()
+        self.writer = LogWriter(self.queue, self.log_file, self.db_path)
+        self.writer.start()
+        self.child_writer = None  # Unstarted LogWriter used synchronously in a child process
+        self.child_pid = None
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        if getattr(record, "worker_id", None) is None:
+            record.worker_id = _log_context["worker_id"]
+        if not hasattr(record, "job_id"):
+            record.job_id = None
+        return record
+
+    def emit(self, record):
+        if os.getpid() == self.pid:
+            super().emit(record)
+            return
+        try:
+            if self.child_pid != os.getpid():
+                self.child_writer = LogWriter(None, self.log_file, self.db_path)
+                self.child_pid = os.getpid()
+            self.child_writer.write(self.prepare(record))
+            self.child_writer.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        if os.getpid() == self.pid and self.writer.is_alive():
+            self.writer.stop()
+        elif self.child_writer is not None:
+            self.child_writer.file_handler.close()
+        super().close()
+
+
+def setup_logging(log_file=LOG_FILE, db_path=DB_PATH, level=logging.INFO):
+    """Installs the asynchronous file + Logs table handler on the root logger (only once per process).
+
+    Pass extra={"job_id": job_id} to a logging call to attach the job; the worker_id comes
+    from set_log_context().
+    """
+    global _handler
+    if _handler is not None:
+        return _handler
+    _handler = AsyncLogHandler(log_file, db_path)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.addHandler(_handler)
+    atexit.register(_handler.close)
+    return _handler
+
+
+def format_log_entry(log_row):
+    """Formats a row from db_handler.get_logs_since() as a single display line."""
+    log_id, timestamp, level, worker_id, job_id, message = log_row
+    job_text = f"[job {job_id}] " if job_id is not None else ""
+    return f"{timestamp} - {level} - {job_text}{message}"
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import platform
+import argparse
+import resource
+import datetime
+import tempfile
+import threading
+import subprocess
+import psutil
+from conversion_engine import ENCODER_SETTINGS, encode_segment, mux_output, plan_segments
+from cpu_planner import plan_slots, apply_slot_affinity
+
+# Synthetic source clips (H.264 + AAC, like a typical library file)
+BENCHMARK_RESOLUTIONS = {
+    "480p": "854x480",
+    "1080p": "1920x1080",
+    "2160p": "3840x2160",
+}
+BENCHMARK_FPS = 30
+BENCHMARK_SECONDS = 20         # Length of each synthetic clip
+BENCHMARK_SEGMENT_SECONDS = 10 # Segment length used for the benchmark encodes (SEGMENT_SECONDS is too long for short clips)
+RSS_SAMPLE_INTERVAL = 0.2      # Seconds between RSS samples of the encoder processes
+CLIP_CACHE_DIR = os.path.join(tempfile.gettempdir(), "pvc_benchmark_clips")
+
+
+def generate_clip(resolution, seconds=BENCHMARK_SECONDS, cache_dir=CLIP_CACHE_DIR):
+    """Generates (or reuses) a synthetic H.264/AAC clip with motion and grain. Returns its path."""
+    os.makedirs(cache_dir, exist_ok=True)
+    clip_path = os.path.join(cache_dir, f"clip_{resolution}_{seconds}s.mkv")
+    if os.path.exists(clip_path):
+        return clip_path
+    size = BENCHMARK_RESOLUTIONS[resolution]
+    temp_path = clip_path + ".partial.mkv"
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={BENCHMARK_FPS},noise=alls=12:allf=t",
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+        "-t", str(seconds),
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "192k",
+        temp_path,
+    ], capture_output=True, check=True)
+    os.replace(temp_path, clip_path)
+    return clip_path
+
+
+def encode_clip(source_path, work_dir, settings, seconds):
+    """Runs a clip through the worker's encode path (segments + mux, without DB checkpoints). Returns the output size."""
+    os.makedirs(work_dir, exist_ok=True)
+    segment_paths = []
+    for segment_index, start_time, segment_length in plan_segments(seconds, BENCHMARK_SEGMENT_SECONDS):
+        segment_path = os.path.join(work_dir, f"segment_{segment_index:05d}.mkv")
+        encode_segment(source_path, segment_path, start_time, segment_length, settings)
+        segment_paths.append(segment_path)
+    output_path = os.path.join(work_dir, "output.mkv")
+    mux_output(source_path, segment_paths, output_path)
+    return os.path.getsize(output_path)
+
+
+class RSSMonitor(threading.Thread):
+    """Samples the summed RSS of this process and its children (the ffmpeg encoders)."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.process = psutil.Process()
+        self.peak_rss = 0
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            rss = 0
+            for process in [self.process] + self.process.children(recursive=True):
+                try:
+                    rss += process.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.peak_rss = max(self.peak_rss, rss)
+            self.stop_event.wait(RSS_SAMPLE_INTERVAL)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_case(resolution, slots, threads, settings, seconds, work_dir, pin=False):
+    """Encodes `slots` copies of a clip concurrently and measures the run.
+
+    With pin, each slot is pinned to its cpu_planner partition of the cores, and threads=0
+    means the partition's thread budget instead of the encoder default.
+    Returns a result dictionary with fps (frames encoded per wall second over all slots),
+    CPU seconds and utilisation, peak RSS and bytes saved per CPU-second.
+    """
+    source_path = generate_clip(resolution, seconds)
+    source_size = os.path.getsize(source_path)
+    slot_plans = plan_slots(slots) if pin else None
+    output_sizes = [0] * slots
+    errors = []
+
+    def slot(index):
+        slot_threads = threads
+        if slot_plans:
+            apply_slot_affinity(slot_plans[index])
+            slot_threads = threads or slot_plans[index]["threads"]
+        try:
+            output_sizes[index] = encode_clip(source_path, os.path.join(work_dir, f"slot_{index}"),
+                                              dict(settings, threads=slot_threads or None), seconds)
+        except Exception as e:
+            errors.append(e)
+
+    monitor = RSSMonitor()
+    monitor.start()
+    cpu_before = children_cpu_seconds()
+    started = time.monotonic()
+    slot_threads = [threading.Thread(target=slot, args=(index,)) for index in range(slots)]
+    for thread in slot_threads:
+        thread.start()
+    for thread in slot_threads:
+        thread.join()
+    wall_seconds = time.monotonic() - started
+    cpu_seconds = children_cpu_seconds() - cpu_before
+    monitor.stop()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if errors:
+        raise errors[0]
+
+    bytes_saved = sum(source_size - size for size in output_sizes)
+    return {
+        "resolution": resolution,
+        "slots": slots,
+        "threads": threads,
+        "pinned": pin,
+        "clip_seconds": seconds,
+        "frames": seconds * BENCHMARK_FPS * slots,
+        "wall_seconds": round(wall_seconds, 3),
+        "fps": round(seconds * BENCHMARK_FPS * slots / wall_seconds, 2),
+        "realtime_factor": round(seconds * slots / wall_seconds, 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "cpu_utilisation": round(cpu_seconds / (wall_seconds * psutil.cpu_count()), 3),
+        "peak_rss_mb": round(monitor.peak_rss / 1024 ** 2, 1),
+        "source_bytes": source_size,
+        "output_bytes": sum(output_sizes) // slots,
+        "bytes_saved_per_cpu_second": round(bytes_saved / cpu_seconds) if cpu_seconds > 0 else None,
+    }
+
+
+def run_benchmark(resolutions, slot_counts, thread_counts, settings=None, seconds=BENCHMARK_SECONDS, pin=False):
+    """Runs every resolution / slot count / thread count combination and returns the JSON-ready report."""
+    settings = dict(settings or ENCODER_SETTINGS)
+    report = {
+        "created_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "host": {
+            "hostname": socket.gethostname(),
+            "platform": platform.platform(),
+            "cpu": platform.processor(),
+            "logical_cpus": psutil.cpu_count(),
+            "physical_cpus": psutil.cpu_count(logical=False),
+            "ram_gb": round(psutil.virtual_memory().total / 1024 ** 3, 1),
+            "ffmpeg": subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n")[0],
+        },
+        "settings": settings,
+        "results": [],
+    }
+    work_root = tempfile.mkdtemp(prefix="pvc_benchmark_")
+    try:
+        for resolution in resolutions:
+            for slots in slot_counts:
+                for threads in thread_counts:
+                    work_dir = os.path.join(work_root, f"{resolution}_{slots}_{threads}")
+                    result = run_case(resolution, slots, threads, settings, seconds, work_dir, pin)
+                    print(f"{resolution} slots={slots} threads={threads or 'auto'}: {result['fps']} fps, "
+                          f"cpu {result['cpu_utilisation']:.0%}, peak RSS {result['peak_rss_mb']} MB, "
+                          f"{result['bytes_saved_per_cpu_second'] or 0} bytes saved per CPU-second", file=sys.stderr)
+                    report["results"].append(result)
+    finally:
+        shutil.rmtree(work_root, ignore_errors=True)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark encode throughput of the conversion pipeline on this machine.")
+    parser.add_argument("--resolutions", default="480p,1080p,2160p", help="Comma-separated, from " + ", ".join(BENCHMARK_RESOLUTIONS))
+    parser.add_argument("--slots", default="1,2", help="Comma-separated concurrent encode counts")
+    parser.add_argument("--threads", default="0", help="Comma-separated encoder thread counts (0 = encoder default)")
+    parser.add_argument("--seconds", type=int, default=BENCHMARK_SECONDS, help="Clip length in seconds")
+    parser.add_argument("--preset", default=ENCODER_SETTINGS["preset"])
+    parser.add_argument("--crf", type=int, default=ENCODER_SETTINGS["crf"])
+    parser.add_argument("--pin", action="store_true", help="Pin each slot to its cpu_planner core partition (threads 0 = partition size)")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    settings = dict(ENCODER_SETTINGS, preset=args.preset, crf=args.crf)
+    report = run_benchmark(
+        [resolution.strip() for resolution in args.resolutions.split(",")],
+        [int(value) for value in args.slots.split(",")],
+        [int(value) for value in args.threads.split(",")],
+        settings, args.seconds, args.pin,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
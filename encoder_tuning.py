@@ -0,0 +1,175 @@
+import os
+import re
+import time
+import shutil
+import sqlite3
+import datetime
+import logging
+import subprocess
+from db_handler import DB_PATH
+from conversion_engine import ENCODER_SETTINGS, SCRATCH_DIR, EncodeStopped, get_job_scratch_dir, run_ffmpeg
+from output_verification import get_sample_offsets, measure_sample_quality, probe_media
+
+# Candidate settings, tried from the fastest preset to the slowest. Within a preset the
+# highest CRF (smallest file) is tried first.
+TUNING_PRESETS = ["veryfast", "fast", "medium", "slow"]
+TUNING_CRFS = [26, 24, 22]
+
+TUNING_SAMPLE_COUNT = 3     # Sample clips encoded per job
+TUNING_SAMPLE_SECONDS = 10  # Length of each sample clip (seconds)
+TARGET_SSIM = 0.97          # Every sample must reach this SSIM for a candidate to pass
+FALLBACK_CACHE_DAYS = 7     # Days a folder where no candidate passed keeps ENCODER_SETTINGS before it is tuned again
+
+# Folder names that belong to a series folder rather than being one themselves
+SEASON_FOLDER_PATTERN = re.compile(r"^(season|series|staffel|saison|s)\s*\d+$|^specials$", re.IGNORECASE)
+
+
+def create_tuning_table(cursor):
+    """Creates the TuningCache table (one tuned setting per folder or series).
+    A row with a NULL min_ssim records that no candidate passed and ENCODER_SETTINGS were used."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS TuningCache (
+            folder_key TEXT PRIMARY KEY,
+            crf INTEGER,
+            preset TEXT,
+            min_ssim REAL,
+            encode_speed REAL,
+            samples INTEGER,
+            job_id INTEGER,
+            tuned_at TIMESTAMP
+        )
+    """)
+
+
+def get_folder_key(file_path):
+    """Returns the folder whose episodes share tuned settings.
+
+    Season folders (e.g. 'Season 02', 'S01', 'Specials') are collapsed into their series folder.
+    """
+    folder = os.path.dirname(file_path)
+    if SEASON_FOLDER_PATTERN.match(os.path.basename(folder)):
+        folder = os.path.dirname(folder)
+    return folder
+
+
+def get_cached_settings(folder_key):
+    """Returns the cached encoder settings for a folder, or None.
+    A fallback entry (no candidate passed) expires after FALLBACK_CACHE_DAYS, so the folder is tuned again."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_tuning_table(cursor)
+    conn.commit()
+    cutoff = (datetime.datetime.now() - datetime.timedelta(days=FALLBACK_CACHE_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        SELECT crf, preset FROM TuningCache
+        WHERE folder_key = ? AND (min_ssim IS NOT NULL OR tuned_at >= ?)
+    """, (folder_key, cutoff))
+    row = cursor.fetchone()
+    conn.close()
+    if row is None:
+        return None
+    return dict(ENCODER_SETTINGS, crf=row[0], preset=row[1])
+
+
+def store_tuned_settings(folder_key, settings, min_ssim, encode_speed, samples, job_id):
+    """Caches the tuned settings for a folder."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_tuning_table(cursor)
+    current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        INSERT OR REPLACE INTO TuningCache (folder_key, crf, preset, min_ssim, encode_speed, samples, job_id, tuned_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (folder_key, settings["crf"], settings["preset"], min_ssim, encode_speed, samples, job_id, current_timestamp))
+    conn.commit()
+    conn.close()
+
+
+def encode_sample(source_path, sample_path, offset, settings, stop_event=None):
+    """Encodes one video-only sample clip and returns the wall seconds it took.
+    Raises EncodeStopped if stop_event is set during the encode (see run_ffmpeg)."""
+    args = [
+        "-loglevel", "error",
+        "-ss", str(offset), "-t", str(TUNING_SAMPLE_SECONDS), "-i", source_path,
+        "-map", "0:v:0", "-an", "-sn",
+        "-c:v", settings["video_codec"], "-crf", str(settings["crf"]), "-preset", settings["preset"],
+        "-x265-params", "log-level=error",
+        "-f", "matroska", sample_path,
+    ]
+    started = time.monotonic()
+    run_ffmpeg(args, sample_path + ".log", stop_event)
+    return time.monotonic() - started
+
+
+def evaluate_candidate(source_path, offsets, settings, work_dir, stop_event=None):
+    """Encodes every sample with the candidate settings.
+
+    Returns (min_ssim, encode_speed) where encode_speed is media seconds per wall second.
+    """
+    ssim_values = []
+    wall_seconds = 0.0
+    for index, offset in enumerate(offsets):
+        sample_path = os.path.join(work_dir, f"tune_{settings['preset']}_{settings['crf']}_{index}.mkv")
+        wall_seconds += encode_sample(source_path, sample_path, offset, settings, stop_event)
+        _, ssim = measure_sample_quality(source_path, sample_path, offset, TUNING_SAMPLE_SECONDS, output_offset=0)
+        ssim_values.append(ssim if ssim is not None else 0.0)
+        os.remove(sample_path)
+    media_seconds = len(offsets) * TUNING_SAMPLE_SECONDS
+    return min(ssim_values), (media_seconds / wall_seconds if wall_seconds > 0 else 0.0)
+
+
+def tune_job(job, scratch_dir=SCRATCH_DIR, stop_event=None):
+    """Picks the fastest candidate whose samples all reach TARGET_SSIM.
+
+    Presets are tried fastest first; the first preset with a passing CRF wins, using the
+    highest passing CRF. Falls back to ENCODER_SETTINGS if no candidate passes.
+    A set stop_event ends the sample encodes with EncodeStopped.
+    Returns (settings, min_ssim, encode_speed, samples).
+    """
+    try:
+        duration = float(job.get("duration") or 0)
+    except (TypeError, ValueError):
+        duration = 0
+    if duration <= 0:
+        duration = probe_media(job["file_path"])["duration"]
+    offsets = get_sample_offsets(duration, TUNING_SAMPLE_COUNT, TUNING_SAMPLE_SECONDS)
+
+    work_dir = os.path.join(get_job_scratch_dir(job["id"], scratch_dir), "tuning")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        for preset in TUNING_PRESETS:
+            for crf in TUNING_CRFS:
+                if stop_event is not None and stop_event.is_set():
+                    raise EncodeStopped()
+                settings = dict(ENCODER_SETTINGS, crf=crf, preset=preset)
+                min_ssim, encode_speed = evaluate_candidate(job["file_path"], offsets, settings, work_dir, stop_event)
+                logging.info(f"Tuning job {job['id']}: preset={preset} crf={crf} ssim={min_ssim:.4f} speed={encode_speed:.2f}x",
+                             extra={"job_id": job["id"]})
+                if min_ssim >= TARGET_SSIM:
+                    return settings, min_ssim, encode_speed, len(offsets)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return dict(ENCODER_SETTINGS), None, None, len(offsets)
+
+
+def get_tuned_settings(job, scratch_dir=SCRATCH_DIR, stop_event=None):
+    """Returns encoder settings for a job, tuning them from sample encodes on a cache miss.
+
+    Results are cached per folder (see get_folder_key), so other episodes of the same show
+    reuse them without sampling again. Any tuning error falls back to ENCODER_SETTINGS and
+    is not cached; EncodeStopped from a stop request is passed on to the caller.
+    """
+    folder_key = get_folder_key(job["file_path"])
+    settings = get_cached_settings(folder_key)
+    if settings is not None:
+        return settings
+
+    try:
+        settings, min_ssim, encode_speed, samples = tune_job(job, scratch_dir, stop_event)
+    except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+        logging.warning(f"Tuning job {job['id']} failed, using default settings: {e}", extra={"job_id": job["id"]})
+        return dict(ENCODER_SETTINGS)
+
+    store_tuned_settings(folder_key, settings, min_ssim, encode_speed, samples, job["id"])
+    logging.info(f"Tuned {folder_key}: preset={settings['preset']} crf={settings['crf']}", extra={"job_id": job["id"]})
+    return settings
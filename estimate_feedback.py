@@ -0,0 +1,108 @@
+import sqlite3
+import datetime
+import logging
+from db_handler import DB_PATH
+from database_processing import COMPRESSION_TABLE
+
+FEEDBACK_WINDOW = 200            # Most recent outcomes per codec used for its learned reduction
+FEEDBACK_MIN_SAMPLES = 5         # Outcomes needed before a codec's learned reduction replaces the table value
+FEEDBACK_REESTIMATE_DELTA = 0.02 # Change in a codec's reduction that triggers re-estimating its unfinished jobs
+
+
+def create_feedback_tables(cursor):
+    """Creates EstimateFeedback (measured outcome per job) and EstimateFactors (learned reduction per codec)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS EstimateFeedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            video_codec TEXT,
+            resolution TEXT,
+            bit_rate INTEGER,
+            source_size INTEGER,
+            output_size INTEGER,
+            encoded_seconds REAL,
+            outcome TEXT,
+            recorded_at TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_estimate_feedback_codec ON EstimateFeedback(video_codec, id)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS EstimateFactors (
+            video_codec TEXT PRIMARY KEY,
+            reduction REAL NOT NULL,
+            samples INTEGER NOT NULL,
+            updated_at TIMESTAMP
+        )
+    """)
+
+
+def get_compression_table():
+    """Returns COMPRESSION_TABLE with the learned reduction of every codec that has enough feedback."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_feedback_tables(cursor)
+    conn.commit()
+    cursor.execute("SELECT video_codec, reduction FROM EstimateFactors")
+    table = dict(COMPRESSION_TABLE)
+    table.update(dict(cursor.fetchall()))
+    conn.close()
+    return table
+
+
+def record_estimate_feedback(job_id, output_size, outcome, encoded_seconds=None):
+    """Records the measured (or, for 'not_worthwhile', projected) output size of a transcode.
+
+    The codec's learned reduction is the average over its last FEEDBACK_WINDOW outcomes. When
+    it moves by FEEDBACK_REESTIMATE_DELTA or more, the estimates of the codec's unfinished
+    jobs are recomputed, so the dashboard and queue ordering reflect what encodes really save.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_feedback_tables(cursor)
+    current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        INSERT INTO EstimateFeedback (
+            job_id, video_codec, resolution, bit_rate, source_size, output_size, encoded_seconds, outcome, recorded_at
+        )
+        SELECT id, video_codec, resolution, bit_rate, COALESCE(original_size, file_size), ?, ?, ?, ?
+        FROM ConversionQueue
+        WHERE id = ? AND COALESCE(job_type, 'transcode') = 'transcode'
+    """, (output_size, encoded_seconds, outcome, current_timestamp, job_id))
+    if cursor.rowcount == 0:
+        conn.close()
+        return
+
+    cursor.execute("SELECT video_codec FROM ConversionQueue WHERE id = ?", (job_id,))
+    video_codec = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT AVG(1.0 - CAST(output_size AS REAL) / source_size), COUNT(*)
+        FROM (
+            SELECT output_size, source_size FROM EstimateFeedback
+            WHERE video_codec IS ? AND source_size > 0
+            ORDER BY id DESC
+            LIMIT ?
+        )
+    """, (video_codec, FEEDBACK_WINDOW))
+    reduction, samples = cursor.fetchone()
+    if samples >= FEEDBACK_MIN_SAMPLES and reduction is not None:
+        reduction = max(0.0, reduction)
+        cursor.execute("SELECT reduction FROM EstimateFactors WHERE video_codec IS ?", (video_codec,))
+        row = cursor.fetchone()
+        previous = row[0] if row else COMPRESSION_TABLE.get(video_codec, 0.0)
+        if row is None or abs(reduction - previous) >= FEEDBACK_REESTIMATE_DELTA:
+            cursor.execute("""
+                INSERT OR REPLACE INTO EstimateFactors (video_codec, reduction, samples, updated_at)
+                VALUES (?, ?, ?, ?)
+            """, (video_codec, reduction, samples, current_timestamp))
+            cursor.execute("""
+                UPDATE ConversionQueue
+                SET estimated_size = CAST(file_size * (1 - ?1) AS INTEGER),
+                    space_saved = file_size - CAST(file_size * (1 - ?1) AS INTEGER)
+                WHERE video_codec = ?2
+                  AND COALESCE(job_type, 'transcode') = 'transcode'
+                  AND COALESCE(job_status, 'pending') IN ('pending', 'queued', 'skipped')
+            """, (reduction, video_codec))
+            logging.info(f"Learned reduction for {video_codec}: {reduction:.1%} from {samples} jobs "
+                         f"(was {previous:.1%}); re-estimated {cursor.rowcount} jobs.")
+    conn.commit()
+    conn.close()
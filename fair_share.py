@@ -0,0 +1,303 @@
+import sys
+import sqlite3
+import datetime
+import argparse
+from db_handler import DB_PATH, add_column_if_missing, create_queue_indexes, build_job_filter
+from job_failures import create_failure_columns
+
+DEFAULT_PRIORITY_CLASS = 1            # 0 = high, 1 = normal, 2 = low; lower classes are always served first
+PRIORITY_CLASSES = {"high": 0, "normal": 1, "low": 2}
+DEFAULT_WEIGHT = 1.0                  # Weight of a share without an entry in FairShareWeights
+RATE_SAMPLE_JOBS = 1000               # Jobs with a known duration and size sampled to turn sizes into media seconds
+DEFAULT_BYTES_PER_SECOND = 1000000    # Assumed average bitrate (8 Mbit/s) when no job has a known duration
+
+# Queued jobs a worker may claim now (jobs backing off after a failure wait for next_attempt_at)
+CLAIMABLE_SQL = "job_status = 'queued' AND queue_position IS NOT NULL AND (next_attempt_at IS NULL OR next_attempt_at <= :now)"
+
+
+def claim_time():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def create_fair_share_tables(cursor):
+    """Adds priority_class/share_key to ConversionQueue and creates the fair-share tables.
+
+    share_key defaults to the job's storage_location (set by a trigger on insert), so every
+    library is its own share unless the operator groups jobs into other queues. The composite
+    index lets the claim path find the lowest class, the active shares and each share's head
+    with index seeks only.
+    """
+    add_column_if_missing(cursor, "ConversionQueue", "priority_class", f"INTEGER NOT NULL DEFAULT {DEFAULT_PRIORITY_CLASS}")
+    add_column_if_missing(cursor, "ConversionQueue", "share_key", "TEXT")
+    create_failure_columns(cursor)
+    create_queue_indexes(cursor)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cq_fair_share
+        ON ConversionQueue(job_status, priority_class, share_key, queue_position)
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_share_key_default
+        AFTER INSERT ON ConversionQueue
+        WHEN NEW.share_key IS NULL
+        BEGIN
+            UPDATE ConversionQueue SET share_key = COALESCE(NEW.storage_location, 'Unknown') WHERE id = NEW.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS FairShareWeights (
+            share_key TEXT PRIMARY KEY,
+            weight REAL NOT NULL DEFAULT 1.0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS FairShareCounters (
+            priority_class INTEGER NOT NULL,
+            share_key TEXT NOT NULL,
+            pass REAL NOT NULL DEFAULT 0,
+            served_jobs INTEGER NOT NULL DEFAULT 0,
+            served_seconds REAL NOT NULL DEFAULT 0,
+            last_served TIMESTAMP,
+            PRIMARY KEY (priority_class, share_key)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS FairShareClock (
+            priority_class INTEGER PRIMARY KEY,
+            virtual_time REAL NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("SELECT 1 FROM ConversionQueue WHERE share_key IS NULL LIMIT 1")
+    if cursor.fetchone():
+        cursor.execute("UPDATE ConversionQueue SET share_key = COALESCE(storage_location, 'Unknown') WHERE share_key IS NULL")
+
+
+def get_active_shares(cursor, priority_class):
+    """Returns the distinct share_keys with claimable jobs in a class, via a skip-scan of idx_cq_fair_share."""
+    cursor.execute(f"""
+        WITH RECURSIVE shares(share_key) AS (
+            SELECT MIN(share_key) FROM ConversionQueue
+            WHERE {CLAIMABLE_SQL} AND priority_class = :priority_class
+            UNION ALL
+            SELECT (SELECT MIN(share_key) FROM ConversionQueue
+                    WHERE {CLAIMABLE_SQL} AND priority_class = :priority_class
+                      AND share_key > shares.share_key)
+            FROM shares WHERE shares.share_key IS NOT NULL
+        )
+        SELECT share_key FROM shares WHERE share_key IS NOT NULL
+    """, {"priority_class": priority_class, "now": claim_time()})
+    return [row[0] for row in cursor.fetchall()]
+
+
+def choose_share(cursor):
+    """Picks the (priority_class, share_key) to serve next.
+
+    The lowest priority class with claimable jobs wins outright. Within it, the share with the
+    smallest pass (media seconds served / weight) is chosen. A share that was idle starts at
+    the class's virtual time, so it gets its fair share from now on instead of a catch-up burst.
+    Returns (priority_class, share_key), or None when nothing is queued.
+    """
+    cursor.execute(f"SELECT MIN(priority_class) FROM ConversionQueue WHERE {CLAIMABLE_SQL}", {"now": claim_time()})
+    priority_class = cursor.fetchone()[0]
+    if priority_class is None:
+        return None
+    shares = get_active_shares(cursor, priority_class)
+    if not shares:
+        return None
+
+    cursor.execute("SELECT virtual_time FROM FairShareClock WHERE priority_class = ?", (priority_class,))
+    row = cursor.fetchone()
+    virtual_time = row[0] if row else 0.0
+    cursor.execute("SELECT share_key, pass FROM FairShareCounters WHERE priority_class = ?", (priority_class,))
+    passes = dict(cursor.fetchall())
+
+    best = min(shares, key=lambda share_key: (max(passes.get(share_key, 0.0), virtual_time), share_key))
+    return priority_class, best
+
+
+def get_share_head(cursor, priority_class, share_key, limit):
+    """Returns the first claimable jobs of a share in queue_position order (index range scan).
+    file_size and duration are cast in SQL, as the columns may hold TEXT values."""
+    cursor.execute(f"""
+        SELECT id, file_name, file_path, CAST(file_size AS INTEGER), CAST(duration AS REAL), resolution, video_codec,
+               job_type, audio_action, subtitle_action, bit_rate
+        FROM ConversionQueue
+        WHERE {CLAIMABLE_SQL} AND priority_class = :priority_class AND share_key = :share_key
+        ORDER BY queue_position ASC
+        LIMIT :limit
+    """, {"priority_class": priority_class, "share_key": share_key, "limit": limit, "now": claim_time()})
+    return cursor.fetchall()
+
+
+def get_seconds_per_byte(cursor):
+    """Average media seconds per byte over up to RATE_SAMPLE_JOBS jobs with a known duration and size.
+    Falls back to DEFAULT_BYTES_PER_SECOND when no job has both."""
+    cursor.execute("""
+        SELECT SUM(seconds), SUM(bytes) FROM (
+            SELECT CAST(duration AS REAL) AS seconds, CAST(file_size AS INTEGER) AS bytes
+            FROM ConversionQueue
+            WHERE CAST(duration AS REAL) > 0 AND CAST(file_size AS INTEGER) > 0
+            LIMIT ?
+        )
+    """, (RATE_SAMPLE_JOBS,))
+    seconds, size = cursor.fetchone()
+    return seconds / size if size else 1.0 / DEFAULT_BYTES_PER_SECOND
+
+
+def charge_share(cursor, job_id):
+    """Charges a claimed job's media seconds to its share. Without a duration the file size is
+    converted at get_seconds_per_byte, so every charge is in the same unit.
+
+    Runs on the caller's cursor without committing, so the charge is part of the claim's transaction.
+    """
+    cursor.execute("""
+        SELECT priority_class, share_key, CAST(duration AS REAL), CAST(file_size AS INTEGER)
+        FROM ConversionQueue WHERE id = ?
+    """, (job_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    priority_class, share_key, duration, file_size = row
+    cost = duration or (file_size * get_seconds_per_byte(cursor) if file_size else 0.0)
+    cursor.execute("SELECT COALESCE((SELECT weight FROM FairShareWeights WHERE share_key = ?), ?)", (share_key, DEFAULT_WEIGHT))
+    weight = cursor.fetchone()[0] or DEFAULT_WEIGHT
+    cursor.execute("SELECT virtual_time FROM FairShareClock WHERE priority_class = ?", (priority_class,))
+    clock = cursor.fetchone()
+    virtual_time = clock[0] if clock else 0.0
+
+    current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        INSERT INTO FairShareCounters (priority_class, share_key, pass, served_jobs, served_seconds, last_served)
+        VALUES (?1, ?2, ?3 + ?4, 1, ?5, ?6)
+        ON CONFLICT (priority_class, share_key) DO UPDATE SET
+            pass = MAX(pass, ?3) + ?4,
+            served_jobs = served_jobs + 1,
+            served_seconds = served_seconds + ?5,
+            last_served = ?6
+    """, (priority_class, share_key, virtual_time, cost / weight, cost, current_timestamp))
+
+    # The virtual time follows the smallest pass among shares that still have queued jobs
+    active = get_active_shares(cursor, priority_class)
+    if active:
+        cursor.execute("SELECT share_key, pass FROM FairShareCounters WHERE priority_class = ?", (priority_class,))
+        passes = dict(cursor.fetchall())
+        cursor.execute("""
+            INSERT INTO FairShareClock (priority_class, virtual_time) VALUES (?1, ?2)
+            ON CONFLICT (priority_class) DO UPDATE SET virtual_time = MAX(virtual_time, ?2)
+        """, (priority_class, min(max(passes.get(share_key, 0.0), virtual_time) for share_key in active)))
+
+
+def set_share_weight(share_key, weight):
+    """Sets the weight of a share (a storage_location or an operator-defined queue)."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_fair_share_tables(cursor)
+    cursor.execute("INSERT OR REPLACE INTO FairShareWeights (share_key, weight) VALUES (?, ?)", (share_key, weight))
+    conn.commit()
+    conn.close()
+
+
+def assign_jobs_matching(priority_class=None, share_key=None, **filters):
+    """Sets the priority class and/or share key of every job matching the filters (see build_job_filter).
+
+    Returns the number of updated jobs.
+    """
+    assignments = []
+    params = []
+    if priority_class is not None:
+        assignments.append("priority_class = ?")
+        params.append(priority_class)
+    if share_key is not None:
+        assignments.append("share_key = ?")
+        params.append(share_key)
+    if not assignments:
+        return 0
+    where_clause, filter_params = build_job_filter(**filters)
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_fair_share_tables(cursor)
+    cursor.execute(f"UPDATE ConversionQueue SET {', '.join(assignments)} WHERE {where_clause}", params + filter_params)
+    updated = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return updated
+
+
+def get_fair_share_report():
+    """Returns per class and share: (priority_class, share_key, weight, queued_jobs, served_jobs,
+    served_seconds, served_fraction, weight_fraction). The fractions are within the class,
+    so a share is getting its fair share when served_fraction matches weight_fraction."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_fair_share_tables(cursor)
+    conn.commit()
+    cursor.execute("""
+        WITH queued AS (
+            SELECT priority_class, share_key, COUNT(*) AS jobs
+            FROM ConversionQueue
+            WHERE job_status = 'queued'
+            GROUP BY priority_class, share_key
+        ),
+        shares AS (
+            SELECT priority_class, share_key FROM queued
+            UNION
+            SELECT priority_class, share_key FROM FairShareCounters
+        ),
+        stats AS (
+            SELECT s.priority_class, s.share_key,
+                   COALESCE(w.weight, ?) AS weight,
+                   COALESCE(q.jobs, 0) AS queued_jobs,
+                   COALESCE(c.served_jobs, 0) AS served_jobs,
+                   COALESCE(c.served_seconds, 0) AS served_seconds
+            FROM shares AS s
+            LEFT JOIN queued AS q USING (priority_class, share_key)
+            LEFT JOIN FairShareCounters AS c USING (priority_class, share_key)
+            LEFT JOIN FairShareWeights AS w ON w.share_key = s.share_key
+        )
+        SELECT priority_class, share_key, weight, queued_jobs, served_jobs, served_seconds,
+               served_seconds / NULLIF(SUM(served_seconds) OVER (PARTITION BY priority_class), 0),
+               weight / SUM(weight) OVER (PARTITION BY priority_class)
+        FROM stats
+        ORDER BY priority_class, share_key
+    """, (DEFAULT_WEIGHT,))
+    report = cursor.fetchall()
+    conn.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage priority classes and fair-share weights for ConversionQueue.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    weight_parser = subparsers.add_parser("weight", help="Set the weight of a share")
+    weight_parser.add_argument("share_key")
+    weight_parser.add_argument("weight", type=float)
+
+    assign_parser = subparsers.add_parser("assign", help="Set the class and/or share of matching jobs")
+    assign_parser.add_argument("--class", dest="priority_class", choices=PRIORITY_CLASSES)
+    assign_parser.add_argument("--share")
+    assign_parser.add_argument("--codec")
+    assign_parser.add_argument("--location")
+    assign_parser.add_argument("--status")
+    assign_parser.add_argument("--search")
+
+    subparsers.add_parser("report", help="Show per-class and per-share throughput counters")
+
+    args = parser.parse_args(argv)
+    if args.command == "weight":
+        set_share_weight(args.share_key, args.weight)
+        print(f"Share {args.share_key} weight set to {args.weight}.")
+    elif args.command == "assign":
+        updated = assign_jobs_matching(
+            priority_class=PRIORITY_CLASSES.get(args.priority_class), share_key=args.share,
+            video_codec=args.codec, storage_location=args.location, job_status=args.status, search=args.search
+        )
+        print(f"Updated {updated} jobs.")
+    elif args.command == "report":
+        for priority_class, share_key, weight, queued, served_jobs, served_seconds, served_fraction, weight_fraction in get_fair_share_report():
+            print(f"class {priority_class} {share_key}: weight {weight:g} ({weight_fraction:.0%}), queued {queued}, "
+                  f"served {served_jobs} jobs / {served_seconds / 3600:.1f} h ({(served_fraction or 0):.0%})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
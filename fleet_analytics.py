@@ -0,0 +1,311 @@
+import sqlite3
+import datetime
+from db_handler import DB_PATH, add_column_if_missing
+from job_planner import REMUX_COST_FACTOR, create_plan_columns
+
+SPEED_HISTORY_DAYS = 14     # Rollups used to compute worker speeds
+ACTIVE_WORKER_MINUTES = 15  # Workers that checked in this recently count toward the ETA
+MAX_CHART_POINTS = 500      # Points kept when downsampling long histories for QtCharts
+
+# Resolution classes by minimum frame height
+RESOLUTION_CLASSES = [
+    (1800, "2160p"),
+    (900, "1080p"),
+    (600, "720p"),
+    (0, "SD"),
+]
+
+
+def create_rollup_table(cursor):
+    """Creates the ThroughputRollups table (one row per hour, worker, resolution class and codec)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ThroughputRollups (
+            bucket_start TEXT NOT NULL,
+            worker_id TEXT NOT NULL,
+            resolution_class TEXT NOT NULL,
+            video_codec TEXT NOT NULL,
+            jobs INTEGER NOT NULL DEFAULT 0,
+            media_seconds REAL NOT NULL DEFAULT 0,
+            wall_seconds REAL NOT NULL DEFAULT 0,
+            bytes_saved INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_start, worker_id, resolution_class, video_codec)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rollups_worker ON ThroughputRollups(worker_id, bucket_start)")
+    add_column_if_missing(cursor, "ConversionQueue", "progress", "REAL")
+    create_plan_columns(cursor)
+
+
+def create_slot_table(cursor):
+    """Creates the SlotThroughput table (one row per hour, worker and encode slot)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS SlotThroughput (
+            bucket_start TEXT NOT NULL,
+            worker_id TEXT NOT NULL,
+            slot INTEGER NOT NULL,
+            cpus TEXT,
+            threads INTEGER,
+            jobs INTEGER NOT NULL DEFAULT 0,
+            frames INTEGER NOT NULL DEFAULT 0,
+            wall_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_start, worker_id, slot)
+        )
+    """)
+
+
+def get_resolution_class(resolution):
+    """Maps a resolution such as '1920x1080' or '1080p' to a resolution class."""
+    try:
+        text = str(resolution).lower()
+        height = int(text.split("x")[1]) if "x" in text else int(text.rstrip("pi"))
+    except (IndexError, ValueError):
+        return "unknown"
+    for min_height, label in RESOLUTION_CLASSES:
+        if height >= min_height:
+            return label
+    return "unknown"
+
+
+def record_job_throughput(worker_id, resolution, video_codec, jobs=0, media_seconds=0.0, wall_seconds=0.0, bytes_saved=0):
+    """Adds encode time and savings to the current hourly rollup for a worker.
+
+    Called once when an encode finishes (jobs, media_seconds, wall_seconds) and once when the
+    job is completed (bytes_saved).
+    """
+    bucket_start = datetime.datetime.now().strftime("%Y-%m-%d %H:00:00")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_rollup_table(cursor)
+    cursor.execute("""
+        INSERT INTO ThroughputRollups (
+            bucket_start, worker_id, resolution_class, video_codec, jobs, media_seconds, wall_seconds, bytes_saved
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (bucket_start, worker_id, resolution_class, video_codec) DO UPDATE SET
+            jobs = jobs + excluded.jobs,
+            media_seconds = media_seconds + excluded.media_seconds,
+            wall_seconds = wall_seconds + excluded.wall_seconds,
+            bytes_saved = bytes_saved + excluded.bytes_saved
+    """, (bucket_start, worker_id, get_resolution_class(resolution), video_codec or "unknown",
+          jobs, media_seconds, wall_seconds, bytes_saved))
+    conn.commit()
+    conn.close()
+
+
+def record_slot_throughput(worker_id, slot, cpus, threads, frames, wall_seconds):
+    """Adds an encode's frames and wall time to the current hourly row of a worker's encode slot."""
+    bucket_start = datetime.datetime.now().strftime("%Y-%m-%d %H:00:00")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_slot_table(cursor)
+    cursor.execute("""
+        INSERT INTO SlotThroughput (bucket_start, worker_id, slot, cpus, threads, jobs, frames, wall_seconds)
+        VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+        ON CONFLICT (bucket_start, worker_id, slot) DO UPDATE SET
+            cpus = excluded.cpus,
+            threads = excluded.threads,
+            jobs = jobs + 1,
+            frames = frames + excluded.frames,
+            wall_seconds = wall_seconds + excluded.wall_seconds
+    """, (bucket_start, worker_id, slot, cpus, threads, frames, wall_seconds))
+    conn.commit()
+    conn.close()
+
+
+def get_slot_fps(worker_id=None, days=SPEED_HISTORY_DAYS):
+    """Returns [(worker_id, slot, cpus, threads, fps)] over the last days; the sum of a worker's
+    slot fps is its aggregate encode throughput."""
+    since = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:00:00")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_slot_table(cursor)
+    conn.commit()
+    cursor.execute("""
+        SELECT worker_id, slot, MAX(cpus), MAX(threads), SUM(frames) / SUM(wall_seconds)
+        FROM SlotThroughput
+        WHERE bucket_start >= ? AND (? IS NULL OR worker_id = ?)
+        GROUP BY worker_id, slot
+        HAVING SUM(wall_seconds) > 0
+        ORDER BY worker_id, slot
+    """, (since, worker_id, worker_id))
+    slots = cursor.fetchall()
+    conn.close()
+    return slots
+
+
+def get_worker_speeds(days=SPEED_HISTORY_DAYS):
+    """Returns per-worker speed (media seconds encoded per wall second) over the last days.
+
+    Returns a list of (worker_id, hostname, speed, jobs), fastest first.
+    """
+    since = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:00:00")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_rollup_table(cursor)
+    cursor.execute("""
+        SELECT r.worker_id, COALESCE(w.hostname, r.worker_id),
+               SUM(r.media_seconds) / SUM(r.wall_seconds), SUM(r.jobs)
+        FROM ThroughputRollups AS r
+        LEFT JOIN WorkerInfo AS w ON w.workerID = r.worker_id
+        WHERE r.bucket_start >= ?
+        GROUP BY r.worker_id
+        HAVING SUM(r.wall_seconds) > 0
+        ORDER BY 3 DESC
+    """, (since,))
+    speeds = cursor.fetchall()
+    conn.commit()
+    conn.close()
+    return speeds
+
+
+def get_class_speeds(days=SPEED_HISTORY_DAYS):
+    """Returns {(worker_id, resolution_class): speed} over the last days."""
+    since = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:00:00")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_rollup_table(cursor)
+    cursor.execute("""
+        SELECT worker_id, resolution_class, SUM(media_seconds) / SUM(wall_seconds)
+        FROM ThroughputRollups
+        WHERE bucket_start >= ?
+        GROUP BY worker_id, resolution_class
+        HAVING SUM(wall_seconds) > 0
+    """, (since,))
+    speeds = {(worker_id, resolution_class): speed for worker_id, resolution_class, speed in cursor.fetchall()}
+    conn.commit()
+    conn.close()
+    return speeds
+
+
+def get_remaining_media_seconds():
+    """Returns {resolution_class: media seconds left} for queued and processing jobs.
+    Remux-only jobs count at REMUX_COST_FACTOR of their duration since they run at disk speed."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_rollup_table(cursor)
+    cursor.execute("""
+        SELECT resolution,
+               SUM(COALESCE(duration, 0) * (1 - COALESCE(progress, 0))
+                   * (CASE WHEN job_type = 'remux' THEN ? ELSE 1 END))
+        FROM ConversionQueue
+        WHERE job_status IN ('queued', 'Processing')
+        GROUP BY resolution
+    """, (REMUX_COST_FACTOR,))
+    remaining = {}
+    for resolution, seconds in cursor.fetchall():
+        resolution_class = get_resolution_class(resolution)
+        remaining[resolution_class] = remaining.get(resolution_class, 0.0) + (seconds or 0.0)
+    conn.commit()
+    conn.close()
+    return remaining
+
+
+def get_active_workers(active_minutes=ACTIVE_WORKER_MINUTES):
+    """Returns the workerIDs that are processing and checked in recently."""
+    cutoff = (datetime.datetime.now() - datetime.timedelta(minutes=active_minutes)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT workerID FROM WorkerInfo
+        WHERE status = 'Processing' AND last_checkin >= ?
+    """, (cutoff,))
+    workers = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return workers
+
+
+def get_queue_eta():
+    """Estimates how long the queue needs to drain with the currently active workers.
+
+    Remaining media seconds per resolution class are divided by the summed measured speed
+    of the active workers for that class (falling back to each worker's overall speed, then
+    to the fleet average). Returns (eta_seconds, remaining_media_seconds, fleet_speed);
+    eta_seconds is None when no active worker has a measured speed.
+    """
+    remaining = get_remaining_media_seconds()
+    total_remaining = sum(remaining.values())
+    overall_speeds = {worker_id: speed for worker_id, _, speed, _ in get_worker_speeds()}
+    class_speeds = get_class_speeds()
+    fleet_average = sum(overall_speeds.values()) / len(overall_speeds) if overall_speeds else None
+
+    active_workers = get_active_workers()
+    fleet_speed = sum(overall_speeds.get(worker_id, fleet_average or 0) for worker_id in active_workers)
+    if total_remaining == 0:
+        return 0.0, 0.0, fleet_speed
+    if not active_workers or fleet_average is None:
+        return None, total_remaining, fleet_speed
+
+    eta_seconds = 0.0
+    for resolution_class, seconds in remaining.items():
+        class_speed = sum(
+            class_speeds.get((worker_id, resolution_class), overall_speeds.get(worker_id, fleet_average))
+            for worker_id in active_workers
+        )
+        eta_seconds += seconds / class_speed if class_speed > 0 else 0.0
+    return eta_seconds, total_remaining, fleet_speed
+
+
+def get_reclaimed_over_time():
+    """Returns [(bucket_start, cumulative_bytes_saved)] per hourly bucket, oldest first."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_rollup_table(cursor)
+    cursor.execute("""
+        SELECT bucket_start, SUM(SUM(bytes_saved)) OVER (ORDER BY bucket_start)
+        FROM ThroughputRollups
+        GROUP BY bucket_start
+        HAVING SUM(bytes_saved) != 0
+        ORDER BY bucket_start
+    """)
+    points = cursor.fetchall()
+    conn.commit()
+    conn.close()
+    return points
+
+
+def downsample(points, max_points=MAX_CHART_POINTS):
+    """Reduces a list of (x, y) points with Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last point and, per bucket, the point that best preserves the
+    shape of the line, so long histories stay cheap to plot. x values must be numeric.
+    """
+    if len(points) <= max_points or max_points < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (max_points - 2)
+    previous = points[0]
+    for i in range(max_points - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+
+        # Average of the next bucket is the third corner of the triangle
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, len(points))
+        next_bucket = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        best_point = points[start]
+        best_area = -1.0
+        for point in points[start:end]:
+            area = abs((previous[0] - avg_x) * (point[1] - previous[1]) - (previous[0] - point[0]) * (avg_y - previous[1]))
+            if area > best_area:
+                best_area = area
+                best_point = point
+        sampled.append(best_point)
+        previous = best_point
+    sampled.append(points[-1])
+    return sampled
+
+
+def format_duration(seconds):
+    """Formats a number of seconds as e.g. '3d 4h' or '2h 15m'."""
+    if seconds is None:
+        return "unknown"
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days}d {hours}h"
+    return f"{hours}h {minutes}m"
@@ -0,0 +1,198 @@
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import datetime
+from db_handler import DB_PATH, add_column_if_missing, create_queue_indexes
+
+ARCHIVE_STATUSES = ("completed", "failed", "skipped", "not_worthwhile")  # Finished jobs moved to ConversionHistory
+ARCHIVE_MIN_AGE_MINUTES = 60  # Finished jobs stay visible in the queue this long
+ARCHIVE_BATCH_SIZE = 2000     # Rows moved per write transaction
+ARCHIVE_BATCH_PAUSE = 0.05    # Seconds between batches, so workers can claim and complete jobs in between
+
+# FileRecords rows (alias f) not archived in their current version; a replaced file (new file_modified) is queued again
+NOT_ARCHIVED_SQL = """NOT EXISTS (SELECT 1 FROM ConversionHistory AS h
+                                  WHERE h.file_path = f.file_path AND h.last_modified IS f.file_modified)"""
+
+
+def create_history_tables(cursor):
+    """Creates ConversionHistory (archived ConversionQueue rows) and SavingsRollup (archived totals).
+
+    ConversionHistory gets every ConversionQueue column, including ones added by later
+    schema upgrades, plus archived_at.
+    """
+    cursor.execute("CREATE TABLE IF NOT EXISTS ConversionHistory (id INTEGER PRIMARY KEY, archived_at TIMESTAMP)")
+    cursor.execute("PRAGMA table_info(ConversionQueue)")
+    for _, column, column_type, _, _, _ in cursor.fetchall():
+        if column != "id":
+            add_column_if_missing(cursor, "ConversionHistory", column, column_type or "")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_file_path ON ConversionHistory(file_path)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_status ON ConversionHistory(job_status, archived_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_codec ON ConversionHistory(video_codec)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS SavingsRollup (
+            job_status TEXT NOT NULL,
+            video_codec TEXT NOT NULL,
+            jobs INTEGER NOT NULL DEFAULT 0,
+            original_bytes INTEGER NOT NULL DEFAULT 0,
+            space_saved INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (job_status, video_codec)
+        )
+    """)
+
+
+def get_history_columns(cursor):
+    cursor.execute("PRAGMA table_info(ConversionQueue)")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def archive_finished_jobs(conn=None, progress_callback=None, batch_size=ARCHIVE_BATCH_SIZE,
+                          min_age_minutes=ARCHIVE_MIN_AGE_MINUTES):
+    """Moves finished jobs (ARCHIVE_STATUSES) older than min_age_minutes from ConversionQueue
+    into ConversionHistory, adding their totals to SavingsRollup.
+
+    Each batch is one short BEGIN IMMEDIATE transaction (copy, roll up, delete), so workers
+    and the UI only ever wait for a single batch. The row with the highest id is never
+    archived: ConversionQueue ids are rowids, and SQLite would otherwise hand them out again.
+    A job whose id is already taken in ConversionHistory stays in the queue rather than
+    overwrite the archived row.
+    progress_callback("archive", done, total) is called after every batch.
+    Returns the number of archived jobs.
+    """
+    own_conn = conn is None
+    conn = conn or sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_queue_indexes(cursor)
+    create_history_tables(cursor)
+    conn.commit()
+
+    columns = ", ".join(get_history_columns(cursor))
+    status_list = ", ".join("?" * len(ARCHIVE_STATUSES))
+    cutoff = (datetime.datetime.now() - datetime.timedelta(minutes=min_age_minutes)).strftime("%Y-%m-%d %H:%M:%S")
+    eligible_sql = f"""
+        FROM ConversionQueue
+        WHERE job_status IN ({status_list})
+          AND COALESCE(modification_date, creation_date, '') < ?
+          AND id < (SELECT MAX(id) FROM ConversionQueue)
+          AND id NOT IN (SELECT id FROM ConversionHistory)
+    """
+    cursor.execute(f"SELECT COUNT(*) {eligible_sql}", (*ARCHIVE_STATUSES, cutoff))
+    total = cursor.fetchone()[0]
+
+    archived = 0
+    try:
+        while archived < total:
+            current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)")
+            cursor.execute("DELETE FROM temp.archive_batch")
+            cursor.execute(f"INSERT INTO temp.archive_batch (id) SELECT id {eligible_sql} LIMIT ?",
+                           (*ARCHIVE_STATUSES, cutoff, batch_size))
+            if cursor.rowcount == 0:
+                conn.commit()
+                break
+            moved = cursor.rowcount
+            cursor.execute(f"""
+                INSERT INTO ConversionHistory ({columns}, archived_at)
+                SELECT {columns}, ? FROM ConversionQueue
+                WHERE id IN (SELECT id FROM temp.archive_batch)
+            """, (current_timestamp,))
+            cursor.execute("""
+                INSERT INTO SavingsRollup (job_status, video_codec, jobs, original_bytes, space_saved)
+                SELECT job_status, COALESCE(video_codec, 'unknown'), COUNT(*),
+                       SUM(COALESCE(original_size, file_size, 0)), SUM(COALESCE(space_saved, 0))
+                FROM ConversionQueue
+                WHERE id IN (SELECT id FROM temp.archive_batch)
+                GROUP BY 1, 2
+                ON CONFLICT (job_status, video_codec) DO UPDATE SET
+                    jobs = jobs + excluded.jobs,
+                    original_bytes = original_bytes + excluded.original_bytes,
+                    space_saved = space_saved + excluded.space_saved
+            """)
+            cursor.execute("DELETE FROM ConversionQueue WHERE id IN (SELECT id FROM temp.archive_batch)")
+            conn.commit()
+            archived += moved
+            if progress_callback:
+                progress_callback("archive", archived, total)
+            time.sleep(ARCHIVE_BATCH_PAUSE)
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+    if archived:
+        logging.info(f"Archived {archived} finished jobs into ConversionHistory.")
+    return archived
+
+
+def restore_jobs(job_ids):
+    """Moves archived jobs back into ConversionQueue as 'pending' (e.g. to retry a failed job).
+    Their totals are taken back out of SavingsRollup. Returns the number of restored jobs."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_history_tables(cursor)
+    columns = ", ".join(column for column in get_history_columns(cursor) if column not in ("job_status", "queue_position"))
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS restore_batch (id INTEGER PRIMARY KEY)")
+    cursor.execute("DELETE FROM temp.restore_batch")
+    cursor.executemany("INSERT OR IGNORE INTO temp.restore_batch (id) VALUES (?)", ((job_id,) for job_id in job_ids))
+    cursor.execute("""
+        DELETE FROM temp.restore_batch
+        WHERE id NOT IN (SELECT id FROM ConversionHistory) OR id IN (SELECT id FROM ConversionQueue)
+    """)
+    cursor.execute("""
+        UPDATE SavingsRollup
+        SET jobs = SavingsRollup.jobs - r.jobs,
+            original_bytes = SavingsRollup.original_bytes - r.original_bytes,
+            space_saved = SavingsRollup.space_saved - r.space_saved
+        FROM (
+            SELECT job_status, COALESCE(video_codec, 'unknown') AS video_codec, COUNT(*) AS jobs,
+                   SUM(COALESCE(original_size, file_size, 0)) AS original_bytes, SUM(COALESCE(space_saved, 0)) AS space_saved
+            FROM ConversionHistory WHERE id IN (SELECT id FROM temp.restore_batch)
+            GROUP BY 1, 2
+        ) AS r
+        WHERE SavingsRollup.job_status = r.job_status AND SavingsRollup.video_codec = r.video_codec
+    """)
+    cursor.execute(f"""
+        INSERT INTO ConversionQueue ({columns}, job_status, queue_position)
+        SELECT {columns}, 'pending', NULL FROM ConversionHistory
+        WHERE id IN (SELECT id FROM temp.restore_batch)
+    """)
+    restored = cursor.rowcount
+    cursor.execute("DELETE FROM ConversionHistory WHERE id IN (SELECT id FROM temp.restore_batch)")
+    conn.commit()
+    conn.close()
+    return restored
+
+
+def get_archived_savings():
+    """Returns {job_status: (jobs, original_bytes, space_saved)} of the archived jobs, from SavingsRollup."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_history_tables(cursor)
+    conn.commit()
+    cursor.execute("SELECT job_status, SUM(jobs), SUM(original_bytes), SUM(space_saved) FROM SavingsRollup GROUP BY job_status")
+    totals = {job_status: (jobs, original_bytes, space_saved) for job_status, jobs, original_bytes, space_saved in cursor.fetchall()}
+    conn.close()
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive finished jobs from ConversionQueue into ConversionHistory.")
+    parser.add_argument("--min-age", type=int, default=ARCHIVE_MIN_AGE_MINUTES, help="Minutes a finished job stays in the queue")
+    parser.add_argument("--restore", type=int, nargs="+", metavar="JOB_ID", help="Move these archived jobs back into the queue as pending")
+    args = parser.parse_args(argv)
+    if args.restore:
+        print(f"Restored {restore_jobs(args.restore)} jobs.")
+        return
+    archived = archive_finished_jobs(progress_callback=lambda stage, done, total: print(f"{stage}: {done}/{total}"),
+                                     min_age_minutes=args.min_age)
+    print(f"Archived {archived} jobs.")
+    for job_status, (jobs, original_bytes, space_saved) in sorted(get_archived_savings().items()):
+        print(f"{job_status:<16} {jobs:>9} jobs  {original_bytes / 1024 ** 3:>10.1f} GB original  {space_saved / 1024 ** 3:>10.1f} GB saved")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
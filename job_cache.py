@@ -0,0 +1,162 @@
+import sqlite3
+import numpy as np
+from db_handler import DB_PATH
+
+NO_POSITION = np.iinfo(np.int64).max  # Stored for jobs without a queue_position, so they sort last
+GB = 1024 ** 3
+
+
+def get_job_rows():
+    """Fetches (id, file_name, file_size, job_status, queue_position, video_codec) for every job in ConversionQueue."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, file_name, file_size, job_status, queue_position, video_codec
+        FROM ConversionQueue
+        ORDER BY queue_position IS NULL, queue_position ASC, file_size DESC
+    """)
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+class Interned:
+    """Maps repeated strings (statuses, codecs) to small integer codes."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def codes_matching(self, predicate):
+        return np.array([code for code, value in enumerate(self.values) if predicate(value)], dtype=np.int32)
+
+
+class JobCache:
+    """Columnar, array-backed copy of the job list.
+
+    Sizes, positions and ids are numpy columns; statuses and codecs are interned into small
+    integer codes. File names are kept once as strings for display, plus one lower-cased,
+    newline-joined buffer for substring search. Sorting, filtering and group-by totals work on
+    index arrays (row numbers into the cache), so nothing is re-queried or re-boxed.
+    """
+
+    def __init__(self, rows):
+        count = len(rows)
+        self.statuses = Interned()
+        self.codecs = Interned()
+        self.ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        self.sizes = np.fromiter((row[2] or 0 for row in rows), dtype=np.int64, count=count)
+        self.status_codes = np.fromiter((self.statuses.code(row[3]) for row in rows), dtype=np.int32, count=count)
+        self.positions = np.fromiter((NO_POSITION if row[4] is None else row[4] for row in rows), dtype=np.int64, count=count)
+        self.codec_codes = np.fromiter((self.codecs.code(row[5]) for row in rows), dtype=np.int32, count=count)
+        self.names = [row[1] or "" for row in rows]
+        lowered = [name.lower() for name in self.names]
+        self.search_text = "\n".join(lowered)
+        self.name_lengths = np.fromiter((len(name) for name in lowered), dtype=np.int64, count=count)
+        self.name_offsets = np.cumsum(self.name_lengths + 1) - (self.name_lengths + 1)
+        self.id_order = np.argsort(self.ids, kind="stable")
+        self.name_order = None
+
+    @classmethod
+    def load(cls):
+        return cls(get_job_rows())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def all(self):
+        return np.arange(len(self.ids))
+
+    def row(self, index):
+        """Returns (job_id, file_name, file_size, job_status, queue_position, video_codec) for a cache row."""
+        position = int(self.positions[index])
+        return (
+            int(self.ids[index]), self.names[index], int(self.sizes[index]),
+            self.statuses.values[self.status_codes[index]],
+            None if position == NO_POSITION else position,
+            self.codecs.values[self.codec_codes[index]],
+        )
+
+    def indices_of(self, job_ids):
+        """Returns the cache rows of the given job ids (ids not in the cache are dropped)."""
+        job_ids = np.asarray(job_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.empty(0, dtype=np.int64)
+        found = np.minimum(np.searchsorted(self.ids, job_ids, sorter=self.id_order), len(self.ids) - 1)
+        rows = self.id_order[found]
+        return rows[self.ids[rows] == job_ids]
+
+    def filter(self, search=None, statuses=None, codecs=None, indices=None):
+        """Returns the rows (in the order of `indices`, default cache order) whose file name or
+        status contains `search` (case-insensitive) and whose status / codec is in the given sets."""
+        indices = self.all() if indices is None else np.asarray(indices)
+        mask = np.ones(len(self.ids), dtype=bool)
+        if search:
+            search = search.lower()
+            mask = np.isin(self.status_codes, self.statuses.codes_matching(lambda value: search in (value or "").lower()))
+            mask[self.find_names(search)] = True
+        if statuses is not None:
+            mask &= np.isin(self.status_codes, [self.statuses.codes[value] for value in statuses if value in self.statuses.codes])
+        if codecs is not None:
+            mask &= np.isin(self.codec_codes, [self.codecs.codes[value] for value in codecs if value in self.codecs.codes])
+        return indices[mask[indices]]
+
+    def find_names(self, search):
+        """Returns the rows whose file name contains the lower-cased search text."""
+        hits = []
+        start = self.search_text.find(search)
+        while start != -1:
+            hits.append(start)
+            start = self.search_text.find(search, start + 1)
+        if not hits:
+            return np.empty(0, dtype=np.int64)
+        hits = np.array(hits, dtype=np.int64)
+        rows = np.searchsorted(self.name_offsets, hits, side="right") - 1
+        ends = self.name_offsets[rows] + self.name_lengths[rows]
+        return np.unique(rows[hits + len(search) <= ends])  # Drop matches spanning two names
+
+    def sort(self, column, descending=False, indices=None):
+        """Returns `indices` (default: all rows) stably sorted by 'name', 'size', 'status', 'position' or 'codec'."""
+        indices = self.all() if indices is None else np.asarray(indices)
+        if column == "name":
+            if self.name_order is None:
+                self.name_order = np.empty(len(self.names), dtype=np.int64)
+                self.name_order[sorted(range(len(self.names)), key=lambda row: self.names[row].lower())] = np.arange(len(self.names))
+            keys = self.name_order
+        elif column == "size":
+            keys = self.sizes
+        elif column == "position":
+            keys = self.positions
+        elif column in ("status", "codec"):
+            interned, codes = (self.statuses, self.status_codes) if column == "status" else (self.codecs, self.codec_codes)
+            rank = np.empty(len(interned.values), dtype=np.int32)
+            rank[sorted(range(len(interned.values)), key=lambda code: str(interned.values[code]))] = np.arange(len(interned.values))
+            keys = rank[codes]
+        else:
+            raise ValueError(f"Unknown sort column {column}")
+        order = np.argsort(keys[indices], kind="stable")
+        if descending:
+            order = order[::-1]
+        return indices[order]
+
+    def group_totals(self, by="codec", indices=None):
+        """Returns {status or codec: (jobs, bytes)} over `indices` (default: all rows)."""
+        indices = self.all() if indices is None else np.asarray(indices)
+        interned, codes = (self.codecs, self.codec_codes) if by == "codec" else (self.statuses, self.status_codes)
+        counts = np.bincount(codes[indices], minlength=len(interned.values))
+        totals = np.bincount(codes[indices], weights=self.sizes[indices], minlength=len(interned.values))
+        return {interned.values[code]: (int(counts[code]), int(totals[code])) for code in np.flatnonzero(counts)}
+
+    def memory_bytes(self):
+        """Approximate memory of the cache (numpy columns, names and the search buffer)."""
+        arrays = (self.ids, self.sizes, self.status_codes, self.positions, self.codec_codes,
+                  self.name_lengths, self.name_offsets, self.id_order)
+        return (sum(array.nbytes for array in arrays) + len(self.search_text)
+                + sum(len(name) + 49 for name in self.names))
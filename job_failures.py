@@ -0,0 +1,261 @@
+import sys
+import sqlite3
+import logging
+import argparse
+import datetime
+from db_handler import DB_PATH, add_column_if_missing
+
+# Failed attempts after which a job is quarantined, per error class
+QUARANTINE_AFTER = {
+    "missing": 1,       # Source file not found
+    "source": 2,        # Corrupt or undecodable source
+    "encoder": 3,       # ffmpeg failed for another reason
+    "verification": 3,  # Output failed verification
+    "publish": 5,       # Upload to the library failed
+    "transient": 6,     # Database locked, network errors, timeouts
+    "unknown": 3,
+}
+RETRY_BASE_SECONDS = 300        # Backoff after the first failure; doubles with every further failure
+RETRY_MAX_SECONDS = 6 * 3600    # Longest backoff between attempts
+FAILURE_REPORT_DAYS = 30        # Attempts considered by get_failure_rates
+
+# ffmpeg / ffprobe messages that point at the source file rather than the encoder
+SOURCE_ERROR_PATTERNS = [
+    "invalid data found when processing input",
+    "moov atom not found",
+    "could not find codec parameters",
+    "error while decoding",
+    "invalid nal unit",
+    "corrupt",
+    "truncat",
+    "end of file",
+]
+
+
+def create_failure_columns(cursor):
+    """Adds the retry columns to ConversionQueue and creates the JobAttempts table."""
+    add_column_if_missing(cursor, "ConversionQueue", "attempt_count", "INTEGER NOT NULL DEFAULT 0")
+    add_column_if_missing(cursor, "ConversionQueue", "last_error", "TEXT")
+    add_column_if_missing(cursor, "ConversionQueue", "error_class", "TEXT")
+    add_column_if_missing(cursor, "ConversionQueue", "next_attempt_at", "TIMESTAMP")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS JobAttempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            worker_id TEXT,
+            outcome TEXT NOT NULL,
+            error_class TEXT,
+            error TEXT,
+            video_codec TEXT,
+            container_format TEXT,
+            attempted_at TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_attempts_job ON JobAttempts(job_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_attempts_time ON JobAttempts(attempted_at)")
+
+
+def classify_error(error):
+    """Maps an exception or error message to an error class (a key of QUARANTINE_AFTER)."""
+    if isinstance(error, FileNotFoundError):
+        return "missing"
+    if isinstance(error, (sqlite3.OperationalError, TimeoutError, ConnectionError)):
+        return "transient"
+    message = str(error).lower()
+    if "no such file or directory" in message:
+        return "missing"
+    if any(pattern in message for pattern in SOURCE_ERROR_PATTERNS):
+        return "source"
+    if "ffmpeg" in message:
+        return "encoder"
+    return "unknown"
+
+
+def get_retry_delay(attempt_count):
+    """Seconds to wait before the next attempt after attempt_count failures."""
+    return min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempt_count - 1))
+
+
+def insert_attempt(cursor, job_id, worker_id, outcome, error_class=None, error=None):
+    current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        INSERT INTO JobAttempts (job_id, worker_id, outcome, error_class, error, video_codec, container_format, attempted_at)
+        SELECT id, ?, ?, ?, ?, video_codec, container_format, ?
+        FROM ConversionQueue WHERE id = ?
+    """, (worker_id, outcome, error_class, error, current_timestamp, job_id))
+
+
+def record_job_attempt(job_id, worker_id, outcome):
+    """Records a successful attempt ('completed', 'not_worthwhile') in JobAttempts, for the failure rates."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_failure_columns(cursor)
+    insert_attempt(cursor, job_id, worker_id, outcome)
+    conn.commit()
+    conn.close()
+
+
+def record_job_failure(job_id, worker_id, error, error_class=None):
+    """Records a failed attempt and hands the job back to the queue with a retry backoff.
+
+    The job keeps its queue_position but is not claimed before next_attempt_at
+    (RETRY_BASE_SECONDS, doubling per failure up to RETRY_MAX_SECONDS), so a bad file at the
+    head of the queue doesn't get claimed by every worker in turn. After QUARANTINE_AFTER
+    failures of its error class the job is set to 'quarantined' and leaves the queue.
+    Only applies while the job is still Processing on worker_id (checked in the same
+    write transaction as the update).
+    Returns the new job_status, or None if the job was no longer held by the worker.
+    """
+    error_class = error_class or classify_error(error)
+    message = str(error)[-2000:]
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_failure_columns(cursor)
+    conn.commit()
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("""
+        SELECT attempt_count + 1 FROM ConversionQueue
+        WHERE id = ? AND job_status = 'Processing' AND processing_workerID IS ?
+    """, (job_id, worker_id))
+    row = cursor.fetchone()
+    if row is None:
+        conn.rollback()
+        conn.close()
+        return None
+    attempt_count = row[0]
+    quarantined = attempt_count >= QUARANTINE_AFTER.get(error_class, QUARANTINE_AFTER["unknown"])
+    next_attempt_at = (datetime.datetime.now() + datetime.timedelta(seconds=get_retry_delay(attempt_count))).strftime("%Y-%m-%d %H:%M:%S")
+
+    insert_attempt(cursor, job_id, worker_id, "failed", error_class, message)
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET job_status = ?,
+            queue_position = CASE WHEN ? THEN NULL ELSE queue_position END,
+            processing_workerID = NULL,
+            attempt_count = ?,
+            last_error = ?,
+            error_class = ?,
+            next_attempt_at = ?,
+            modification_date = CURRENT_TIMESTAMP
+        WHERE id = ? AND job_status = 'Processing' AND processing_workerID IS ?
+    """, ("quarantined" if quarantined else "queued", quarantined, attempt_count, message, error_class,
+          None if quarantined else next_attempt_at, job_id, worker_id))
+    conn.commit()
+    conn.close()
+    if quarantined:
+        logging.warning(f"Job {job_id} quarantined after {attempt_count} failed attempts ({error_class}): {message[-300:]}",
+                        extra={"job_id": job_id})
+    else:
+        logging.info(f"Job {job_id} failed ({error_class}), attempt {attempt_count}; retry after {next_attempt_at}.",
+                     extra={"job_id": job_id})
+    return "quarantined" if quarantined else "queued"
+
+
+def release_quarantined_jobs(job_ids):
+    """Puts quarantined jobs back in the queue (at the end) with their attempt count reset.
+    Returns the number of released jobs."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_failure_columns(cursor)
+    cursor.execute("SELECT COALESCE(MAX(queue_position), 0) FROM ConversionQueue")
+    highest_position = cursor.fetchone()[0]
+    released = 0
+    for job_id in job_ids:
+        cursor.execute("""
+            UPDATE ConversionQueue
+            SET job_status = 'queued', queue_position = ?, attempt_count = 0, next_attempt_at = NULL,
+                modification_date = CURRENT_TIMESTAMP
+            WHERE id = ? AND job_status = 'quarantined'
+        """, (highest_position + released + 1, job_id))
+        released += cursor.rowcount
+    conn.commit()
+    conn.close()
+    return released
+
+
+def get_quarantined_jobs():
+    """Returns [(id, file_name, video_codec, container_format, attempt_count, error_class, last_error)]."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_failure_columns(cursor)
+    conn.commit()
+    cursor.execute("""
+        SELECT id, file_name, video_codec, container_format, attempt_count, error_class, last_error
+        FROM ConversionQueue
+        WHERE job_status = 'quarantined'
+        ORDER BY modification_date DESC
+    """)
+    jobs = cursor.fetchall()
+    conn.close()
+    return jobs
+
+
+def get_failure_rates(days=FAILURE_REPORT_DAYS):
+    """Returns per video codec and container over the last days:
+    (video_codec, container_format, attempts, failures, failure_rate, jobs_quarantined, top_error_class),
+    highest failure rate first."""
+    since = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_failure_columns(cursor)
+    conn.commit()
+    cursor.execute("""
+        WITH attempts AS (
+            SELECT video_codec, container_format, outcome, error_class
+            FROM JobAttempts
+            WHERE attempted_at >= ?
+        ),
+        top_errors AS (
+            SELECT video_codec, container_format, error_class,
+                   ROW_NUMBER() OVER (PARTITION BY video_codec, container_format ORDER BY COUNT(*) DESC) AS error_rank
+            FROM attempts
+            WHERE outcome = 'failed'
+            GROUP BY video_codec, container_format, error_class
+        ),
+        quarantined AS (
+            SELECT video_codec, container_format, COUNT(*) AS jobs
+            FROM ConversionQueue
+            WHERE job_status = 'quarantined'
+            GROUP BY video_codec, container_format
+        )
+        SELECT a.video_codec, a.container_format, COUNT(*),
+               SUM(a.outcome = 'failed'),
+               1.0 * SUM(a.outcome = 'failed') / COUNT(*),
+               COALESCE(MAX(q.jobs), 0),
+               MAX(t.error_class)
+        FROM attempts AS a
+        LEFT JOIN quarantined AS q ON q.video_codec IS a.video_codec AND q.container_format IS a.container_format
+        LEFT JOIN top_errors AS t ON t.video_codec IS a.video_codec AND t.container_format IS a.container_format AND t.error_rank = 1
+        GROUP BY a.video_codec, a.container_format
+        ORDER BY 5 DESC, 3 DESC
+    """, (since,))
+    rates = cursor.fetchall()
+    conn.close()
+    return rates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Failed and quarantined conversion jobs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Failure rates per video codec and container")
+    report_parser.add_argument("--days", type=int, default=FAILURE_REPORT_DAYS)
+    subparsers.add_parser("quarantined", help="List quarantined jobs")
+    release_parser = subparsers.add_parser("release", help="Put quarantined jobs back in the queue")
+    release_parser.add_argument("job_ids", type=int, nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        print(f"{'codec':<12} {'container':<10} {'attempts':>9} {'failed':>7} {'rate':>7} {'quarantined':>12}  top error")
+        for video_codec, container_format, attempts, failures, rate, quarantined, top_error in get_failure_rates(args.days):
+            print(f"{video_codec or '-':<12} {container_format or '-':<10} {attempts:>9} {failures:>7} {rate:>7.1%} "
+                  f"{quarantined:>12}  {top_error or '-'}")
+    elif args.command == "quarantined":
+        for job_id, file_name, video_codec, container_format, attempt_count, error_class, last_error in get_quarantined_jobs():
+            print(f"{job_id:>8}  {file_name}  [{video_codec}/{container_format}] {attempt_count} attempts, {error_class}: "
+                  f"{(last_error or '').splitlines()[-1] if last_error else ''}")
+    elif args.command == "release":
+        print(f"Released {release_quarantined_jobs(args.job_ids)} jobs.")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+import sqlite3
+from db_handler import DB_PATH, add_column_if_missing
+
+# Video codecs that are already efficient; these files are only remuxed if their container needs changing
+EFFICIENT_VIDEO_CODECS = {"hevc", "h265", "av1", "vp9"}
+
+# Audio codecs copied as-is; anything else (pcm_*, wmav2, mp2, flac, ...) is transcoded to AAC
+EFFICIENT_AUDIO_CODECS = {"aac", "opus", "ac3", "eac3", "mp3", "vorbis", "dts", "truehd"}
+
+# Containers that don't need changing (substrings of ffprobe format names such as "matroska,webm")
+PREFERRED_CONTAINERS = ("matroska", "mkv", "webm", "mp4", "m4v")
+
+# Containers whose text subtitles (mov_text) can't be copied into Matroska and are converted to SRT
+MP4_CONTAINERS = ("mp4", "m4v", "mov")
+
+# Relative cost of a remux compared to a full encode of the same duration (disk speed)
+REMUX_COST_FACTOR = 0.02
+
+
+def preferred_container_sql(column):
+    """SQL condition that is true when the container column holds a preferred container."""
+    return "(" + " OR ".join(f"lower({column}) LIKE '%{name}%'" for name in PREFERRED_CONTAINERS) + ")"
+
+
+def needs_job_sql(codec_column, container_column):
+    """SQL condition selecting files that need a transcode or a remux-only job."""
+    efficient = ", ".join(f"'{codec}'" for codec in sorted(EFFICIENT_VIDEO_CODECS))
+    return (
+        f"{codec_column} IS NOT NULL AND {codec_column} != '' "
+        f"AND (lower({codec_column}) NOT IN ({efficient}) "
+        f"OR NOT {preferred_container_sql(container_column)})"
+    )
+
+
+def create_plan_columns(cursor):
+    """Adds the per-stream plan columns to ConversionQueue if missing."""
+    add_column_if_missing(cursor, "ConversionQueue", "job_type", "TEXT")         # 'transcode' or 'remux'
+    add_column_if_missing(cursor, "ConversionQueue", "video_action", "TEXT")     # 'transcode' or 'copy'
+    add_column_if_missing(cursor, "ConversionQueue", "audio_action", "TEXT")     # 'transcode' or 'copy'
+    add_column_if_missing(cursor, "ConversionQueue", "subtitle_action", "TEXT")  # 'copy' or 'convert'
+
+
+def plan_job(video_codec, container_format, audio_codec):
+    """Decides per stream what a job needs.
+
+    Efficient video is copied and the job becomes a remux; audio is copied if every track
+    uses an efficient codec; text subtitles from MP4-family containers are converted to SRT.
+    Returns a dictionary with job_type, video_action, audio_action and subtitle_action.
+    """
+    video_copy = (video_codec or "").lower() in EFFICIENT_VIDEO_CODECS
+    audio_codecs = [codec.strip().lower() for codec in (audio_codec or "").split(",") if codec.strip()]
+    audio_copy = all(codec in EFFICIENT_AUDIO_CODECS for codec in audio_codecs)
+    container = (container_format or "").lower()
+    subtitle_convert = any(name in container for name in MP4_CONTAINERS)
+
+    return {
+        "job_type": "remux" if video_copy else "transcode",
+        "video_action": "copy" if video_copy else "transcode",
+        "audio_action": "copy" if audio_copy else "transcode",
+        "subtitle_action": "convert" if subtitle_convert else "copy",
+    }
+
+
+def plan_claimed_job(job):
+    """Plans a claimed job that has no plan yet (queued before the pipeline's plan stage ran).
+
+    The plan is stored on the ConversionQueue row and copied into the job dictionary, so
+    efficient video in another container is remuxed instead of re-encoded. Returns the job.
+    """
+    if job.get("job_type") is not None:
+        return job
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT video_codec, container_format, audio_codec FROM ConversionQueue WHERE id = ?", (job["id"],))
+    row = cursor.fetchone()
+    if row is None:
+        conn.close()
+        return job
+    plan = plan_job(*row)
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET job_type = ?, video_action = ?, audio_action = ?, subtitle_action = ?
+        WHERE id = ? AND job_type IS NULL
+    """, (plan["job_type"], plan["video_action"], plan["audio_action"], plan["subtitle_action"], job["id"]))
+    conn.commit()
+    conn.close()
+    job.update(job_type=plan["job_type"], audio_action=plan["audio_action"], subtitle_action=plan["subtitle_action"])
+    return job
+
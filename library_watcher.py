@@ -0,0 +1,370 @@
+import os
+import sys
+import json
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import sqlite3
+import datetime
+import logging
+import argparse
+import subprocess
+import threading
+from db_handler import DB_PATH
+from processing_pipeline import run_pipeline
+
+# Files the watcher picks up
+MEDIA_EXTENSIONS = {".mkv", ".mp4", ".m4v", ".avi", ".mov", ".wmv", ".mpg", ".mpeg", ".ts", ".m2ts", ".flv", ".webm"}
+
+DEBOUNCE_SECONDS = 30      # A file must be quiet (no events, same size) this long before it is probed
+RESCAN_INTERVAL = 3600     # Seconds between fallback rescans of the library roots
+EVENT_TIMEOUT = 1.0        # Seconds to wait for inotify events per loop
+PROBE_RETRY_SECONDS = 600  # Seconds before a file whose probe failed is tried again
+
+# inotify constants (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def is_media_file(path):
+    return os.path.splitext(path)[1].lower() in MEDIA_EXTENSIONS
+
+
+class Inotify:
+    """Minimal ctypes wrapper around the Linux inotify API with recursive directory watches."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or libc_name is None:
+            raise OSError("inotify is only available on Linux")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # watch descriptor -> directory
+
+    def add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            logging.warning(f"Cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+            return
+        self.watches[wd] = directory
+
+    def add_tree(self, root):
+        """Watches root and every directory below it. Returns the media files already inside."""
+        files = []
+        for directory, _, names in os.walk(root):
+            self.add_watch(directory)
+            files.extend(os.path.join(directory, name) for name in names if is_media_file(name))
+        return files
+
+    def read_events(self, timeout):
+        """Returns a list of (path, mask) events, waiting at most timeout seconds."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if mask & IN_Q_OVERFLOW or directory is None:
+                events.append((None, mask))
+                continue
+            events.append((os.path.join(directory, os.fsdecode(name)) if name else directory, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher_tables(cursor):
+    """Creates the DirectoryIndex table (directory mtimes seen by the last rescan) and a file_path index on FileRecords."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS DirectoryIndex (
+            dir_path TEXT PRIMARY KEY,
+            mtime REAL NOT NULL,
+            scanned_at TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_records_path ON FileRecords(file_path)")
+
+
+def get_known_sizes(cursor, directory):
+    """Returns {file_path: file_size} for FileRecords directly inside directory (index range scan)."""
+    prefix = os.path.join(directory, "")
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    cursor.execute("SELECT file_path, file_size FROM FileRecords WHERE file_path >= ? AND file_path < ?", (prefix, upper))
+    return {path: size for path, size in cursor.fetchall() if os.path.dirname(path) == directory}
+
+
+def rescan_roots(roots):
+    """Finds new or resized media files by walking only directories whose mtime changed.
+
+    Directory mtimes are kept in DirectoryIndex; a directory's mtime changes when entries are
+    added, removed or renamed, so unchanged directories are skipped without listing their
+    files. Returns (files to probe, {directory: mtime} of the changed directories). The
+    mtimes are not stored here: pass them to store_directory_mtimes once the directory's
+    files have been recorded, so a file that is still being written or fails to probe is
+    found again by the next rescan.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_watcher_tables(cursor)
+    cursor.execute("SELECT dir_path, mtime FROM DirectoryIndex")
+    known_mtimes = dict(cursor.fetchall())
+
+    changed_files = []
+    changed_dirs = {}
+    stack = list(roots)
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+            mtime = os.stat(directory).st_mtime
+        except OSError as e:
+            logging.warning(f"Cannot scan {directory}: {e}")
+            continue
+        stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+        if known_mtimes.get(directory) == mtime:
+            continue
+
+        known_sizes = get_known_sizes(cursor, directory)
+        for entry in entries:
+            if entry.is_file() and is_media_file(entry.name):
+                if known_sizes.get(entry.path) != entry.stat().st_size:
+                    changed_files.append(entry.path)
+        changed_dirs[directory] = mtime
+
+    conn.close()
+    logging.info(f"Rescan found {len(changed_files)} new or changed files in {len(changed_dirs)} changed directories.")
+    return changed_files, changed_dirs
+
+
+def store_directory_mtimes(dir_mtimes):
+    """Stores {directory: mtime} in DirectoryIndex so later rescans skip those directories until they change."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_watcher_tables(cursor)
+    current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor.executemany("INSERT OR REPLACE INTO DirectoryIndex (dir_path, mtime, scanned_at) VALUES (?, ?, ?)",
+                       [(directory, mtime, current_timestamp) for directory, mtime in dir_mtimes.items()])
+    conn.commit()
+    conn.close()
+
+
+def probe_file_record(path):
+    """Runs a lightweight ffprobe (selected entries only) and returns the FileRecords fields for a file."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-print_format", "json",
+         "-show_entries", "format=format_name,duration:stream=codec_type,codec_name,width,height,bit_rate,channels,sample_rate"
+                          ":stream_tags=language:stream_disposition=attached_pic",
+         path],
+        capture_output=True, text=True, check=True
+    )
+    info = json.loads(result.stdout)
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"
+                  and not s.get("disposition", {}).get("attached_pic")), {})
+    audio = [s for s in streams if s.get("codec_type") == "audio"]
+    languages = [s.get("tags", {}).get("language") for s in audio]
+
+    return {
+        "video_codec": video.get("codec_name"),
+        "resolution": f"{video['width']}x{video['height']}" if video.get("width") else None,
+        "duration": float(info.get("format", {}).get("duration") or 0),
+        "video_bitrate": int(video["bit_rate"]) if video.get("bit_rate") else None,
+        "audio_codec": ",".join(s.get("codec_name", "") for s in audio) or None,
+        "audio_channels": audio[0].get("channels") if audio else None,
+        "audio_sample_rate": int(audio[0]["sample_rate"]) if audio and audio[0].get("sample_rate") else None,
+        "audio_languages": ",".join(language for language in languages if language) or None,
+        "file_format": info.get("format", {}).get("format_name"),
+    }
+
+
+def record_files(paths, roots):
+    """Probes files and inserts or updates their FileRecords rows, then runs the processing pipeline.
+
+    Updates fire the FileRecords change trigger and inserts get a new rowid, so the pipeline
+    only processes these files. Returns (number of files recorded, paths that could not be
+    probed) so the caller can retry the failed ones.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    recorded = 0
+    failed = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            fields = probe_file_record(path)
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            logging.warning(f"Could not probe {path}: {e}")
+            failed.append(path)
+            continue
+
+        root = next((r for r in roots if path.startswith(os.path.join(r, ""))), os.path.dirname(path))
+        current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        fields.update({
+            "file_name": os.path.basename(path),
+            "file_size": stat.st_size,
+            "file_modified": datetime.datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
+            "last_scanned": current_timestamp,
+            "top_folder": os.path.basename(os.path.normpath(root)),
+        })
+        columns = list(fields)
+        cursor.execute(
+            f"UPDATE FileRecords SET {', '.join(f'{column} = ?' for column in columns)} WHERE file_path = ?",
+            [fields[column] for column in columns] + [path]
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                f"INSERT INTO FileRecords (file_path, {', '.join(columns)}) VALUES (?, {', '.join('?' for _ in columns)})",
+                [path] + [fields[column] for column in columns]
+            )
+        conn.commit()
+        recorded += 1
+        logging.info(f"Recorded {path}")
+    conn.close()
+
+    if recorded:
+        run_pipeline()
+    return recorded, failed
+
+
+def watch_library(roots, stop_event=None, debounce=DEBOUNCE_SECONDS, rescan_interval=RESCAN_INTERVAL):
+    """Watches the library roots and records new or changed media files until stop_event is set.
+
+    inotify events mark files as pending; a pending file is probed once it has had no events
+    for debounce seconds and its size is stable. A periodic rescan (and an inotify queue
+    overflow) catches anything inotify missed, e.g. changes made over a network share.
+    Files whose probe fails are retried after PROBE_RETRY_SECONDS. A rescanned directory's
+    mtime is only stored once none of its files are pending or failed.
+    Without inotify (non-Linux) only the periodic rescan runs.
+    """
+    stop_event = stop_event or threading.Event()
+    roots = [os.path.abspath(root) for root in roots]
+    pending = {}  # path -> (last event time, size at that time)
+    failed = {}  # path -> time of the next probe attempt
+    unsettled_dirs = {}  # rescanned directory -> mtime, stored once its files are recorded
+
+    def mark_pending(paths):
+        now = time.monotonic()
+        for path in paths:
+            try:
+                pending[path] = (now, os.path.getsize(path))
+            except OSError:
+                pending.pop(path, None)
+
+    try:
+        inotify = Inotify()
+        for root in roots:
+            inotify.add_tree(root)
+        logging.info(f"Watching {len(inotify.watches)} directories under {', '.join(roots)}")
+    except OSError as e:
+        logging.warning(f"inotify unavailable ({e}); using periodic rescans only")
+        inotify = None
+
+    next_rescan = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            if time.monotonic() >= next_rescan:
+                changed_files, changed_dirs = rescan_roots(roots)
+                mark_pending(changed_files)
+                unsettled_dirs.update(changed_dirs)
+                next_rescan = time.monotonic() + rescan_interval
+
+            retry = [path for path, retry_at in failed.items() if time.monotonic() >= retry_at]
+            for path in retry:
+                del failed[path]
+            mark_pending(retry)
+
+            if inotify is not None:
+                for path, mask in inotify.read_events(EVENT_TIMEOUT):
+                    if path is None:
+                        next_rescan = 0  # Queue overflow or unknown watch: fall back to a rescan
+                    elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        mark_pending(inotify.add_tree(path))
+                    elif not mask & IN_ISDIR and is_media_file(path):
+                        mark_pending([path])
+            else:
+                stop_event.wait(EVENT_TIMEOUT)
+
+            # Probe files that have been quiet for the debounce period and did not change size
+            now = time.monotonic()
+            ready = []
+            for path, (last_event, size) in list(pending.items()):
+                if now - last_event < debounce:
+                    continue
+                try:
+                    current_size = os.path.getsize(path)
+                except OSError:
+                    del pending[path]
+                    continue
+                if current_size == size:
+                    ready.append(path)
+                    del pending[path]
+                else:
+                    pending[path] = (now, current_size)
+            if ready:
+                _, ready_failed = record_files(ready, roots)
+                for path in ready_failed:
+                    failed[path] = time.monotonic() + PROBE_RETRY_SECONDS
+
+            if unsettled_dirs:
+                busy = {os.path.dirname(path) for path in pending} | {os.path.dirname(path) for path in failed}
+                settled = {d: mtime for d, mtime in unsettled_dirs.items() if d not in busy}
+                if settled:
+                    store_directory_mtimes(settled)
+                    for directory in settled:
+                        del unsettled_dirs[directory]
+    finally:
+        if inotify is not None:
+            inotify.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch library roots and record new media files as they arrive.")
+    parser.add_argument("--root", action="append", required=True, help="Library root to watch (repeatable)")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS)
+    parser.add_argument("--rescan-interval", type=float, default=RESCAN_INTERVAL)
+    parser.add_argument("--once", action="store_true", help="Run a single rescan and exit")
+    args = parser.parse_args(argv)
+
+    if args.once:
+        roots = [os.path.abspath(root) for root in args.root]
+        changed_files, changed_dirs = rescan_roots(roots)
+        recorded, failed = record_files(changed_files, roots)
+        busy = {os.path.dirname(path) for path in failed}
+        store_directory_mtimes({d: mtime for d, mtime in changed_dirs.items() if d not in busy})
+        print(f"Recorded {recorded} files, {len(failed)} could not be probed.")
+        return
+    try:
+        watch_library(args.root, debounce=args.debounce, rescan_interval=args.rescan_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    main()
@@ -0,0 +1,305 @@
+import os
+import json
+import sqlite3
+import datetime
+import logging
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from db_handler import DB_PATH
+
+# Verification settings
+DURATION_TOLERANCE = 1.0    # Max allowed difference between source and output duration (seconds)
+SAMPLE_COUNT = 4            # Number of segments decoded for PSNR/SSIM
+SAMPLE_SECONDS = 5          # Length of each sampled segment (seconds)
+MIN_PSNR = 35.0             # Average PSNR (dB) a sample must reach
+MIN_SSIM = 0.95             # Average SSIM a sample must reach
+VERIFY_WORKERS = 2          # Parallel verifications per worker machine
+
+
+def create_verification_table(cursor):
+    """Creates the VerificationResults table if it does not exist yet."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS VerificationResults (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            output_path TEXT,
+            output_size INTEGER,
+            source_duration REAL,
+            output_duration REAL,
+            duration_ok INTEGER,
+            streams_ok INTEGER,
+            psnr REAL,
+            ssim REAL,
+            samples INTEGER,
+            passed INTEGER,
+            details TEXT,
+            verified_at TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_verification_job ON VerificationResults(job_id)")
+
+
+def probe_media(path):
+    """Runs ffprobe on a file and returns its duration and stream counts.
+
+    Returns a dictionary with duration (seconds) and the number of video, audio and
+    subtitle streams. Cover art is reported as a video stream by ffprobe, so attached
+    pictures are not counted.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+        capture_output=True, text=True, check=True
+    )
+    info = json.loads(result.stdout)
+
+    counts = {"video": 0, "audio": 0, "subtitle": 0}
+    for stream in info.get("streams", []):
+        codec_type = stream.get("codec_type")
+        if codec_type not in counts:
+            continue
+        if codec_type == "video" and stream.get("disposition", {}).get("attached_pic"):
+            continue
+        counts[codec_type] += 1
+
+    duration = info.get("format", {}).get("duration")
+    return {
+        "duration": float(duration) if duration else None,
+        "streams": counts,
+        "size": int(info.get("format", {}).get("size") or 0),
+    }
+
+
+def get_sample_offsets(duration, sample_count=SAMPLE_COUNT, sample_seconds=SAMPLE_SECONDS):
+    """Returns evenly spaced start offsets (seconds) for the sampled segments."""
+    if not duration or duration <= sample_seconds:
+        return [0.0]
+    offsets = []
+    for i in range(sample_count):
+        start = duration * (i + 1) / (sample_count + 1) - sample_seconds / 2
+        offsets.append(round(max(0.0, min(start, duration - sample_seconds)), 3))
+    return offsets
+
+
+def parse_quality_metrics(stderr):
+    """Extracts the average PSNR and SSIM values from ffmpeg's psnr/ssim filter output."""
+    psnr = None
+    ssim = None
+    for line in stderr.splitlines():
+        if "PSNR" in line and "average:" in line:
+            value = line.split("average:")[1].split()[0]
+            psnr = float("inf") if value == "inf" else float(value)
+        elif "SSIM" in line and "All:" in line:
+            ssim = float(line.split("All:")[1].split()[0])
+    return psnr, ssim
+
+
+def measure_sample_quality(source_path, output_path, offset, sample_seconds=SAMPLE_SECONDS, output_offset=None):
+    """Decodes one segment of the source and the output and compares them with PSNR/SSIM.
+
+    Both inputs are seeked on the input side so only the sampled segment is decoded.
+    output_offset defaults to offset; pass 0 when the output is a sample that starts at offset.
+    Returns a (psnr, ssim) tuple.
+    """
+    if output_offset is None:
+        output_offset = offset
+    lavfi = (
+        "[0:v]setpts=PTS-STARTPTS,split[d1][d2];"
+        "[1:v]setpts=PTS-STARTPTS,split[r1][r2];"
+        "[d1][r1]psnr;[d2][r2]ssim"
+    )
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats",
+         "-ss", str(output_offset), "-t", str(sample_seconds), "-i", output_path,
+         "-ss", str(offset), "-t", str(sample_seconds), "-i", source_path,
+         "-lavfi", lavfi, "-f", "null", "-"],
+        capture_output=True, text=True, check=True
+    )
+    return parse_quality_metrics(result.stderr)
+
+
+def get_source_row(job_id):
+    """Fetches the source file path and duration stored for a job in ConversionQueue."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT file_path, duration FROM ConversionQueue WHERE id = ?", (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+
+def verify_output(job_id, output_path):
+    """Verifies an encoded output against its source job.
+
+    Checks the container duration against the duration stored on the source row, compares
+    stream counts with the source file and decodes a handful of sampled segments to compute
+    PSNR/SSIM. Returns a result dictionary; result["passed"] is True only if every check passed.
+    """
+    row = get_source_row(job_id)
+    if row is None:
+        raise ValueError(f"Job {job_id} not found in ConversionQueue.")
+    source_path, row_duration = row
+
+    result = {
+        "job_id": job_id,
+        "output_path": output_path,
+        "output_size": os.path.getsize(output_path),
+        "psnr": None,
+        "ssim": None,
+        "samples": 0,
+        "details": [],
+    }
+
+    source_info = probe_media(source_path)
+    output_info = probe_media(output_path)
+
+    # Duration check against the source row, falling back to the probed source duration
+    try:
+        source_duration = float(row_duration) if row_duration else source_info["duration"]
+    except (TypeError, ValueError):
+        source_duration = source_info["duration"]
+    result["source_duration"] = source_duration
+    result["output_duration"] = output_info["duration"]
+    result["duration_ok"] = (
+        source_duration is not None
+        and output_info["duration"] is not None
+        and abs(source_duration - output_info["duration"]) <= DURATION_TOLERANCE
+    )
+    if not result["duration_ok"]:
+        result["details"].append(f"duration mismatch: source={source_duration} output={output_info['duration']}")
+
+    # Stream count check
+    result["streams_ok"] = source_info["streams"] == output_info["streams"]
+    if not result["streams_ok"]:
+        result["details"].append(f"stream mismatch: source={source_info['streams']} output={output_info['streams']}")
+
+    # Sampled quality check (skipped if the container checks already failed)
+    if result["duration_ok"] and result["streams_ok"] and source_info["streams"]["video"]:
+        psnr_values = []
+        ssim_values = []
+        for offset in get_sample_offsets(source_duration):
+            psnr, ssim = measure_sample_quality(source_path, output_path, offset)
+            if psnr is not None:
+                psnr_values.append(psnr)
+            if ssim is not None:
+                ssim_values.append(ssim)
+            if (psnr is not None and psnr < MIN_PSNR) or (ssim is not None and ssim < MIN_SSIM):
+                result["details"].append(f"low quality at {offset}s: psnr={psnr} ssim={ssim}")
+        result["samples"] = max(len(psnr_values), len(ssim_values))
+        result["psnr"] = min(psnr_values) if psnr_values else None
+        result["ssim"] = min(ssim_values) if ssim_values else None
+
+    result["passed"] = (
+        result["duration_ok"]
+        and result["streams_ok"]
+        and result["samples"] > 0
+        and not result["details"]
+    )
+    return result
+
+
+def store_verification_result(result):
+    """Stores a verification result for its job in VerificationResults."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_verification_table(cursor)
+    current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        INSERT INTO VerificationResults (
+            job_id, output_path, output_size, source_duration, output_duration,
+            duration_ok, streams_ok, psnr, ssim, samples, passed, details, verified_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        result["job_id"], result["output_path"], result.get("output_size"),
+        result.get("source_duration"), result.get("output_duration"),
+        int(bool(result.get("duration_ok"))), int(bool(result.get("streams_ok"))),
+        result.get("psnr"), result.get("ssim"), result.get("samples", 0),
+        int(bool(result.get("passed"))), "; ".join(result.get("details", [])), current_timestamp
+    ))
+    conn.commit()
+    conn.close()
+
+
+def failed_result(job_id, output_path, error, error_class="verification"):
+    """Result dictionary for a verification that could not run or be recorded.
+    error_class 'transient' marks failures of the database or the pool rather than of the output."""
+    return {"job_id": job_id, "output_path": output_path, "passed": False,
+            "details": [f"verification error: {error}"], "error_class": error_class}
+
+
+def run_verification(job_id, output_path):
+    """Verifies an output and stores the result. Runs inside a VerificationPool process."""
+    try:
+        result = verify_output(job_id, output_path)
+        store_verification_result(result)
+    except sqlite3.Error as e:
+        result = failed_result(job_id, output_path, e, "transient")
+    except Exception as e:
+        result = failed_result(job_id, output_path, e)
+    logging.info(f"Verification for job {job_id}: {'passed' if result['passed'] else 'failed'} {result['details']}",
+                 extra={"job_id": job_id})
+    return result
+
+
+def get_latest_verification(job_id):
+    """Returns (passed, psnr, ssim, details) for the most recent verification of a job, or None."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_verification_table(cursor)
+    cursor.execute("""
+        SELECT passed, psnr, ssim, details
+        FROM VerificationResults
+        WHERE job_id = ?
+        ORDER BY id DESC
+        LIMIT 1
+    """, (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+
+def restore_affinity(cpus):
+    """Pool initializer: undoes the CPU pinning inherited from the encode slot that started the process."""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+
+class VerificationPool:
+    """Runs output verifications in a process pool so they never occupy an encode slot."""
+
+    def __init__(self, max_workers=VERIFY_WORKERS):
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, initializer=restore_affinity, initargs=(cpus,))
+
+    def submit(self, job_id, output_path, callback=None):
+        """Queues a verification and returns its Future. The callback receives the result dictionary.
+
+        The callback is always called: if the verification process fails (e.g. a
+        BrokenProcessPool) it gets a failed result with error_class 'transient', and if the
+        callback itself raises it is called once more with a failed result, so the job is
+        handed back instead of staying 'Processing'.
+        """
+        future = self.executor.submit(run_verification, job_id, output_path)
+        if callback is not None:
+            def deliver(done_future):
+                if done_future.cancelled():
+                    result = failed_result(job_id, output_path, "cancelled", "transient")
+                elif done_future.exception() is not None:
+                    result = failed_result(job_id, output_path, done_future.exception(), "transient")
+                else:
+                    result = done_future.result()
+                try:
+                    callback(result)
+                except Exception as e:
+                    logging.error(f"Verification callback for job {job_id} failed: {e}", extra={"job_id": job_id})
+                    try:
+                        callback(failed_result(job_id, output_path, e, "transient"))
+                    except Exception as retry_error:
+                        logging.error(f"Verification callback for job {job_id} failed again: {retry_error}",
+                                      extra={"job_id": job_id})
+            future.add_done_callback(deliver)
+        return future
+
+    def shutdown(self, wait=True):
+        """Stops the pool, optionally waiting for running verifications to finish."""
+        self.executor.shutdown(wait=wait)
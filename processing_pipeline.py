@@ -0,0 +1,325 @@
+import sqlite3
+import datetime
+import logging
+from db_handler import DB_PATH, add_column_if_missing, create_queue_indexes
+from estimate_feedback import get_compression_table
+from job_planner import create_plan_columns, needs_job_sql, plan_job
+from job_archive import create_history_tables, archive_finished_jobs, NOT_ARCHIVED_SQL
+
+PIPELINE_CHUNK_SIZE = 5000  # Rows handled per transaction
+
+# Columns copied from FileRecords into ConversionQueue (ConversionQueue column, FileRecords expression)
+QUEUE_COLUMN_MAP = [
+    ("file_name", "f.file_name"),
+    ("file_path", "f.file_path"),
+    ("file_size", "f.file_size"),
+    ("last_modified", "f.file_modified"),
+    ("scan_date", "f.last_scanned"),
+    ("storage_location", "COALESCE(f.top_folder, 'Unknown')"),
+    ("video_codec", "f.video_codec"),
+    ("resolution", "f.resolution"),
+    ("duration", "f.duration"),
+    ("bit_rate", "f.video_bitrate"),
+    ("audio_codec", "f.audio_codec"),
+    ("audio_channels", "f.audio_channels"),
+    ("sample_rate", "f.audio_sample_rate"),
+    ("language", "f.audio_languages"),
+    ("container_format", "f.file_format"),
+    ("original_size", "f.file_size"),
+]
+
+
+def create_pipeline_tables(cursor):
+    """Creates the pipeline bookkeeping: high-water marks, the FileRecords change log and dirty-row indexes.
+
+    A trigger on FileRecords records the file_path of every changed record in
+    FileRecordsDirty, so the refresh stage only visits changed files. Rows still needing a
+    plan or an estimate are found through partial indexes instead of a table scan.
+    PipelineState.marker holds the file_path of the last ingested record, to detect a rebuilt FileRecords.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS PipelineState (
+            stage TEXT PRIMARY KEY,
+            high_water_mark INTEGER NOT NULL DEFAULT 0,
+            rows_processed INTEGER NOT NULL DEFAULT 0,
+            last_run TIMESTAMP
+        )
+    """)
+    add_column_if_missing(cursor, "PipelineState", "marker", "TEXT")
+    cursor.execute("CREATE TABLE IF NOT EXISTS FileRecordsDirty (file_path TEXT PRIMARY KEY)")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_file_records_changed
+        AFTER UPDATE OF file_size, file_modified, video_codec, resolution, duration, audio_codec, file_format ON FileRecords
+        BEGIN
+            INSERT OR IGNORE INTO FileRecordsDirty (file_path) VALUES (NEW.file_path);
+        END
+    """)
+    create_queue_indexes(cursor)
+    create_plan_columns(cursor)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cq_needs_plan ON ConversionQueue(id) WHERE job_type IS NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cq_needs_estimate ON ConversionQueue(id) WHERE estimated_size IS NULL")
+    create_history_tables(cursor)
+
+
+def get_high_water_mark(cursor, stage):
+    """Returns (high_water_mark, marker) for a stage, (0, None) before its first run."""
+    cursor.execute("SELECT high_water_mark, marker FROM PipelineState WHERE stage = ?", (stage,))
+    row = cursor.fetchone()
+    return row if row else (0, None)
+
+
+def set_high_water_mark(cursor, stage, high_water_mark, rows_processed, marker=None):
+    current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        INSERT INTO PipelineState (stage, high_water_mark, rows_processed, last_run, marker)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (stage) DO UPDATE SET
+            high_water_mark = excluded.high_water_mark,
+            rows_processed = rows_processed + excluded.rows_processed,
+            last_run = excluded.last_run,
+            marker = excluded.marker
+    """, (stage, high_water_mark, rows_processed, current_timestamp, marker))
+
+
+def get_last_record_path(cursor, rowid):
+    """Returns the file_path of the FileRecords row with the highest rowid up to rowid (a rowid seek), or None."""
+    cursor.execute("SELECT file_path FROM FileRecords WHERE rowid <= ? ORDER BY rowid DESC LIMIT 1", (rowid,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def report(progress_callback, stage, done, total):
+    if progress_callback is not None:
+        progress_callback(stage, done, total)
+
+
+def ingest_new_records(conn, progress_callback=None, chunk_size=PIPELINE_CHUNK_SIZE):
+    """Copies FileRecords rows added since the last run (rowid above the high-water mark) into ConversionQueue.
+
+    The path of the last ingested record is kept as a marker; if the record now at or below
+    the high-water mark has another path (or none), FileRecords was rebuilt or truncated and
+    ingest starts over from rowid 0 (paths already queued are skipped).
+
+    Records whose file_path is already queued are marked dirty instead, so the refresh
+    stage picks up their new metadata; archived files (ConversionHistory) are not queued again
+    unless the file was replaced since (a different last_modified).
+    Returns the number of inserted rows.
+    """
+    cursor = conn.cursor()
+    high_water_mark, marker = get_high_water_mark(cursor, "ingest")
+    cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM FileRecords")
+    max_rowid = cursor.fetchone()[0]
+    if high_water_mark and (max_rowid < high_water_mark or get_last_record_path(cursor, high_water_mark) != marker):
+        logging.info("FileRecords was rebuilt since the last ingest; starting over.")
+        high_water_mark = 0
+    total = max_rowid - high_water_mark
+
+    queue_columns = ", ".join(column for column, _ in QUEUE_COLUMN_MAP)
+    record_columns = ", ".join(expression for _, expression in QUEUE_COLUMN_MAP)
+    inserted = 0
+    start = high_water_mark
+    while start < max_rowid:
+        end = min(start + chunk_size, max_rowid)
+        cursor.execute(f"""
+            INSERT INTO ConversionQueue ({queue_columns}, creation_date)
+            SELECT {record_columns}, CURRENT_TIMESTAMP
+            FROM FileRecords AS f
+            WHERE f.rowid > ? AND f.rowid <= ?
+              AND {needs_job_sql('f.video_codec', 'f.file_format')}
+              AND NOT EXISTS (SELECT 1 FROM ConversionQueue AS q WHERE q.file_path = f.file_path)
+              AND {NOT_ARCHIVED_SQL}
+        """, (start, end))
+        inserted += cursor.rowcount
+        cursor.execute("""
+            INSERT OR IGNORE INTO FileRecordsDirty (file_path)
+            SELECT f.file_path
+            FROM FileRecords AS f
+            JOIN ConversionQueue AS q ON q.file_path = f.file_path
+            WHERE f.rowid > ? AND f.rowid <= ?
+              AND COALESCE(q.last_modified, '') != COALESCE(f.file_modified, '')
+        """, (start, end))
+        set_high_water_mark(cursor, "ingest", end, end - start, get_last_record_path(cursor, end))
+        conn.commit()
+        start = end
+        report(progress_callback, "ingest", start - high_water_mark, total)
+
+    logging.info(f"Inserted {inserted} new records into ConversionQueue.")
+    return inserted
+
+
+def refresh_changed_records(conn, progress_callback=None, chunk_size=PIPELINE_CHUNK_SIZE):
+    """Copies new metadata for changed FileRecords (FileRecordsDirty) onto their ConversionQueue rows.
+
+    Only jobs that are not processing or finished are refreshed; their plan and estimate are
+    cleared so the following stages recompute them. A changed file without a queue row whose
+    archived job is for an older version of the file (replaced in place) is queued again.
+    Returns the number of refreshed or re-queued rows.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM FileRecordsDirty")
+    total = cursor.fetchone()[0]
+    set_clause = ", ".join(f"{column} = {expression}" for column, expression in QUEUE_COLUMN_MAP if column != "file_path")
+    queue_columns = ", ".join(column for column, _ in QUEUE_COLUMN_MAP)
+    record_columns = ", ".join(expression for _, expression in QUEUE_COLUMN_MAP)
+
+    refreshed = 0
+    done = 0
+    while True:
+        cursor.execute("SELECT file_path FROM FileRecordsDirty LIMIT ?", (chunk_size,))
+        paths = [row[0] for row in cursor.fetchall()]
+        if not paths:
+            break
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS dirty_paths (file_path TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM temp.dirty_paths")
+        cursor.executemany("INSERT OR IGNORE INTO temp.dirty_paths (file_path) VALUES (?)", ((path,) for path in paths))
+        cursor.execute(f"""
+            UPDATE ConversionQueue
+            SET {set_clause},
+                job_type = NULL, video_action = NULL, audio_action = NULL, subtitle_action = NULL,
+                estimated_size = NULL, space_saved = NULL,
+                modification_date = CURRENT_TIMESTAMP
+            FROM FileRecords AS f
+            JOIN temp.dirty_paths AS d ON d.file_path = f.file_path
+            WHERE ConversionQueue.file_path = f.file_path
+              AND COALESCE(ConversionQueue.job_status, 'pending') IN ('pending', 'queued', 'skipped')
+        """)
+        refreshed += cursor.rowcount
+        cursor.execute(f"""
+            INSERT INTO ConversionQueue ({queue_columns}, creation_date)
+            SELECT {record_columns}, CURRENT_TIMESTAMP
+            FROM FileRecords AS f
+            JOIN temp.dirty_paths AS d ON d.file_path = f.file_path
+            WHERE {needs_job_sql('f.video_codec', 'f.file_format')}
+              AND NOT EXISTS (SELECT 1 FROM ConversionQueue AS q WHERE q.file_path = f.file_path)
+              AND {NOT_ARCHIVED_SQL}
+        """)
+        refreshed += cursor.rowcount
+        cursor.execute("DELETE FROM FileRecordsDirty WHERE file_path IN (SELECT file_path FROM temp.dirty_paths)")
+        conn.commit()
+        done += len(paths)
+        report(progress_callback, "refresh", done, total)
+
+    logging.info(f"Refreshed {refreshed} changed records in ConversionQueue.")
+    return refreshed
+
+
+def plan_new_jobs(conn, progress_callback=None, chunk_size=PIPELINE_CHUNK_SIZE):
+    """Plans jobs that have no plan yet (dirty through job_type IS NULL). Returns the number planned."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM ConversionQueue WHERE job_type IS NULL")
+    total = cursor.fetchone()[0]
+
+    planned = 0
+    last_id = 0
+    while True:
+        cursor.execute("""
+            SELECT id, video_codec, container_format, audio_codec
+            FROM ConversionQueue
+            WHERE job_type IS NULL AND id > ?
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = []
+        for job_id, video_codec, container_format, audio_codec in rows:
+            plan = plan_job(video_codec, container_format, audio_codec)
+            updates.append((plan["job_type"], plan["video_action"], plan["audio_action"], plan["subtitle_action"], job_id))
+        cursor.executemany("""
+            UPDATE ConversionQueue
+            SET job_type = ?, video_action = ?, audio_action = ?, subtitle_action = ?
+            WHERE id = ?
+        """, updates)
+        conn.commit()
+        planned += len(rows)
+        last_id = rows[-1][0]
+        report(progress_callback, "plan", planned, total)
+
+    logging.info(f"Planned {planned} jobs.")
+    return planned
+
+
+def reduction_sql(compression_table):
+    """Builds a SQL CASE expression returning the reduction factor for video_codec."""
+    cases = " ".join(f"WHEN '{codec}' THEN {factor}" for codec, factor in compression_table.items())
+    return f"(CASE video_codec {cases} ELSE 0.0 END)"
+
+
+def estimate_new_jobs(conn, progress_callback=None, chunk_size=PIPELINE_CHUNK_SIZE, compression_table=None):
+    """Fills estimated_size and space_saved for rows without an estimate, in chunked SQL batches.
+
+    Uses the reduction factors of COMPRESSION_TABLE, replaced by the learned reduction
+    for codecs with enough encode feedback (see estimate_feedback). Returns the number of estimated rows.
+    """
+    compression_table = compression_table or get_compression_table()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT COUNT(*) FROM ConversionQueue
+        WHERE estimated_size IS NULL AND video_codec IS NOT NULL AND video_codec != ''
+    """)
+    total = cursor.fetchone()[0]
+    estimated_sql = f"CAST(file_size * (1 - {reduction_sql(compression_table)}) AS INTEGER)"
+
+    estimated = 0
+    last_id = 0
+    while True:
+        cursor.execute("""
+            SELECT MAX(id), COUNT(*) FROM (
+                SELECT id FROM ConversionQueue
+                WHERE estimated_size IS NULL AND id > ?
+                  AND video_codec IS NOT NULL AND video_codec != ''
+                ORDER BY id
+                LIMIT ?
+            )
+        """, (last_id, chunk_size))
+        chunk_end, count = cursor.fetchone()
+        if not count:
+            break
+        cursor.execute(f"""
+            UPDATE ConversionQueue
+            SET estimated_size = {estimated_sql},
+                space_saved = file_size - {estimated_sql}
+            WHERE estimated_size IS NULL AND id > ? AND id <= ?
+              AND video_codec IS NOT NULL AND video_codec != ''
+        """, (last_id, chunk_end))
+        conn.commit()
+        estimated += count
+        last_id = chunk_end
+        report(progress_callback, "estimate", estimated, total)
+
+    logging.info(f"Updated {estimated} records with estimated size and space saved.")
+    return estimated
+
+
+PIPELINE_STAGES = [
+    ("ingest", ingest_new_records),
+    ("refresh", refresh_changed_records),
+    ("plan", plan_new_jobs),
+    ("estimate", estimate_new_jobs),
+    ("archive", archive_finished_jobs),
+]
+
+
+def run_pipeline(progress_callback=None, chunk_size=PIPELINE_CHUNK_SIZE):
+    """Runs every stage in order, each touching only rows changed since the previous run.
+
+    progress_callback(stage, done, total) is called after every chunk.
+    Returns {stage: rows handled}.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_pipeline_tables(cursor)
+    conn.commit()
+
+    results = {}
+    try:
+        for stage, stage_function in PIPELINE_STAGES:
+            results[stage] = stage_function(conn, progress_callback, chunk_size)
+    finally:
+        conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    print(run_pipeline(lambda stage, done, total: print(f"{stage}: {done}/{total}")))
@@ -0,0 +1,219 @@
+import os
+import sys
+import time
+import signal
+import sqlite3
+import logging
+import argparse
+import datetime
+import threading
+import queue
+import tracemalloc
+from collections import Counter, defaultdict
+from db_handler import DB_PATH
+from db_logging import get_log_worker_id
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "profiles")
+PROFILE_SECONDS = 30          # Default capture length
+PROFILE_SAMPLE_INTERVAL = 0.01  # Seconds between stack samples of all threads
+PROFILE_TOP_FUNCTIONS = 25    # Functions listed per thread in the report
+PROFILE_TOP_ALLOCATIONS = 25  # Allocation sites listed in the tracemalloc section
+TRACEMALLOC_FRAMES = 10       # Frames stored per traced allocation
+
+# Job each thread is working on, shown next to the thread in profile reports
+_thread_jobs = {}
+_active_capture = None
+_capture_lock = threading.Lock()
+# Capture requests from the SIGUSR1 handler; SimpleQueue.put is reentrant, so the handler takes no lock
+_profile_requests = queue.SimpleQueue()
+_trigger_thread = None
+
+
+def set_thread_job(job_id=None):
+    """Records the job the calling thread works on (None when it finishes)."""
+    if job_id is None:
+        _thread_jobs.pop(threading.get_ident(), None)
+    else:
+        _thread_jobs[threading.get_ident()] = job_id
+
+
+def frame_key(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileCapture(threading.Thread):
+    """Samples the stacks of every thread in the process for `seconds` and compares
+    tracemalloc snapshots taken at the start and end of the capture.
+
+    Sampling (sys._current_frames) sees all threads (the Qt main thread, encode slots,
+    journal sync, verification callbacks) at a fixed cost per sample, and needs no
+    restart or instrumentation of the running code. The report and a collapsed-stack
+    file (for flamegraph tools) are written to PROFILE_DIR.
+    """
+
+    def __init__(self, label, seconds=PROFILE_SECONDS, interval=PROFILE_SAMPLE_INTERVAL):
+        super().__init__(name="ProfileCapture", daemon=True)
+        self.label = label
+        self.seconds = seconds
+        self.interval = interval
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(PROFILE_DIR, f"profile_{label}_{os.getpid()}_{timestamp}.txt")
+        self.samples = 0
+        self.stacks = Counter()                    # (thread name, frames...) -> samples
+        self.self_counts = defaultdict(Counter)    # thread name -> function -> samples on top of the stack
+        self.total_counts = defaultdict(Counter)   # thread name -> function -> samples anywhere on the stack
+        self.thread_jobs = defaultdict(set)
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own_ident = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            thread_name = names.get(ident, f"thread-{ident}")
+            if ident in _thread_jobs:
+                self.thread_jobs[thread_name].add(_thread_jobs[ident])
+            frames = []
+            while frame is not None:
+                frames.append(frame_key(frame))
+                frame = frame.f_back
+            frames.reverse()
+            self.stacks[(thread_name,) + tuple(frames)] += 1
+            self.self_counts[thread_name][frames[-1]] += 1
+            for key in set(frames):
+                self.total_counts[thread_name][key] += 1
+        self.samples += 1
+
+    def run(self):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        start_snapshot = tracemalloc.take_snapshot()
+        started = time.monotonic()
+        cpu_started = time.process_time()
+        deadline = started + self.seconds
+        while time.monotonic() < deadline:
+            self.sample()
+            time.sleep(self.interval)
+        self.wall_seconds = time.monotonic() - started
+        self.cpu_seconds = time.process_time() - cpu_started
+        end_snapshot = tracemalloc.take_snapshot()
+        traced_current, traced_peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            self.write_report(start_snapshot, end_snapshot, traced_current, traced_peak)
+            logging.info(f"Profile of {self.label} written to {self.path}")
+        except OSError as e:
+            logging.error(f"Could not write profile {self.path}: {e}")
+        finally:
+            finish_capture(self)
+
+    def write_report(self, start_snapshot, end_snapshot, traced_current, traced_peak):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        worker_id = get_log_worker_id()
+        lines = [
+            f"Profile: {self.label} (pid {os.getpid()}, worker {worker_id or '-'})",
+            f"Captured: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}, {self.wall_seconds:.1f}s wall, "
+            f"{self.cpu_seconds:.1f}s process CPU, {self.samples} samples every {self.interval * 1000:.0f} ms",
+            f"Traced memory: {traced_current / 1024 ** 2:.1f} MB current, {traced_peak / 1024 ** 2:.1f} MB peak",
+        ]
+        jobs = get_processing_jobs(worker_id) if worker_id else []
+        if jobs:
+            lines.append("Processing jobs:")
+            lines.extend(f"    {job_id}: {file_name}" for job_id, file_name in jobs)
+
+        for thread_name in sorted(self.total_counts, key=lambda name: -sum(self.self_counts[name].values())):
+            job_ids = ", ".join(str(job_id) for job_id in sorted(self.thread_jobs.get(thread_name, ())))
+            lines.append("")
+            lines.append(f"Thread {thread_name}" + (f" (jobs {job_ids})" if job_ids else ""))
+            lines.append(f"    {'self %':>7} {'total %':>7}  function")
+            for key, total in self.total_counts[thread_name].most_common(PROFILE_TOP_FUNCTIONS):
+                self_share = self.self_counts[thread_name][key] / self.samples
+                lines.append(f"    {self_share:7.1%} {total / self.samples:7.1%}  {key}")
+
+        lines.append("")
+        lines.append("Allocation growth during the capture (tracemalloc):")
+        for stat in end_snapshot.compare_to(start_snapshot, "lineno")[:PROFILE_TOP_ALLOCATIONS]:
+            frame = stat.traceback[0]
+            lines.append(f"    {stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks  "
+                         f"{frame.filename}:{frame.lineno}")
+
+        with open(self.path, "w") as report_file:
+            report_file.write("\n".join(lines) + "\n")
+        with open(os.path.splitext(self.path)[0] + ".folded", "w") as folded_file:
+            for stack, count in self.stacks.items():
+                folded_file.write(";".join(stack) + f" {count}\n")
+
+
+def get_processing_jobs(worker_id):
+    """Returns [(job_id, file_name)] the worker is processing, or [] if the database is unavailable."""
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=1)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, file_name FROM ConversionQueue
+            WHERE job_status = 'Processing' AND processing_workerID = ?
+            ORDER BY id
+        """, (worker_id,))
+        jobs = cursor.fetchall()
+        conn.close()
+    except sqlite3.Error:
+        return []
+    return jobs
+
+
+def start_profile(label, seconds=PROFILE_SECONDS):
+    """Starts a background capture of this process. Returns the ProfileCapture (its path is
+    where the report will be written), or None if a capture is already running."""
+    global _active_capture
+    with _capture_lock:
+        if _active_capture is not None:
+            return None
+        _active_capture = ProfileCapture(label, seconds)
+        _active_capture.start()
+        return _active_capture
+
+
+def finish_capture(capture):
+    global _active_capture
+    with _capture_lock:
+        if _active_capture is capture:
+            _active_capture = None
+
+
+def run_profile_trigger():
+    """Starts the captures requested by the SIGUSR1 handler, outside of the signal handler."""
+    while True:
+        label, seconds = _profile_requests.get()
+        start_profile(label, seconds)
+
+
+def install_profile_signal(label, seconds=PROFILE_SECONDS):
+    """Starts a capture whenever the process receives SIGUSR1 (kill -USR1 <pid>).
+
+    The handler only queues the request: starting the capture takes _capture_lock and
+    starts a thread, either of which could deadlock if the signal interrupted the main
+    thread while it held the same lock. A ProfileTrigger thread starts the capture instead.
+    """
+    global _trigger_thread
+    if not hasattr(signal, "SIGUSR1"):
+        return
+    if _trigger_thread is None:
+        _trigger_thread = threading.Thread(target=run_profile_trigger, name="ProfileTrigger", daemon=True)
+        _trigger_thread.start()
+    signal.signal(signal.SIGUSR1, lambda signum, frame: _profile_requests.put((label, seconds)))
+
+
+def setup_profiling(label, argv=None):
+    """Installs the SIGUSR1 trigger and handles a --profile [SECONDS] flag on the command line
+    (capture from startup). Returns the remaining arguments, e.g. for QApplication."""
+    argv = sys.argv if argv is None else argv
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--profile", type=float, nargs="?", const=PROFILE_SECONDS)
+    args, remaining = parser.parse_known_args(argv[1:])
+    install_profile_signal(label)
+    if args.profile:
+        start_profile(label, args.profile)
+    return argv[:1] + remaining
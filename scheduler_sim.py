@@ -0,0 +1,277 @@
+import sys
+import json
+import heapq
+import sqlite3
+import argparse
+from db_handler import DB_PATH
+from job_planner import REMUX_COST_FACTOR
+from fair_share import create_fair_share_tables, get_seconds_per_byte, DEFAULT_WEIGHT
+from fleet_analytics import (
+    create_rollup_table, create_slot_table, get_resolution_class, get_worker_speeds, get_class_speeds,
+    get_active_workers, downsample, format_duration,
+)
+
+SIM_POLICIES = ["fifo", "largest_savings", "shortest_job", "fair_share"]
+ASSUMED_SPEED = 1.0        # Media seconds per wall second per slot when no worker has a measured speed
+CURVE_POINTS = 50          # Points of the GB-reclaimed-over-time curve kept in a report
+GB = 1024 ** 3
+
+
+def load_jobs(db_path=DB_PATH):
+    """Loads the queued and in-progress jobs as simulation tuples.
+
+    Returns (queued, processing): queued is a list of
+    (queue_position, cost_seconds, bytes_saved, resolution_class, priority_class, share_key, charge, job_id),
+    processing a list of (worker_id, remaining_cost_seconds, bytes_saved, resolution_class).
+    cost_seconds is the media seconds to encode (REMUX_COST_FACTOR of the duration for remuxes);
+    jobs without a duration are costed from their size at the queue's average seconds per byte.
+    charge is what fair_share.charge_share would charge the job's share. The numeric columns are
+    cast in SQL, as they may hold TEXT values.
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    create_fair_share_tables(cursor)
+    create_rollup_table(cursor)
+    conn.commit()
+    cursor.execute("""
+        SELECT id, queue_position, job_status, processing_workerID, CAST(duration AS REAL), CAST(file_size AS INTEGER),
+               COALESCE(CAST(space_saved AS INTEGER), 0), resolution, job_type, priority_class, share_key,
+               COALESCE(CAST(progress AS REAL), 0)
+        FROM ConversionQueue
+        WHERE (job_status = 'queued' AND queue_position IS NOT NULL) OR job_status = 'Processing'
+    """)
+    rows = cursor.fetchall()
+    cursor.execute("""
+        SELECT SUM(CAST(duration AS REAL)), SUM(CAST(file_size AS INTEGER)) FROM ConversionQueue
+        WHERE CAST(duration AS REAL) > 0 AND CAST(file_size AS INTEGER) > 0
+    """)
+    known_seconds, known_bytes = cursor.fetchone()
+    charge_seconds_per_byte = get_seconds_per_byte(cursor)
+    conn.close()
+    seconds_per_byte = known_seconds / known_bytes if known_bytes else 0.0
+
+    class_of = {}
+    queued = []
+    processing = []
+    for (job_id, queue_position, job_status, worker_id, duration, file_size, bytes_saved,
+         resolution, job_type, priority_class, share_key, progress) in rows:
+        if resolution not in class_of:
+            class_of[resolution] = get_resolution_class(resolution)
+        resolution_class = class_of[resolution]
+        media_seconds = duration or (file_size or 0) * seconds_per_byte
+        cost = media_seconds * (REMUX_COST_FACTOR if job_type == "remux" else 1)
+        if job_status == "Processing":
+            processing.append((worker_id, cost * (1 - progress), bytes_saved, resolution_class))
+        else:
+            charge = duration or (file_size or 0) * charge_seconds_per_byte
+            queued.append((queue_position, cost, bytes_saved, resolution_class, priority_class, share_key, charge, job_id))
+    return queued, processing
+
+
+def load_fair_share_state(db_path=DB_PATH):
+    """Returns (weights, passes, virtual_times) from the fair_share tables."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    create_fair_share_tables(cursor)
+    conn.commit()
+    cursor.execute("SELECT share_key, weight FROM FairShareWeights")
+    weights = dict(cursor.fetchall())
+    cursor.execute("SELECT priority_class, share_key, pass FROM FairShareCounters")
+    passes = {(priority_class, share_key): value for priority_class, share_key, value in cursor.fetchall()}
+    cursor.execute("SELECT priority_class, virtual_time FROM FairShareClock")
+    virtual_times = dict(cursor.fetchall())
+    conn.close()
+    return weights, passes, virtual_times
+
+
+def load_workers(worker_ids=None, slots=None, assumed_workers=None, db_path=DB_PATH):
+    """Returns the simulated workers as [(worker_id, slot_count, {resolution_class: speed per slot}, speed per slot)].
+
+    Speeds are the measured ThroughputRollups speeds (per class, else the worker's overall
+    speed, else the fleet average, else ASSUMED_SPEED). A worker's slot count is the number of
+    slots it reported in SlotThroughput (1 if none). Overriding `slots` keeps each worker's
+    aggregate throughput and splits it over the new slot count, so more slots shorten the
+    idle tail but do not add capacity.
+    assumed_workers simulates that many identical workers at the fleet average speed instead.
+    Measured speeds of 0 (rollups with wall time but no media seconds) are ignored, like missing ones.
+    """
+    overall = {worker_id: speed for worker_id, _, speed, _ in get_worker_speeds() if speed and speed > 0}
+    class_speeds = {key: speed for key, speed in get_class_speeds().items() if speed and speed > 0}
+    fleet_average = sum(overall.values()) / len(overall) if overall else ASSUMED_SPEED
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    create_slot_table(cursor)
+    conn.commit()
+    cursor.execute("SELECT worker_id, COUNT(DISTINCT slot) FROM SlotThroughput GROUP BY worker_id")
+    measured_slots = dict(cursor.fetchall())
+    if worker_ids is None and not assumed_workers:
+        cursor.execute("SELECT workerID FROM WorkerInfo ORDER BY workerID")
+        worker_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+
+    if assumed_workers:
+        return [(f"assumed-{index}", slots or 1, {}, fleet_average) for index in range(assumed_workers)]
+
+    workers = []
+    for worker_id in worker_ids:
+        worker_slots = measured_slots.get(worker_id, 1)
+        scale = worker_slots / slots if slots else 1.0
+        base_speed = overall.get(worker_id, fleet_average)
+        speeds = {resolution_class: speed * scale
+                  for (class_worker, resolution_class), speed in class_speeds.items() if class_worker == worker_id}
+        workers.append((worker_id, slots or worker_slots, speeds, base_speed * scale))
+    return workers
+
+
+def order_jobs(queued, policy, fair_share_state=None):
+    """Returns the queued jobs in the order the policy dispatches them.
+
+    Every policy here depends only on the queue, not on timing (fair-share passes are charged
+    at claim time), so the dispatch order is computed once up front.
+    """
+    if policy == "fifo":
+        return sorted(queued, key=lambda job: (job[0], job[7]))
+    if policy == "largest_savings":
+        return sorted(queued, key=lambda job: (-job[2], job[0], job[7]))
+    if policy == "shortest_job":
+        return sorted(queued, key=lambda job: (job[1], job[0], job[7]))
+    if policy == "fair_share":
+        return fair_share_order(queued, *(fair_share_state or ({}, {}, {})))
+    raise ValueError(f"Unknown policy {policy}; choose from {', '.join(SIM_POLICIES)}")
+
+
+def fair_share_order(queued, weights, passes, virtual_times):
+    """Replays fair_share.choose_share/charge_share: lower priority classes first, and within a
+    class the share with the smallest pass (charge / weight) next, each share in queue_position order."""
+    shares = {}
+    for job in sorted(queued, key=lambda job: (job[0], job[7])):
+        shares.setdefault((job[4], job[5]), []).append(job)
+
+    order = []
+    for priority_class in sorted({key[0] for key in shares}):
+        virtual_time = virtual_times.get(priority_class, 0.0)
+        heap = []
+        for (job_class, share_key), jobs in shares.items():
+            if job_class == priority_class:
+                jobs.reverse()  # Pop from the end in queue_position order
+                heapq.heappush(heap, (max(passes.get((job_class, share_key), 0.0), virtual_time), str(share_key), share_key))
+        while heap:
+            share_pass, sort_key, share_key = heapq.heappop(heap)
+            jobs = shares[(priority_class, share_key)]
+            job = jobs.pop()
+            order.append(job)
+            if jobs:
+                weight = weights.get(share_key, DEFAULT_WEIGHT) or DEFAULT_WEIGHT
+                heapq.heappush(heap, (share_pass + job[6] / weight, sort_key, share_key))
+    return order
+
+
+def simulate(ordered_jobs, workers, processing=()):
+    """Runs the discrete-event simulation: whenever a slot becomes free (earliest event first)
+    it takes the next job in dispatch order. Slots of workers that are mid-job start busy.
+
+    Returns a report with the makespan, GB reclaimed over time and idle time per worker.
+    """
+    slot_worker = []
+    slot_speeds = []
+    for worker_index, (worker_id, slots, speeds, base_speed) in enumerate(workers):
+        for _ in range(slots):
+            slot_worker.append(worker_index)
+            slot_speeds.append((speeds, base_speed))
+    if not slot_worker:
+        raise ValueError("No workers to simulate")
+
+    busy = [0.0] * len(slot_worker)
+    completions = []
+    events = [(0.0, slot) for slot in range(len(slot_worker))]
+    slot_of_worker = {}
+    for slot, worker_index in enumerate(slot_worker):
+        slot_of_worker.setdefault(workers[worker_index][0], []).append(slot)
+    for worker_id, cost, bytes_saved, resolution_class in processing:
+        free_slots = slot_of_worker.get(worker_id)
+        if not free_slots:
+            continue  # Worker not simulated; its job is not counted
+        slot = free_slots.pop()
+        speeds, base_speed = slot_speeds[slot]
+        duration = cost / speeds.get(resolution_class, base_speed)
+        busy[slot] += duration
+        events[slot] = (duration, slot)
+        completions.append((duration, bytes_saved))
+    heapq.heapify(events)
+
+    heappop, heappush, append = heapq.heappop, heapq.heappush, completions.append
+    for job in ordered_jobs:
+        now, slot = heappop(events)
+        speeds, base_speed = slot_speeds[slot]
+        duration = job[1] / speeds.get(job[3], base_speed)
+        busy[slot] += duration
+        append((now + duration, job[2]))
+        heappush(events, (now + duration, slot))
+
+    makespan = max(end for end, _ in events)
+    completions.sort()
+    curve = []
+    reclaimed = 0
+    half_time = None
+    total_saved = sum(bytes_saved for _, bytes_saved in completions)
+    for end, bytes_saved in completions:
+        reclaimed += bytes_saved
+        curve.append((end, reclaimed))
+        if half_time is None and reclaimed * 2 >= total_saved:
+            half_time = end
+
+    idle = {}
+    for slot, worker_index in enumerate(slot_worker):
+        worker_id = workers[worker_index][0]
+        idle[worker_id] = idle.get(worker_id, 0.0) + makespan - busy[slot]
+    slot_seconds = makespan * len(slot_worker)
+    return {
+        "jobs": len(completions),
+        "slots": len(slot_worker),
+        "makespan_seconds": round(makespan, 1),
+        "reclaimed_gb": round(total_saved / GB, 2),
+        "half_reclaimed_seconds": round(half_time, 1) if half_time is not None else None,
+        "mean_gb_per_hour": round(total_saved / GB / (makespan / 3600), 3) if makespan > 0 else None,
+        "idle_fraction": round(sum(idle.values()) / slot_seconds, 4) if slot_seconds > 0 else 0.0,
+        "idle_seconds": {worker_id: round(seconds, 1) for worker_id, seconds in idle.items()},
+        "reclaimed_curve": [(round(end / 3600, 3), round(saved / GB, 2))
+                            for end, saved in downsample(curve, CURVE_POINTS)],
+    }
+
+
+def run_simulation(policies=SIM_POLICIES, worker_ids=None, slots=None, assumed_workers=None, db_path=DB_PATH):
+    """Loads the queue and workers once and simulates each policy. Returns {policy: report}."""
+    queued, processing = load_jobs(db_path)
+    workers = load_workers(worker_ids, slots, assumed_workers, db_path)
+    fair_share_state = load_fair_share_state(db_path) if "fair_share" in policies else None
+    return {policy: simulate(order_jobs(queued, policy, fair_share_state), workers, processing) for policy in policies}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the conversion queue under different scheduling policies.")
+    parser.add_argument("--policies", default=",".join(SIM_POLICIES), help="Comma-separated, from " + ", ".join(SIM_POLICIES))
+    parser.add_argument("--active", action="store_true", help="Only simulate workers that are processing now (default: all registered workers)")
+    parser.add_argument("--slots", type=int, help="Encode slots per worker (default: as measured in SlotThroughput)")
+    parser.add_argument("--workers", type=int, help="Simulate this many identical workers at the fleet average speed")
+    parser.add_argument("--json", action="store_true", help="Print the full reports, including the reclaimed curve, as JSON")
+    args = parser.parse_args(argv)
+
+    reports = run_simulation(
+        [policy.strip() for policy in args.policies.split(",")],
+        get_active_workers() if args.active else None,
+        args.slots, args.workers,
+    )
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    print(f"{'policy':<16} {'jobs':>8} {'slots':>6} {'makespan':>12} {'GB':>10} {'half GB at':>12} {'GB/hour':>9} {'idle':>7}")
+    for policy, report in reports.items():
+        half = report["half_reclaimed_seconds"]
+        print(f"{policy:<16} {report['jobs']:>8} {report['slots']:>6} {format_duration(report['makespan_seconds']):>12} "
+              f"{report['reclaimed_gb']:>10.1f} {format_duration(half) if half is not None else '-':>12} "
+              f"{report['mean_gb_per_hour'] or 0:>9.2f} {report['idle_fraction']:>7.1%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,18 +1,42 @@
 import sys
-import subprocess
 import logging
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-    QTableWidget, QTableWidgetItem, QLabel, QTabWidget, QMessageBox
+    QTableWidget, QTableWidgetItem, QLabel, QTabWidget, QMessageBox, QTextEdit
 )
-from PyQt6.QtCharts import QChart, QChartView, QPieSeries
-from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtCharts import QChart, QChartView, QPieSeries, QLineSeries, QDateTimeAxis, QValueAxis
+from PyQt6.QtCore import Qt, QSize, QTimer, QPointF, QDateTime, QThread, pyqtSignal
 from PyQt6.QtGui import QColor
 from ui_job_list import JobListUI
-from db_handler import get_total_space_saved, get_estimated_total_savings, move_jobs_to_front, update_conversion_queue
+from db_handler import get_total_space_saved, get_estimated_total_savings, update_conversion_queue, get_latest_log_id, get_logs_since
 from database_processing import register_local_worker
 from ui_worker_management import WorkerManagementUI
 from db_compare import compare_file_records
+from db_logging import format_log_entry
+from fleet_analytics import get_queue_eta, get_worker_speeds, get_reclaimed_over_time, downsample, format_duration
+from processing_pipeline import run_pipeline
+from profiling import setup_profiling, start_profile
+
+LOG_TAIL_INTERVAL_MS = 2000  # How often the Logs / Errors tab polls for new rows
+LOG_BACKLOG = 200            # Log rows shown from before the UI started
+LOG_MAX_LINES = 5000         # Lines kept in the Logs / Errors tab
+ANALYTICS_REFRESH_MS = 60000 # How often the queue ETA, worker speeds and reclaimed chart refresh
+
+
+class PipelineThread(QThread):
+    """Runs the incremental processing pipeline in the background, reporting progress per chunk."""
+    progress = pyqtSignal(str, int, int)  # stage, done, total
+    done = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def run(self):
+        try:
+            results = run_pipeline(lambda stage, done, total: self.progress.emit(stage, done, total))
+        except Exception as e:
+            logging.error(f"Database processing failed: {e}")
+            self.failed.emit(str(e))
+            return
+        self.done.emit(results)
 
 
 class MainUI(QMainWindow):
@@ -32,12 +56,37 @@ class MainUI(QMainWindow):
         self.setMinimumSize(1400, 600)  # Set the minimum window size
         self.initUI()
 
+        # Tools menu: on-demand profiling of this process
+        tools_menu = self.menuBar().addMenu("Tools")
+        profile_action = tools_menu.addAction("Capture Profile")
+        profile_action.triggered.connect(self.capture_profile)
+
     def run_database_processing(self):
-        """Runs the database processing script before launching the UI."""
-        try:
-            subprocess.run(["python3", "database_processing.py"], check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"Error running database processing: {e}")
+        """Runs the processing pipeline in-process on a background thread.
+        Each run only touches FileRecords and queue rows changed since the previous run."""
+        if getattr(self, "pipeline_thread", None) is not None and self.pipeline_thread.isRunning():
+            return
+        self.pipeline_thread = PipelineThread(self)
+        self.pipeline_thread.progress.connect(self.on_pipeline_progress)
+        self.pipeline_thread.done.connect(self.on_pipeline_done)
+        self.pipeline_thread.failed.connect(self.on_pipeline_failed)
+        self.pipeline_thread.start()
+
+    def on_pipeline_progress(self, stage, done, total):
+        """Shows the progress of the running pipeline stage."""
+        self.pipeline_status_label.setText(f"Processing: {stage} {done}/{total}")
+
+    def on_pipeline_done(self, results):
+        """Refreshes the job list and stats once the pipeline has finished."""
+        summary = ", ".join(f"{stage} {count}" for stage, count in results.items())
+        self.pipeline_status_label.setText(f"Processing complete: {summary}")
+        self.job_list_ui.load_jobs()
+        total_saved = get_total_space_saved() / (1024 ** 3)
+        estimated_savings = get_estimated_total_savings() / (1024 ** 3)
+        self.stats_label.setText(f"Space Saved So Far: {total_saved:.2f} GB\nEstimated Total Savings: {estimated_savings:.2f} GB")
+
+    def on_pipeline_failed(self, error):
+        self.pipeline_status_label.setText(f"Processing failed: {error}")
             
     def pull_pqc_data(self):
         """Handles Pull PQC Data button click."""
@@ -78,6 +127,19 @@ class MainUI(QMainWindow):
         self.stats_label = QLabel(f"Space Saved So Far: {total_saved:.2f} GB\nEstimated Total Savings: {estimated_savings:.2f} GB")
         left_panel.addWidget(self.stats_label)
 
+        # Fleet analytics (queue ETA, per-worker speed, GB reclaimed over time)
+        self.eta_label = QLabel()
+        self.worker_speed_label = QLabel()
+        self.reclaimed_chart = self.create_reclaimed_chart()
+        left_panel.addWidget(self.eta_label)
+        left_panel.addWidget(self.worker_speed_label)
+        left_panel.addWidget(self.reclaimed_chart)
+        if not hasattr(self, "analytics_timer"):
+            self.analytics_timer = QTimer(self)
+            self.analytics_timer.timeout.connect(self.refresh_analytics)
+            self.analytics_timer.start(ANALYTICS_REFRESH_MS)
+        self.refresh_analytics()
+
         # Center Panel (Job List & Logs Tab)
         center_panel = QVBoxLayout()
         self.tab_widget = QTabWidget()
@@ -108,7 +170,12 @@ class MainUI(QMainWindow):
         self.pull_pqc_button = QPushButton("Pull PQC Data")
         self.pull_pqc_button.clicked.connect(self.pull_pqc_data)
         self.stop_all_button = QPushButton("Stop All Scans")
+        self.process_button = QPushButton("Process New Records")
+        self.process_button.clicked.connect(self.run_database_processing)
+        self.pipeline_status_label = QLabel()
         controls_panel.addWidget(self.pull_pqc_button)
+        controls_panel.addWidget(self.process_button)
+        controls_panel.addWidget(self.pipeline_status_label)
         controls_panel.addWidget(self.stop_all_button)
         
         # Add Panels to Main Layout
@@ -171,12 +238,80 @@ class MainUI(QMainWindow):
 
         return chart_widget
     
+    def create_reclaimed_chart(self):
+        """Creates the GB-reclaimed-over-time line chart (filled by refresh_analytics)."""
+        self.reclaimed_series = QLineSeries()
+        chart = QChart()
+        chart.addSeries(self.reclaimed_series)
+        chart.setTitle("GB Reclaimed Over Time")
+        chart.legend().setVisible(False)
+
+        self.reclaimed_x_axis = QDateTimeAxis()
+        self.reclaimed_x_axis.setFormat("MMM d")
+        self.reclaimed_y_axis = QValueAxis()
+        self.reclaimed_y_axis.setLabelFormat("%.0f")
+        chart.addAxis(self.reclaimed_x_axis, Qt.AlignmentFlag.AlignBottom)
+        chart.addAxis(self.reclaimed_y_axis, Qt.AlignmentFlag.AlignLeft)
+        self.reclaimed_series.attachAxis(self.reclaimed_x_axis)
+        self.reclaimed_series.attachAxis(self.reclaimed_y_axis)
+
+        chartview = QChartView(chart)
+        chartview.setMinimumSize(QSize(300, 200))
+        return chartview
+
+    def refresh_analytics(self):
+        """Refreshes the queue ETA, per-worker speeds and the reclaimed chart from the throughput rollups."""
+        eta_seconds, remaining_seconds, fleet_speed = get_queue_eta()
+        self.eta_label.setText(
+            f"Queue ETA: {format_duration(eta_seconds)}\n"
+            f"Remaining Media: {remaining_seconds / 3600:.1f} h at {fleet_speed:.2f}x fleet speed"
+        )
+
+        speed_lines = [f"{hostname}: {speed:.2f}x ({jobs} jobs)" for _, hostname, speed, jobs in get_worker_speeds()]
+        self.worker_speed_label.setText("Worker Speed (media s / wall s):\n" + ("\n".join(speed_lines) or "No history yet"))
+
+        # Plot cumulative GB per hourly bucket, downsampled so long histories stay responsive
+        points = []
+        for bucket_start, cumulative_bytes in get_reclaimed_over_time():
+            timestamp = QDateTime.fromString(bucket_start, "yyyy-MM-dd HH:mm:ss").toMSecsSinceEpoch()
+            points.append((timestamp, cumulative_bytes / (1024 ** 3)))
+        points = downsample(points)
+        self.reclaimed_series.replace([QPointF(x, y) for x, y in points])
+        if points:
+            self.reclaimed_x_axis.setRange(QDateTime.fromMSecsSinceEpoch(int(points[0][0])),
+                                           QDateTime.fromMSecsSinceEpoch(int(points[-1][0])))
+            self.reclaimed_y_axis.setRange(0, max(y for _, y in points) or 1)
+
     def create_logs_panel(self):
-        """Creates a placeholder logs panel to display conversion logs/errors."""
-        logs_panel = QLabel("Logs will appear here.")
-        logs_panel.setAlignment(Qt.AlignmentFlag.AlignTop)
+        """Creates the logs panel and starts tailing the Logs table (all workers) incrementally by id."""
+        logs_panel = QTextEdit()
+        logs_panel.setReadOnly(True)
+        logs_panel.document().setMaximumBlockCount(LOG_MAX_LINES)
+        self.logs_panel = logs_panel
+
+        self.last_log_id = max(0, get_latest_log_id() - LOG_BACKLOG)
+        if not hasattr(self, "log_timer"):
+            self.log_timer = QTimer(self)
+            self.log_timer.timeout.connect(self.tail_logs)
+            self.log_timer.start(LOG_TAIL_INTERVAL_MS)
+        self.tail_logs()
         return logs_panel
 
+    def tail_logs(self):
+        """Appends Logs rows written since the last poll to the logs panel."""
+        for log_row in get_logs_since(self.last_log_id):
+            worker_text = f"[{log_row[3][:8]}] " if log_row[3] else ""
+            self.logs_panel.append(worker_text + format_log_entry(log_row))
+            self.last_log_id = log_row[0]
+
+    def capture_profile(self):
+        """Samples every thread of the UI process for PROFILE_SECONDS and writes the report next to the database."""
+        capture = start_profile("ui")
+        if capture is None:
+            self.pipeline_status_label.setText("Profile capture already running")
+        else:
+            self.pipeline_status_label.setText(f"Profiling for {capture.seconds:.0f}s: {capture.path}")
+
     def create_worker_table(self):
         """Creates a table for managing workers."""
         worker_table = QTableWidget()
@@ -185,7 +320,7 @@ class MainUI(QMainWindow):
         return worker_table
     
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    app = QApplication(setup_profiling("ui"))
     main_window = MainUI()
     main_window.show()
     sys.exit(app.exec())
@@ -1,15 +1,77 @@
-from PyQt6.QtWidgets import QTableWidgetItem, QHBoxLayout, QTableWidget, QPushButton, QWidget, QLineEdit, QVBoxLayout
-from PyQt6.QtCore import Qt
-from db_handler import get_conversion_jobs, update_jobs_queue_position_and_status, get_highest_queue_position, move_jobs_to_front, remove_jobs_from_queue
+from PyQt6.QtWidgets import QHBoxLayout, QTableView, QPushButton, QWidget, QLineEdit, QVBoxLayout, QLabel
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from db_handler import queue_jobs_by_ids, move_jobs_to_front_by_ids, remove_jobs_from_queue_by_ids, queue_jobs_matching
+from job_cache import JobCache, GB
+import numpy as np
 import logging
 
+# Header and sort key of each job list column (see JobCache.sort)
+COLUMN_HEADERS = ["File Name", "Size (GB)", "Status", "Order"]
+SORT_COLUMNS = ["name", "size", "status", "position"]
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+
+class JobTableModel(QAbstractTableModel):
+    """Table model over a JobCache and an index array of its rows.
+
+    Sorting and filtering only swap the index array; cell text is built on demand for the
+    rows the view paints, so no table items are created per job.
+    """
+
+    def __init__(self, jobs):
+        super().__init__()
+        self.jobs = jobs
+        self.rows = jobs.all()
+
+    def set_rows(self, jobs, rows):
+        """Shows the given cache rows (an index array into jobs) in this order."""
+        self.beginResetModel()
+        self.jobs = jobs
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMN_HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        cache_row = self.rows[index.row()]
+        if role == Qt.ItemDataRole.UserRole:
+            return int(self.jobs.ids[cache_row])  # The job id for queue operations
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        _, file_name, file_size, job_status, queue_position, _ = self.jobs.row(cache_row)
+        column = index.column()
+        if column == 0:
+            return file_name
+        if column == 1:
+            return f"{file_size / GB:.2f} GB"  # Convert bytes to GB
+        if column == 2:
+            return job_status
+        return str(queue_position) if queue_position is not None else "—"
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return COLUMN_HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def job_ids(self, table_rows):
+        """Returns the job ids shown in the given table rows."""
+        return self.jobs.ids[self.rows[np.asarray(table_rows, dtype=np.int64)]].tolist()
+
 class JobListUI:
     def __init__(self, main_ui):
         """Initialize Job List UI component."""
         self.main_ui = main_ui
         self.job_list_tab = None
+        self.jobs = JobCache([])
+        self.sort_column = None
+        self.sort_descending = False
         self.setup_job_list()
 
     def setup_job_list(self):
@@ -23,10 +85,15 @@ class JobListUI:
         self.search_bar.setPlaceholderText("Search jobs...")
         self.search_bar.textChanged.connect(self.filter_jobs)  # Connect search event
 
-        # Job List Table
-        self.main_ui.job_list = QTableWidget()
-        self.main_ui.job_list.setColumnCount(4)
-        self.main_ui.job_list.setHorizontalHeaderLabels(["File Name", "Size (GB)", "Status", "Order"])
+        # Job List Table (a view over the JobCache, see JobTableModel)
+        self.job_model = JobTableModel(self.jobs)
+        self.main_ui.job_list = QTableView()
+        self.main_ui.job_list.setModel(self.job_model)
+        self.main_ui.job_list.horizontalHeader().sectionClicked.connect(self.sort_jobs)
+        self.main_ui.job_list.selectionModel().selectionChanged.connect(lambda selected, deselected: self.update_selection_totals())
+
+        # Selected GB per codec
+        self.selection_label = QLabel()
 
         # ✅ Define a horizontal layout for buttons
         button_layout = QHBoxLayout()
@@ -51,9 +118,15 @@ class JobListUI:
         self.main_ui.move_to_front_button.clicked.connect(self.move_selected_to_front)
         button_layout.addWidget(self.main_ui.move_to_front_button)
 
+        # Add Everything Matching the Search Button
+        self.main_ui.add_matching_button = QPushButton("Add All Matching")
+        self.main_ui.add_matching_button.clicked.connect(self.add_matching_to_queue)
+        button_layout.addWidget(self.main_ui.add_matching_button)
+
         # ✅ Add the search bar, job list, and button row to the main layout
         layout.addWidget(self.search_bar)
         layout.addWidget(self.main_ui.job_list)
+        layout.addWidget(self.selection_label)
         layout.addLayout(button_layout)  # ✅ Add the button row
 
         container = QWidget()
@@ -61,111 +134,107 @@ class JobListUI:
         self.job_list_tab = container
 
 
-    def display_jobs(self, jobs):
-        self.main_ui.job_list.setRowCount(0)  # Reset the table
-        for row_idx, (file_name, file_size, job_status, queue_position) in enumerate(jobs):
-            self.main_ui.job_list.insertRow(row_idx)
-            self.main_ui.job_list.setItem(row_idx, 0, QTableWidgetItem(file_name))
-            self.main_ui.job_list.setItem(row_idx, 1, QTableWidgetItem(f"{file_size / (1024**3):.2f} GB"))  # Convert bytes to GB
-            self.main_ui.job_list.setItem(row_idx, 2, QTableWidgetItem(job_status))
-
-            queue_pos_text = str(queue_position) if queue_position is not None else "—"
-            self.main_ui.job_list.setItem(row_idx, 3, QTableWidgetItem(queue_pos_text))
+    def display_jobs(self, rows):
+        """Shows the given JobCache rows in the table (only the model's index array changes).
+        Resetting the model clears the selection without a selectionChanged signal, so the totals are updated here."""
+        self.job_model.set_rows(self.jobs, rows)
+        self.update_selection_totals()
 
 
     def load_jobs(self):
-        """Fetch jobs from the database and update the UI."""
+        """Fetch jobs from the database into the JobCache and update the UI."""
         logging.info("Loading jobs from the database...")
         
-        self.jobs = get_conversion_jobs()  # Assign the jobs to self.jobs
-        logging.info(f"Retrieved {len(self.jobs)} jobs from ConversionQueue.")
-
-        self.display_jobs(self.jobs)  # Now pass self.jobs to update the UI
+        self.jobs = JobCache.load()
+        logging.info(f"Retrieved {len(self.jobs)} jobs from ConversionQueue ({self.jobs.memory_bytes() / 1024 ** 2:.1f} MB cached).")
 
-        
-    def filter_jobs(self):
-        """Filters the displayed jobs based on search input."""
-        search_text = self.search_bar.text().strip().lower()
-        if not search_text:
-            self.display_jobs(self.jobs)  # Reset to full job list if search is cleared
-            return
+        self.filter_jobs()
 
-        # Filter jobs in memory
-        filtered_jobs = [
-            job for job in self.jobs if search_text in job[0].lower() or search_text in job[2].lower()
-        ]
-        logging.info(f"Displaying {len(filtered_jobs)} filtered jobs for search: {search_text}")
+    def visible_rows(self):
+        """Returns the cache rows matching the search text, in the current sort order."""
+        rows = self.jobs.filter(search=self.search_bar.text().strip() or None)
+        if self.sort_column is not None:
+            rows = self.jobs.sort(self.sort_column, self.sort_descending, rows)
+        return rows
 
-        self.display_jobs(filtered_jobs)
+    def filter_jobs(self):
+        """Filters the displayed jobs based on search input (in the JobCache, without a query)."""
+        rows = self.visible_rows()
+        if self.search_bar.text().strip():
+            logging.info(f"Displaying {len(rows)} filtered jobs for search: {self.search_bar.text().strip()}")
+        self.display_jobs(rows)
+
+    def sort_jobs(self, column):
+        """Sorts the visible jobs by the clicked column; clicking the same column again reverses the order."""
+        sort_column = SORT_COLUMNS[column]
+        self.sort_descending = not self.sort_descending if sort_column == self.sort_column else False
+        self.sort_column = sort_column
+        self.display_jobs(self.visible_rows())
+
+    def update_selection_totals(self):
+        """Shows the selected GB per codec (or for the visible jobs when nothing is selected)."""
+        job_ids = self.get_selected_job_ids()
+        rows = self.jobs.indices_of(job_ids) if job_ids else self.visible_rows()
+        totals = self.jobs.group_totals("codec", rows)
+        label = "Selected" if job_ids else "Shown"
+        parts = [f"{codec or 'unknown'}: {count} ({size / GB:.1f} GB)"
+                 for codec, (count, size) in sorted(totals.items(), key=lambda item: -item[1][1])]
+        total_size = sum(size for _, size in totals.values())
+        self.selection_label.setText(f"{label} {len(rows)} jobs, {total_size / GB:.1f} GB" + (" — " + ", ".join(parts) if parts else ""))
+
+    def get_selected_job_ids(self):
+        """Returns the ids of the selected rows (one per row, in table order)."""
+        selected_rows = sorted({index.row() for index in self.main_ui.job_list.selectionModel().selectedIndexes()})
+        return self.job_model.job_ids(selected_rows)
 
     def add_selected_to_queue(self):
-        """Batch update selected jobs to be added to the queue in sequential order and set status to 'queued'."""
-        selected_rows = self.main_ui.job_list.selectedItems()
-        if not selected_rows:
+        """Adds the selected jobs to the end of the queue in table order and sets status to 'queued'."""
+        job_ids = self.get_selected_job_ids()
+        if not job_ids:
             logging.info("No jobs selected.")
             return
-        # Extract unique file names from selected rows
-        file_names = set()
-        for item in selected_rows:
-            row = item.row()
-            file_name = self.main_ui.job_list.item(row, 0).text()  # File name is in the first column
-            file_names.add(file_name)
-        logging.info(f"Queuing {len(file_names)} jobs: {file_names}")
-        # Get the next available queue position
-        current_max_position = get_highest_queue_position()
-        next_position = current_max_position + 1
-        # Prepare batch update data for queue position and status
-        job_updates = []
-        for file_name in file_names:
-            job_updates.append((next_position, "queued", file_name))
-            next_position += 1  # Increment for each job
-        # Batch update queue position and job status
-        update_jobs_queue_position_and_status(job_updates)
-        # Log updates
-        logging.info(f"Added {len(job_updates)} jobs to the queue with 'queued' status. New max queue position: {next_position - 1}")
+        logging.info(f"Queuing {len(job_ids)} jobs.")
+        queued = queue_jobs_by_ids(job_ids)
+        logging.info(f"Added {queued} jobs to the queue with 'queued' status.")
         # Refresh the job list
         self.load_jobs()
 
+    def add_matching_to_queue(self):
+        """Adds every unqueued job matching the search text to the queue with a single SQL statement."""
+        search_text = self.search_bar.text().strip()
+        if not search_text:
+            logging.info("No search text entered.")
+            return
+        queued = queue_jobs_matching(search=search_text)
+        logging.info(f"Added {queued} jobs matching '{search_text}' to the queue.")
+        self.load_jobs()
+
     def move_selected_to_front(self):
         """Moves selected jobs to the front of the queue while maintaining order."""
-        selected_rows = self.main_ui.job_list.selectedItems()
-        if not selected_rows:
+        job_ids = self.get_selected_job_ids()
+        if not job_ids:
             logging.info("No jobs selected.")
             return
 
-        file_names = set()
-        for item in selected_rows:
-            row = item.row()
-            file_name = self.main_ui.job_list.item(row, 0).text()  # File name is in column 0
-            file_names.add(file_name)
-
-        logging.info(f"Moving {len(file_names)} jobs to the front of the queue: {file_names}")
+        logging.info(f"Moving {len(job_ids)} jobs to the front of the queue.")
 
         # Call DB function to update queue position
-        move_jobs_to_front(list(file_names))
+        move_jobs_to_front_by_ids(job_ids)
 
         # Reload the job list
         self.load_jobs()
 
     def remove_selected_from_queue(self):
-        """Removes selected jobs from the queue by calling remove_jobs_from_queue in db_handler."""
-        selected_rows = self.main_ui.job_list.selectedItems()
-        if not selected_rows:
+        """Removes selected jobs from the queue by calling remove_jobs_from_queue_by_ids in db_handler."""
+        job_ids = self.get_selected_job_ids()
+        if not job_ids:
             logging.info("No jobs selected.")
             return
 
-        file_names = set()
-        for item in selected_rows:
-            row = item.row()
-            file_name = self.main_ui.job_list.item(row, 0).text()  # File name is in column 0
-            file_names.add(file_name)
-
-        logging.info(f"Removing {len(file_names)} jobs from the queue: {file_names}")
+        logging.info(f"Removing {len(job_ids)} jobs from the queue.")
 
         # Call DB function to update queue position and status
-        remove_jobs_from_queue(list(file_names))
+        remove_jobs_from_queue_by_ids(job_ids)
 
         # Reload the job list
         self.load_jobs()
-
-
@@ -4,10 +4,18 @@ from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, 
     QTableWidgetItem, QTextEdit, QPushButton, QTabWidget, QLabel, QFileDialog
 )
-from db_handler import get_queue
-from PyQt6.QtCore import Qt
+from db_handler import get_queue, get_latest_log_id, get_logs_since
+from PyQt6.QtCore import Qt, QTimer
 from database_processing import register_local_worker 
-from worker_logic import set_worker_processing_status, get_worker_status, set_worker_connected_status
+from worker_logic import set_worker_processing_status, get_worker_status, set_worker_connected_status, start_worker_thread
+from conversion_engine import SCRATCH_DIR
+from db_logging import set_log_context, format_log_entry
+from profiling import setup_profiling, start_profile
+
+LOG_TAIL_INTERVAL_MS = 2000  # How often the Logs/Errors tabs poll for new rows
+LOG_BACKLOG = 200            # Log rows shown from before the UI started
+LOG_MAX_LINES = 5000         # Lines kept in each log tab
+STOP_POLL_INTERVAL_MS = 500  # How often a stop request checks whether the worker thread has exited
 
 class WorkerUI(QWidget):
     def __init__(self):
@@ -15,6 +23,11 @@ class WorkerUI(QWidget):
         self.setWindowTitle("Worker UI - Plex Video Converter")
         self.setGeometry(200, 200, 800, 600)
         self.workerID = register_local_worker() # Register the local worker and store the returned workerID
+        set_log_context(worker_id=self.workerID)  # Tag this process's log records with the workerID
+        self.destination_folder = SCRATCH_DIR  # Scratch storage for segment checkpoints and outputs
+        self.worker_thread = None
+        self.stop_event = None
+        self.close_after_stop = False
 
         main_layout = QHBoxLayout(self)
         
@@ -37,6 +50,8 @@ class WorkerUI(QWidget):
         self.logs_tab.setReadOnly(True)
         self.errors_tab = QTextEdit()
         self.errors_tab.setReadOnly(True)
+        self.logs_tab.document().setMaximumBlockCount(LOG_MAX_LINES)
+        self.errors_tab.document().setMaximumBlockCount(LOG_MAX_LINES)
         
         self.tabs.addTab(self.logs_tab, "Logs")
         self.tabs.addTab(self.errors_tab, "Errors")
@@ -50,7 +65,7 @@ class WorkerUI(QWidget):
         
         self.worker_status_label = QLabel("Worker Status: Idle")
         self.worker_info_label = QLabel("Worker Info: Not Connected")
-        self.destination_label = QLabel("Destination Folder: Not Selected")
+        self.destination_label = QLabel(f"Destination Folder: {self.destination_folder}")
 
         self.start_button = QPushButton("Start Processing")
         self.start_button.clicked.connect(self.start_processing)
@@ -59,6 +74,8 @@ class WorkerUI(QWidget):
         self.refresh_button = QPushButton("Refresh Queue")
         self.select_folder_button = QPushButton("Select Destination Folder")
         self.select_folder_button.clicked.connect(self.select_destination_folder)
+        self.profile_button = QPushButton("Capture Profile")
+        self.profile_button.clicked.connect(self.capture_profile)
 
         # Connect the refresh button to our update method
         self.refresh_button.clicked.connect(self.update_queue_table)
@@ -75,6 +92,7 @@ class WorkerUI(QWidget):
         right_panel.addWidget(self.stop_button)
         right_panel.addWidget(self.refresh_button)
         right_panel.addWidget(self.select_folder_button)
+        right_panel.addWidget(self.profile_button)
         
         # Add Panels to Main Layout
         main_layout.addLayout(left_panel, 2)  # Left panel takes 2/3 of space
@@ -86,11 +104,29 @@ class WorkerUI(QWidget):
         self.update_queue_table()
         self.update_stop_button()
         print(self.workerID)
+
+        # Tail this worker's rows in the Logs table incrementally by id
+        self.last_log_id = max(0, get_latest_log_id() - LOG_BACKLOG)
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.tail_logs)
+        self.log_timer.start(LOG_TAIL_INTERVAL_MS)
+        self.tail_logs()
+
+        # Polls for the worker thread to exit after a stop request, so the UI never blocks on it
+        self.stop_timer = QTimer(self)
+        self.stop_timer.timeout.connect(self.check_worker_stopped)
     
     def closeEvent(self, event):
         """
         Override the close event to trigger stop processing before the window closes.
+        While the worker thread is still finishing, the window stays open and closes
+        itself once the thread has exited.
         """
+        if self.worker_thread is not None:
+            self.close_after_stop = True
+            self.stop_processing()
+            event.ignore()
+            return
         # Call stop_processing() to update the worker's status to "Connected"
         self.stop_processing()
         # Accept the event to allow the window to close
@@ -129,6 +165,18 @@ class WorkerUI(QWidget):
         
         print(f"Queue table updated with {len(jobs)} items.")
 
+    def tail_logs(self):
+        """
+        Appends Logs rows written since the last poll to the Logs tab, and ERROR/CRITICAL
+        rows to the Errors tab. Only rows with an id above last_log_id are fetched.
+        """
+        for log_row in get_logs_since(self.last_log_id, worker_id=self.workerID):
+            line = format_log_entry(log_row)
+            self.logs_tab.append(line)
+            if log_row[2] in ("ERROR", "CRITICAL"):
+                self.errors_tab.append(line)
+            self.last_log_id = log_row[0]
+
     def start_processing(self):
         """
         Called when the "Start Processing" button is clicked.
@@ -139,6 +187,9 @@ class WorkerUI(QWidget):
         success = set_worker_processing_status(self.workerID)
         
         if success:
+            # Start claiming and encoding jobs in the background
+            self.worker_thread, self.stop_event = start_worker_thread(self.workerID, self.destination_folder)
+
             # Update the UI to reflect the new status
             self.worker_status_label.setText("Worker Status: Processing")
             
@@ -167,8 +218,36 @@ class WorkerUI(QWidget):
     def stop_processing(self):
         """
         Called when the Stop Processing button is clicked.
-        Updates the WorkerInfo table for the current worker by setting its status to "Connected",
-        then refreshes the UI.
+        Signals the worker loop to stop (the current jobs are released with their segment
+        checkpoints, so they resume later). The worker thread still waits for its encodes
+        and queued verifications to exit, so it is not joined here: stop_timer polls for it
+        and finish_stop() updates the status once it is gone.
+        """
+        if self.stop_event is not None:
+            self.stop_event.set()
+            self.start_button.setEnabled(False)
+            self.stop_button.setEnabled(False)
+            self.worker_status_label.setText("Worker Status: Stopping...")
+            self.stop_timer.start(STOP_POLL_INTERVAL_MS)
+            return
+        self.finish_stop()
+
+    def check_worker_stopped(self):
+        """Called by stop_timer; finishes the stop once the worker thread has exited."""
+        if self.worker_thread is not None and self.worker_thread.is_alive():
+            return
+        self.stop_timer.stop()
+        self.worker_thread = None
+        self.stop_event = None
+        if self.close_after_stop:
+            self.close()  # closeEvent finishes the stop
+        else:
+            self.finish_stop()
+
+    def finish_stop(self):
+        """
+        Updates the WorkerInfo table for the current worker by setting its status to
+        "Connected", then refreshes the UI.
         """
         success = set_worker_connected_status(self.workerID)
         if success:
@@ -181,6 +260,7 @@ class WorkerUI(QWidget):
     def select_destination_folder(self):
         """
         Opens a file dialog to let the user select a destination folder for file copying.
+        The folder is used as scratch storage for segment checkpoints and encoded outputs.
         The selected folder is stored in self.destination_folder and displayed in the UI.
         """
         folder = QFileDialog.getExistingDirectory(self, "Select Destination Folder")
@@ -191,9 +271,21 @@ class WorkerUI(QWidget):
         else:
             print("No folder selected.")
 
+    def capture_profile(self):
+        """
+        Called when the Capture Profile button is clicked.
+        Samples all threads of this process (UI and encode slots) for PROFILE_SECONDS and
+        writes the report, with this worker's jobs, next to the database.
+        """
+        capture = start_profile(f"worker_{self.workerID}")
+        if capture is None:
+            self.worker_info_label.setText("Profile capture already running")
+        else:
+            self.worker_info_label.setText(f"Profiling for {capture.seconds:.0f}s: {capture.path}")
+
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    app = QApplication(setup_profiling("uiworker"))
     window = WorkerUI()
     window.show()
     sys.exit(app.exec())
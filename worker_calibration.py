@@ -0,0 +1,83 @@
+import time
+import sqlite3
+import datetime
+import logging
+import subprocess
+from db_handler import DB_PATH, add_column_if_missing
+from conversion_engine import ENCODER_SETTINGS
+
+# Standard synthetic clip every worker encodes at registration, so scores are comparable
+CALIBRATION_SOURCE = "testsrc2=size=1280x720:rate=30"
+CALIBRATION_SECONDS = 5
+
+
+def create_calibration_columns(cursor):
+    """Adds the numeric throughput_score and calibrated_at columns to WorkerInfo if missing."""
+    add_column_if_missing(cursor, "WorkerInfo", "throughput_score", "REAL")
+    add_column_if_missing(cursor, "WorkerInfo", "calibrated_at", "TIMESTAMP")
+
+
+def run_calibration_benchmark(settings=None):
+    """Encodes the standard testsrc clip with the production encoder settings.
+
+    Returns the throughput score (media seconds encoded per wall second), or None if the
+    benchmark could not run (e.g. ffmpeg missing).
+    """
+    settings = settings or ENCODER_SETTINGS
+    command = [
+        "ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error",
+        "-f", "lavfi", "-i", CALIBRATION_SOURCE, "-t", str(CALIBRATION_SECONDS),
+        "-c:v", settings["video_codec"], "-crf", str(settings["crf"]), "-preset", settings["preset"],
+        "-x265-params", "log-level=error",
+        "-f", "null", "-",
+    ]
+    started = time.monotonic()
+    try:
+        subprocess.run(command, capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.warning(f"Calibration benchmark failed: {e}")
+        return None
+    elapsed = time.monotonic() - started
+    return CALIBRATION_SECONDS / elapsed if elapsed > 0 else None
+
+
+def get_worker_score(workerID):
+    """Returns the stored throughput_score for a worker, or None if it has not been calibrated."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_calibration_columns(cursor)
+    conn.commit()
+    cursor.execute("SELECT throughput_score FROM WorkerInfo WHERE workerID = ?", (workerID,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def calibrate_worker(workerID, force=False):
+    """Runs the calibration benchmark for a worker and stores its score in WorkerInfo.
+
+    Skips the benchmark if the worker already has a score, unless force is True.
+    Returns the worker's score.
+    """
+    if not force:
+        score = get_worker_score(workerID)
+        if score is not None:
+            return score
+
+    score = run_calibration_benchmark()
+    if score is None:
+        return None
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_calibration_columns(cursor)
+    current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        UPDATE WorkerInfo
+        SET throughput_score = ?, calibrated_at = ?
+        WHERE workerID = ?
+    """, (score, current_timestamp, workerID))
+    conn.commit()
+    conn.close()
+    logging.info(f"Worker {workerID} calibrated at {score:.2f}x realtime.")
+    return score
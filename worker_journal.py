@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import datetime
+import threading
+from db_handler import DB_PATH, add_column_if_missing
+from db_logging import create_logs_table
+
+JOURNAL_DIR = os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "journals")
+SYNC_INTERVAL = 2.0        # Seconds between syncs to the central database
+SYNC_BATCH_SIZE = 5000     # Journal entries flushed per central transaction
+SYNC_LOCK_TIMEOUT = 1.0    # Seconds to wait for the central write lock before backing off
+SYNC_MAX_BACKOFF = 60.0    # Max seconds between retries while the central database is unavailable
+HEARTBEAT_INTERVAL = 60.0  # Seconds between heartbeats journaled by the sync thread while the worker runs
+
+
+def create_sync_state_table(cursor):
+    """Creates the central WorkerSyncState table (last journal entry applied per journal) and the progress column."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS WorkerSyncState (
+            journal_id TEXT PRIMARY KEY,
+            worker_id TEXT,
+            last_seq INTEGER NOT NULL DEFAULT 0,
+            synced_at TIMESTAMP
+        )
+    """)
+    add_column_if_missing(cursor, "ConversionQueue", "progress", "REAL")
+
+
+class WorkerJournal:
+    """Worker-local write journal (an SQLite file in WAL mode) for progress, heartbeats and logs.
+
+    Appends only touch the local file, so they never wait for the central write lock. A
+    background thread coalesces the entries (latest heartbeat, latest progress per job, all
+    log rows) and applies them to the central database in one transaction per batch. The
+    sync thread also journals a heartbeat every HEARTBEAT_INTERVAL, so last_checkin stays
+    fresh through encodes, verifications and uploads of any length. The
+    central WorkerSyncState row for the journal is updated in the same transaction, so a
+    batch replayed after a crash or a failed sync is skipped instead of applied twice.
+    Claims and job completions still go to the central database directly.
+    """
+
+    def __init__(self, worker_id, path=None):
+        self.worker_id = worker_id
+        self.path = path or os.path.join(JOURNAL_DIR, f"journal_{worker_id}.db")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS JournalEntries (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                job_id INTEGER,
+                payload TEXT,
+                created_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS JournalMeta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("INSERT OR IGNORE INTO JournalMeta (key, value) VALUES ('journal_id', ?)", (str(uuid.uuid4()),))
+        self.conn.commit()
+        self.journal_id = self.conn.execute("SELECT value FROM JournalMeta WHERE key = 'journal_id'").fetchone()[0]
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def append(self, entries):
+        """Appends (kind, job_id, payload) entries to the local journal in one transaction."""
+        current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO JournalEntries (kind, job_id, payload, created_at) VALUES (?, ?, ?, ?)",
+                ((kind, job_id, json.dumps(payload), current_timestamp) for kind, job_id, payload in entries)
+            )
+            self.conn.commit()
+
+    def record_heartbeat(self):
+        self.append([("heartbeat", None, None)])
+
+    def record_progress(self, job_id, progress):
+        self.append([("progress", job_id, progress)])
+
+    def record_logs(self, rows):
+        """Journals Logs rows (timestamp, worker_id, job_id, level, message) as written by db_logging.LogWriter."""
+        self.append(("log", row[2], list(row)) for row in rows)
+
+    def pending_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM JournalEntries").fetchone()[0]
+
+    def sync_once(self, db_path=DB_PATH):
+        """Applies up to SYNC_BATCH_SIZE journal entries to the central database.
+
+        Returns the number of entries synced. Raises sqlite3.Error if the central database
+        is locked or unreachable; the entries stay in the journal for the next attempt.
+        """
+        with self.lock:
+            entries = self.conn.execute(
+                "SELECT seq, kind, job_id, payload, created_at FROM JournalEntries ORDER BY seq LIMIT ?",
+                (SYNC_BATCH_SIZE,)
+            ).fetchall()
+        if not entries:
+            return 0
+
+        central = sqlite3.connect(db_path, timeout=SYNC_LOCK_TIMEOUT)
+        try:
+            cursor = central.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            create_sync_state_table(cursor)
+            cursor.execute("SELECT last_seq FROM WorkerSyncState WHERE journal_id = ?", (self.journal_id,))
+            row = cursor.fetchone()
+            last_seq = row[0] if row else 0
+
+            heartbeat = None
+            progress = {}
+            log_rows = []
+            for seq, kind, job_id, payload, created_at in entries:
+                if seq <= last_seq:
+                    continue  # Already applied by an earlier sync whose local cleanup did not happen
+                if kind == "heartbeat":
+                    heartbeat = created_at
+                elif kind == "progress":
+                    progress[job_id] = json.loads(payload)
+                elif kind == "log":
+                    log_rows.append(json.loads(payload))
+
+            if heartbeat is not None:
+                cursor.execute("UPDATE WorkerInfo SET last_checkin = MAX(COALESCE(last_checkin, ''), ?) WHERE workerID = ?",
+                               (heartbeat, self.worker_id))
+            if progress:
+                cursor.executemany("""
+                    UPDATE ConversionQueue SET progress = ?
+                    WHERE id = ? AND job_status = 'Processing' AND processing_workerID = ?
+                """, ((value, job_id, self.worker_id) for job_id, value in progress.items()))
+            if log_rows:
+                create_logs_table(cursor)
+                cursor.executemany(
+                    "INSERT INTO Logs (timestamp, worker_id, job_id, level, message) VALUES (?, ?, ?, ?, ?)",
+                    log_rows
+                )
+            max_seq = entries[-1][0]
+            current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            cursor.execute("""
+                INSERT INTO WorkerSyncState (journal_id, worker_id, last_seq, synced_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (journal_id) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq), synced_at = excluded.synced_at
+            """, (self.journal_id, self.worker_id, max_seq, current_timestamp))
+            central.commit()
+        finally:
+            central.close()
+
+        with self.lock:
+            self.conn.execute("DELETE FROM JournalEntries WHERE seq <= ?", (max_seq,))
+            self.conn.commit()
+        return len(entries)
+
+    def run(self):
+        backoff = SYNC_INTERVAL
+        last_heartbeat = None
+        while True:
+            stopping = self.stop_event.wait(backoff)
+            if not stopping and (last_heartbeat is None or time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL):
+                self.record_heartbeat()
+                last_heartbeat = time.monotonic()
+            try:
+                while self.sync_once() == SYNC_BATCH_SIZE:
+                    pass
+                backoff = SYNC_INTERVAL
+            except sqlite3.Error as e:
+                backoff = min(backoff * 2, SYNC_MAX_BACKOFF)
+                # Printed rather than logged: log records would only be journaled again
+                print(f"Journal sync for worker {self.worker_id} failed ({e}); {self.pending_count()} entries kept, retrying in {backoff:.0f}s")
+            if stopping:
+                break
+
+    def start(self):
+        """Starts the background sync thread."""
+        self.thread = threading.Thread(target=self.run, name="JournalSync", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the sync thread after a final sync attempt. Unsynced entries stay in the journal for the next run."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self.lock:
+            self.conn.close()
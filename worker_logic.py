@@ -1,9 +1,32 @@
 import sqlite3
 import datetime
+import logging
+import threading
 from database_processing import DB_PATH 
 
 # Make sure DB_PATH is defined here or imported from your configuration
 from database_processing import DB_PATH  # Or define DB_PATH = "plex_video_converter.db" if not imported
+from conversion_engine import SCRATCH_DIR, EncodeStopped, NotWorthwhile, encode_job, clear_checkpoints
+from output_verification import VerificationPool
+from fleet_analytics import record_job_throughput, record_slot_throughput
+from worker_calibration import create_calibration_columns, calibrate_worker
+from encoder_tuning import get_tuned_settings
+from job_planner import create_plan_columns, plan_claimed_job
+from output_commit import CommitQueue, MAX_PENDING_COMMITS, JobNotOwned, job_is_owned
+from fair_share import create_fair_share_tables, choose_share, get_share_head, charge_share
+from worker_journal import WorkerJournal
+from db_logging import set_log_journal
+from estimate_feedback import record_estimate_feedback
+from cpu_planner import plan_slots, suggest_slot_count, apply_slot_affinity, format_cpu_list
+from profiling import set_thread_job
+from job_failures import record_job_failure, record_job_attempt
+
+CLAIM_ATTEMPTS = 3           # Claim retries when another worker takes the same job
+POLL_INTERVAL = 10           # Seconds to wait before polling again when the queue is empty
+STALE_WORKER_MINUTES = 15    # Jobs of workers silent for this long are handed to other workers
+ROUTING_WINDOW_PER_WORKER = 2  # Queue-head jobs per active worker considered for speed-based routing
+ENCODE_SLOTS = None          # Concurrent encodes per worker; None lets cpu_planner pick from the core count
+SLOT_ERROR_BACKOFF = 30      # Seconds a slot waits after an unexpected error (e.g. a locked database)
 
 def set_worker_processing_status(workerID):
     """
@@ -71,37 +94,87 @@ def set_worker_connected_status(workerID):
         print("Error in set_worker_connected_status:", e)
         return False
 
-def get_next_pending_job():
+def prepare_claim_schema():
+    """
+    Creates the columns, indexes, triggers and tables the claim path reads (calibration,
+    stream plan, retry and fair-share) and backfills share_key on older rows.
+    Called once when the worker loop starts, so claims only run index seeks.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_calibration_columns(cursor)
+    create_plan_columns(cursor)
+    create_fair_share_tables(cursor)
+    conn.commit()
+    conn.close()
+
+def get_worker_rank(worker_id):
+    """
+    Ranks a worker by throughput_score among the active (Processing, recently checked-in)
+    workers. Uncalibrated workers rank last.
+    
+    Returns (rank, active_count), where rank 0 is the fastest worker.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cutoff = (datetime.datetime.now() - datetime.timedelta(minutes=STALE_WORKER_MINUTES)).strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        SELECT workerID
+        FROM WorkerInfo
+        WHERE (status = 'Processing' AND last_checkin >= ?)
+           OR workerID = ?
+        ORDER BY throughput_score IS NULL, throughput_score DESC, workerID
+    """, (cutoff, worker_id))
+    workers = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return workers.index(worker_id), len(workers)
+
+def get_next_pending_job(worker_id=None):
     """
     Fetches the next pending job from ConversionQueue.
     A pending job is defined as one with job_status 'queued' and a non-null queue_position.
     
+    Jobs are served by priority class first, then weighted fair share across share_key
+    (the storage_location unless the operator set another queue), so one bulk-queued
+    library can't starve the others; see fair_share.choose_share. Within the chosen share
+    jobs are taken in queue_position order. The schema is set up once per worker run
+    (prepare_claim_schema), not here.
+    
+    When a worker_id is given and several workers are active, the head of the queue
+    (ROUTING_WINDOW_PER_WORKER jobs per active worker) is sorted longest/largest first and
+    each worker takes the job matching its calibrated speed rank: the fastest worker gets
+    the biggest job, the slowest the smallest, which keeps the total makespan short.
+    
     Returns:
-        A dictionary with minimal job details (id and file_name) if a pending job exists,
-        otherwise returns None.
+        A dictionary with the job details needed for encoding (id, file_name, file_path,
+        file_size, duration, resolution, video_codec and the stream plan) if a pending job
+        exists, otherwise returns None.
     """
+    rank, active_count = get_worker_rank(worker_id) if worker_id else (0, 1)
+    window = ROUTING_WINDOW_PER_WORKER * active_count if active_count > 1 else 1
+
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, file_name
-        FROM ConversionQueue
-        WHERE job_status = 'queued'
-          AND queue_position IS NOT NULL
-        ORDER BY queue_position ASC
-        LIMIT 1;
-    """)
-    row = cursor.fetchone()
+    share = choose_share(cursor)
+    rows = get_share_head(cursor, share[0], share[1], window) if share else []
     conn.close()
     
-    if row:
-        return {"id": row[0], "file_name": row[1]}
-    else:
+    if not rows:
         return None
 
+    rows.sort(key=lambda r: (r[4] or 0.0, r[3] or 0), reverse=True)
+    row = rows[min(len(rows) - 1, rank * len(rows) // active_count)]
+    return {"id": row[0], "file_name": row[1], "file_path": row[2], "file_size": row[3], "duration": row[4],
+            "resolution": row[5], "video_codec": row[6],
+            "job_type": row[7], "audio_action": row[8], "subtitle_action": row[9], "bit_rate": row[10]}
+
 def assign_job_to_worker(job_id, worker_id):
     """
     Assigns a job to a worker by updating the job_status to 'Processing' and 
     setting the processing_workerID to the worker's UUID.
+    The update only applies while the job is still 'queued', so two workers can never
+    claim the same job. The job's share is charged (fair_share.charge_share) in the same
+    transaction, so a claim can't happen without its charge.
     
     Returns True if the update was successful, False otherwise.
     """
@@ -113,11 +186,16 @@ def assign_job_to_worker(job_id, worker_id):
             SET job_status = 'Processing',
                 processing_workerID = ?
             WHERE id = ?
+              AND job_status = 'queued'
         """, (worker_id, job_id))
+        assigned = cursor.rowcount == 1
+        if assigned:
+            charge_share(cursor, job_id)
         conn.commit()
         conn.close()
-        print(f"Job {job_id} assigned to worker {worker_id}.")
-        return True
+        if assigned:
+            print(f"Job {job_id} assigned to worker {worker_id}.")
+        return assigned
     except Exception as e:
         print(f"Error assigning job {job_id} to worker {worker_id}: {e}")
         return False
@@ -126,11 +204,308 @@ def pick_and_assign_job(worker_id):
     """
     Combines fetching and assignment of a pending job.
     
+    Retries a few times if another worker claimed the job first. A claimed job without a
+    plan yet (job_type NULL) is planned before it is returned (job_planner.plan_claimed_job).
+    
     Returns the job dictionary if a pending job was found and assigned, otherwise None.
     """
-    job = get_next_pending_job()
-    if job:
-        success = assign_job_to_worker(job["id"], worker_id)
-        if success:
-            return job
-    return None
\ No newline at end of file
+    for _ in range(CLAIM_ATTEMPTS):
+        job = get_next_pending_job(worker_id)
+        if not job:
+            return None
+        if assign_job_to_worker(job["id"], worker_id):
+            return plan_claimed_job(job)
+    return None
+
+def complete_verified_job(job_id, worker_id, output_size, verification):
+    """
+    Records the outcome of a finished encode once its output has been verified.
+    Only a passed verification marks the job 'completed' and counts the real
+    space_saved (original_size - output_size); otherwise the job is marked 'failed'
+    and its estimated space_saved is left untouched.
+    Only applies while the job is still 'Processing' on worker_id.
+
+    Returns True if the job was completed, False otherwise.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    if verification.get("passed"):
+        cursor.execute("""
+            UPDATE ConversionQueue
+            SET job_status = 'completed',
+                space_saved = COALESCE(original_size, file_size) - ?,
+                queue_position = NULL,
+                modification_date = CURRENT_TIMESTAMP
+            WHERE id = ? AND job_status = 'Processing' AND processing_workerID = ?
+        """, (output_size, job_id, worker_id))
+    else:
+        cursor.execute("""
+            UPDATE ConversionQueue
+            SET job_status = 'failed',
+                queue_position = NULL,
+                modification_date = CURRENT_TIMESTAMP
+            WHERE id = ? AND job_status = 'Processing' AND processing_workerID = ?
+        """, (job_id, worker_id))
+    updated = cursor.rowcount == 1
+    conn.commit()
+    conn.close()
+    if not updated:
+        print(f"Job {job_id} is no longer held by worker {worker_id}; outcome not recorded.")
+        return False
+    print(f"Job {job_id} {'completed' if verification.get('passed') else 'failed verification'}.")
+    return bool(verification.get("passed"))
+
+def release_job(job_id, worker_id):
+    """
+    Hands a claimed job back to the queue (job_status 'queued', no worker) while keeping its
+    queue_position. Its segment checkpoints are kept so the next worker resumes it.
+    Only applies while the job is still 'Processing' on worker_id.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET job_status = 'queued',
+            processing_workerID = NULL
+        WHERE id = ? AND job_status = 'Processing' AND processing_workerID = ?
+    """, (job_id, worker_id))
+    conn.commit()
+    conn.close()
+    print(f"Job {job_id} released back to the queue.")
+
+def release_worker_jobs(workerID):
+    """
+    Releases every job still assigned to the given worker. Called when a worker starts its
+    loop, so jobs left behind by a crash of this same worker are resumed.
+    A release is not counted as a failed attempt.
+    
+    Returns the number of released jobs.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET job_status = 'queued',
+            processing_workerID = NULL
+        WHERE job_status = 'Processing'
+          AND processing_workerID = ?
+    """, (workerID,))
+    released = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return released
+
+def release_stale_jobs(stale_minutes=STALE_WORKER_MINUTES):
+    """
+    Releases jobs whose worker is no longer processing or has not checked in for
+    stale_minutes, so a different worker can resume them from their checkpoints.
+    Owner and staleness are checked in the UPDATE itself, so a worker that checks in (or
+    finishes the job) in the meantime keeps it. A release is not counted as a failed attempt.
+    
+    Returns the number of released jobs.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cutoff = (datetime.datetime.now() - datetime.timedelta(minutes=stale_minutes)).strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET job_status = 'queued',
+            processing_workerID = NULL
+        WHERE job_status = 'Processing'
+          AND processing_workerID NOT IN (
+              SELECT workerID FROM WorkerInfo
+              WHERE status = 'Processing'
+                AND last_checkin >= ?
+          )
+    """, (cutoff,))
+    released = cursor.rowcount
+    conn.commit()
+    conn.close()
+    if released:
+        logging.info(f"Released {released} jobs from stale workers.")
+    return released
+
+def mark_job_not_worthwhile(job_id, worker_id, result):
+    """
+    Takes a job whose encode was aborted by the projected-savings check out of the queue
+    with job_status 'not_worthwhile'. estimated_size and space_saved hold the projection
+    measured during the encode (a NotWorthwhile exception).
+    Only applies while worker_id still holds the job as 'Processing'; returns False if it
+    was released or reclaimed in the meantime.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE ConversionQueue
+        SET job_status = 'not_worthwhile',
+            queue_position = NULL,
+            estimated_size = ?,
+            space_saved = ?,
+            modification_date = CURRENT_TIMESTAMP
+        WHERE id = ? AND job_status = 'Processing' AND processing_workerID = ?
+    """, (result.projected_size, result.source_size - result.projected_size, job_id, worker_id))
+    updated = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return updated > 0
+
+def run_worker_loop(workerID, stop_event, scratch_dir=SCRATCH_DIR, slots=ENCODE_SLOTS):
+    """
+    Claims and encodes jobs until stop_event is set.
+    The host's cores are partitioned into encode slots (cpu_planner.plan_slots); each slot
+    runs its own claim/encode loop pinned to its cores, with the encoder's thread count
+    matching them, and records its fps in SlotThroughput.
+    Each finished encode is handed to a VerificationPool and the slot moves straight on to
+    the next job. A verified output is then published to the library by a CommitQueue, and
+    only once it has been published is the job completed with its real space_saved.
+    Slots stop claiming while MAX_PENDING_COMMITS outputs wait for upload.
+    Heartbeats, encode progress and log records go to a WorkerJournal and reach the central
+    database in batched syncs, so encoding continues while the central database is busy.
+    A failed encode, verification or upload goes back to the queue with a retry backoff and
+    is quarantined after repeated failures (job_failures.record_job_failure).
+    On a stop request the current jobs are released with their checkpoints intact.
+    Unexpected errors in a slot (e.g. a locked database) are logged, the slot's claimed job
+    is released and the slot carries on after SLOT_ERROR_BACKOFF seconds.
+    """
+    released = release_worker_jobs(workerID)
+    if released:
+        logging.info(f"Worker {workerID} released {released} jobs left over from a previous run.")
+    prepare_claim_schema()
+    # Measure a numeric throughput score the scheduler can route jobs by (once per worker)
+    calibrate_worker(workerID)
+
+    journal = WorkerJournal(workerID)
+    journal.start()
+    set_log_journal(journal)
+    verification_pool = VerificationPool()
+    commit_queue = CommitQueue(worker_id=workerID)
+    slot_plans = plan_slots(slots or suggest_slot_count())
+
+    def on_committed(job, result):
+        def callback(published_path, error):
+            job_id = job["id"]
+            if isinstance(error, InterruptedError):
+                release_job(job_id, workerID)  # Stopped mid-upload; checkpoints are kept for a quick re-mux
+                return
+            if isinstance(error, JobNotOwned):
+                # Reclaimed by another worker, which may be using the shared checkpoints
+                logging.warning(f"Not publishing job {job_id}: {error}", extra={"job_id": job_id})
+                return
+            if error is not None:
+                logging.error(f"Publishing job {job_id} failed: {error}", extra={"job_id": job_id})
+                if record_job_failure(job_id, workerID, error, "publish") == "quarantined":
+                    clear_checkpoints(job_id, scratch_dir)
+                # Otherwise the retry re-muxes from the kept segments (or they belong to the new owner)
+                return
+            output_size = result.get("output_size") or 0
+            if complete_verified_job(job_id, workerID, output_size, result):
+                record_job_attempt(job_id, workerID, "completed")
+                record_estimate_feedback(job_id, output_size, "completed")
+                record_job_throughput(workerID, job["resolution"], job["video_codec"],
+                                      bytes_saved=(job["file_size"] or 0) - output_size)
+                clear_checkpoints(job_id, scratch_dir)
+        return callback
+
+    def on_verified(job, output_path):
+        def callback(result):
+            if not job_is_owned(job["id"], workerID):
+                # Released or reclaimed while verifying; the new owner may be using the shared checkpoints
+                logging.warning(f"Job {job['id']} is no longer held by worker {workerID}; output discarded.",
+                                extra={"job_id": job["id"]})
+            elif result.get("passed"):
+                commit_queue.submit(job, output_path, on_committed(job, result))
+            else:
+                error_class = result.get("error_class", "verification")
+                status = record_job_failure(job["id"], workerID, "; ".join(result.get("details") or []) or "Verification failed",
+                                            error_class)
+                if status == "quarantined" or (status and error_class == "verification"):
+                    # Retried from scratch: the checkpointed segments produced the failing output
+                    clear_checkpoints(job["id"], scratch_dir)
+        return callback
+
+    def run_slot(slot_plan):
+        apply_slot_affinity(slot_plan)
+        cpus = format_cpu_list(slot_plan["cpus"])
+        logging.info(f"Worker {workerID} slot {slot_plan['slot']} on CPUs {cpus} with {slot_plan['threads']} threads.")
+        while not stop_event.is_set():
+            claimed = None  # The job this slot holds until it is handed to verification
+            try:
+                journal.record_heartbeat()
+                release_stale_jobs()
+                if commit_queue.pending_count() >= MAX_PENDING_COMMITS:
+                    stop_event.wait(1)
+                    continue
+
+                job = claimed = pick_and_assign_job(workerID)
+                if not job:
+                    stop_event.wait(POLL_INTERVAL)
+                    continue
+
+                stats = {}
+                set_thread_job(job["id"])
+                try:
+                    settings = get_tuned_settings(job, scratch_dir, stop_event) if job["job_type"] != "remux" else None
+                    if settings is not None:
+                        settings = dict(settings, threads=slot_plan["threads"])
+                    output_path = encode_job(job, workerID, scratch_dir, settings=settings, stop_event=stop_event,
+                                             progress_callback=lambda progress, job_id=job["id"]: journal.record_progress(job_id, progress),
+                                             stats=stats)
+                except EncodeStopped:
+                    release_job(job["id"], workerID)
+                    break
+                except NotWorthwhile as e:
+                    logging.info(f"Job {job['id']} aborted as not worthwhile: {e}", extra={"job_id": job["id"]})
+                    record_job_attempt(job["id"], workerID, "not_worthwhile")
+                    if mark_job_not_worthwhile(job["id"], workerID, e):
+                        record_estimate_feedback(job["id"], e.projected_size, "not_worthwhile", e.encoded_seconds)
+                        clear_checkpoints(job["id"], scratch_dir)
+                    else:
+                        # Released or reclaimed mid-encode; the new owner may be using the shared checkpoints
+                        logging.warning(f"Job {job['id']} is no longer held by worker {workerID}; result discarded.",
+                                        extra={"job_id": job["id"]})
+                    continue
+                except Exception as e:
+                    logging.error(f"Encoding job {job['id']} failed: {e}", extra={"job_id": job["id"]})
+                    if record_job_failure(job["id"], workerID, e) == "quarantined":
+                        clear_checkpoints(job["id"], scratch_dir)
+                    continue
+                finally:
+                    set_thread_job(None)
+
+                verification_pool.submit(job["id"], output_path, on_verified(job, output_path))
+                claimed = None
+                record_job_throughput(workerID, job["resolution"], job["video_codec"], jobs=1,
+                                      media_seconds=stats["media_seconds"], wall_seconds=stats["wall_seconds"])
+                if stats["frames"]:
+                    record_slot_throughput(workerID, slot_plan["slot"], cpus, slot_plan["threads"],
+                                           stats["frames"], stats["wall_seconds"])
+            except Exception as e:
+                # A database error (locked, disk full, ...) must not end the slot thread
+                logging.error(f"Worker {workerID} slot {slot_plan['slot']} error: {e}")
+                if claimed is not None:
+                    try:
+                        release_job(claimed["id"], workerID)  # Checkpoints are kept for a quick resume
+                    except Exception as release_error:
+                        logging.error(f"Could not release job {claimed['id']}: {release_error}",
+                                      extra={"job_id": claimed["id"]})
+                stop_event.wait(SLOT_ERROR_BACKOFF)
+
+    try:
+        slot_threads = [threading.Thread(target=run_slot, args=(slot_plan,), name=f"EncodeSlot-{slot_plan['slot']}", daemon=True)
+                        for slot_plan in slot_plans]
+        for thread in slot_threads:
+            thread.start()
+        for thread in slot_threads:
+            thread.join()
+    finally:
+        verification_pool.shutdown(wait=True)
+        commit_queue.shutdown(wait=not stop_event.is_set())
+        set_log_journal(None)
+        journal.stop()
+
+def start_worker_thread(workerID, scratch_dir=SCRATCH_DIR, slots=ENCODE_SLOTS):
+    """Starts run_worker_loop in a background thread. Returns (thread, stop_event)."""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_worker_loop, args=(workerID, stop_event, scratch_dir, slots), daemon=True)
+    thread.start()
+    return thread, stop_event